@@ -0,0 +1,63 @@
+"""item search indexes
+
+Revision ID: 08b155474b99
+Revises: cf824361ebe8
+Create Date: 2026-10-18 09:21:13.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '08b155474b99'
+down_revision = 'cf824361ebe8'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 10000
+
+SEARCH_VECTOR_TRIGGER = """
+CREATE OR REPLACE FUNCTION items_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW."searchVector" := to_tsvector(
+        'english', coalesce(NEW.title, '') || ' ' || coalesce(NEW.description, '')
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER items_search_vector BEFORE INSERT OR UPDATE OF title, description ON items
+    FOR EACH ROW EXECUTE FUNCTION items_search_vector();
+"""
+
+
+def upgrade():
+    # plain column, adding it doesnt rewrite the table (a generated column would, locking items),
+    # new and changed rows get their vector from a trigger, existing rows are backfilled in batches
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('items', sa.Column('searchVector', postgresql.TSVECTOR(), nullable=True))
+    op.execute(SEARCH_VECTOR_TRIGGER)
+
+    # indexes are built without blocking writes, that cannot happen in a transaction
+    with op.get_context().autocommit_block():
+        max_id = op.get_bind().execute(sa.text('SELECT max(id) FROM items')).scalar() or 0
+        for start in range(0, max_id, BATCH_SIZE):
+            op.execute(
+                'UPDATE items SET "searchVector" = '
+                "to_tsvector('english', coalesce(title, '') || ' ' || coalesce(description, '')) "
+                f'WHERE id > {start} AND id <= {start + BATCH_SIZE} AND "searchVector" IS NULL'
+            )
+        op.create_index('ix_items_description_trgm', 'items', ['description'], unique=False, postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_items_searchVector', 'items', ['searchVector'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_items_title_trgm', 'items', ['title'], unique=False, postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}, postgresql_concurrently=True)
+
+
+def downgrade():
+    # pg_trgm stays, other schemas may use it
+    op.drop_index('ix_items_title_trgm', table_name='items')
+    op.drop_index('ix_items_searchVector', table_name='items')
+    op.drop_index('ix_items_description_trgm', table_name='items')
+    op.execute('DROP TRIGGER IF EXISTS items_search_vector ON items')
+    op.execute('DROP FUNCTION IF EXISTS items_search_vector()')
+    op.drop_column('items', 'searchVector')
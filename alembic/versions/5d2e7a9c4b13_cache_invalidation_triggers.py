@@ -0,0 +1,45 @@
+"""cache invalidation triggers
+
+Revision ID: 5d2e7a9c4b13
+Revises: 08b155474b99
+Create Date: 2026-10-18 11:02:37.518204
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5d2e7a9c4b13'
+down_revision = '08b155474b99'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+CREATE OR REPLACE FUNCTION notify_users_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('users_changed', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER users_changed AFTER UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_users_changed();
+""")
+    op.execute("""
+CREATE OR REPLACE FUNCTION notify_items_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('results_invalidated', 'items');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER items_changed AFTER INSERT OR UPDATE OR DELETE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_items_changed();
+""")
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS items_changed ON items')
+    op.execute('DROP FUNCTION IF EXISTS notify_items_changed()')
+    op.execute('DROP TRIGGER IF EXISTS users_changed ON users')
+    op.execute('DROP FUNCTION IF EXISTS notify_users_changed()')
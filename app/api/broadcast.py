@@ -0,0 +1,164 @@
+"""
+Broadcasting of events to subscriptions
+
+Mutations `publish()` messages (JSON objects) on a channel, every subscriber of that channel
+in every process receives them. Delivery between processes is pluggable (`BroadcastBackend`).
+`LocalBroadcastBackend` delivers within the publishing process only (single worker).
+`PostgresBroadcastBackend` sends Postgres NOTIFY (see `app.db.notify`), the publishing process
+receives its own messages like all others. Messages are lost for processes which are not listening
+(e.g. reconnecting), then subscribers fail and have to resubscribe.
+
+Each process fans out messages to its subscribers through bounded queues of `SUBSCRIPTION_QUEUE_SIZE`.
+A subscriber which is too slow to keep up (e.g. its websocket blocks) fails once its queue is full,
+instead of buffering without bound or slowing down others.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Set
+from sqlalchemy import text  # type: ignore
+from app.config import BROADCAST_BACKEND, SUBSCRIPTION_QUEUE_SIZE
+from app.db.base import engine
+from app.db.notify import listen
+
+_OVERFLOW = object()
+_MISSED = object()
+
+
+class Subscriber:
+    """
+    Queue of messages of one subscription
+
+    Args:
+        size: max number of queued messages
+    """
+
+    def __init__(self, size: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    def put(self, message):
+        """Queue message, on overflow drop queued messages and fail the subscriber"""
+        try:
+            self._queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.fail(_OVERFLOW)
+
+    def fail(self, reason: object):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(reason)
+
+    async def get(self) -> dict:
+        """Next message, raises if messages were dropped"""
+        message = await self._queue.get()
+        if message is _OVERFLOW:
+            raise ValueError(
+                f"Subscription fell behind by more than {self._queue.maxsize} events, resubscribe"
+            )
+        if message is _MISSED:
+            raise ValueError("Events might have been missed, resubscribe")
+        return message
+
+
+class BroadcastBackend:
+    """Delivers published messages to `Broadcaster.deliver()` of all processes"""
+
+    async def publish(self, channel: str, payloads: List[str]):
+        """Send JSON encoded messages on channel"""
+        raise NotImplementedError
+
+    def listen(self, channel: str, broadcaster: "Broadcaster"):
+        """Start delivering messages of channel to broadcaster of this process"""
+        raise NotImplementedError
+
+
+class LocalBroadcastBackend(BroadcastBackend):
+    """Delivers messages within this process"""
+
+    def __init__(self):
+        self._broadcasters: Dict[str, "Broadcaster"] = {}
+
+    async def publish(self, channel: str, payloads: List[str]):
+        broadcaster = self._broadcasters.get(channel)
+        if broadcaster is not None:
+            for payload in payloads:
+                broadcaster.deliver(channel, payload)
+
+    def listen(self, channel: str, broadcaster: "Broadcaster"):
+        self._broadcasters[channel] = broadcaster
+
+
+class PostgresBroadcastBackend(BroadcastBackend):
+    """Delivers messages to all processes with Postgres NOTIFY, payloads must be < 8000 bytes"""
+
+    async def publish(self, channel: str, payloads: List[str]):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._notify, channel, payloads)
+
+    def listen(self, channel: str, broadcaster: "Broadcaster"):
+        loop = asyncio.get_event_loop()
+        listen(
+            channel,
+            lambda payload: loop.call_soon_threadsafe(broadcaster.deliver, channel, payload),
+        )
+
+    @staticmethod
+    def _notify(channel: str, payloads: List[str]):
+        with engine.begin() as conn:
+            conn.execute(
+                text("SELECT pg_notify(:channel, d) FROM unnest(CAST(:payloads AS text[])) d"),
+                {"channel": channel, "payloads": payloads},
+            )
+
+
+class Broadcaster:
+    """
+    Fan-out of published messages to subscribers of this process
+
+    Args:
+        backend: delivery of messages between processes
+        queue_size: max number of queued messages per subscriber
+    """
+
+    def __init__(self, backend: BroadcastBackend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscriber]] = defaultdict(set)
+        self._listening: Set[str] = set()
+
+    async def publish(self, channel: str, messages: List[dict]):
+        """Publish messages on channel to subscribers of all processes"""
+        if len(messages) > 0:
+            payloads = [json.dumps(d, default=str) for d in messages]
+            await self.backend.publish(channel, payloads)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str) -> AsyncIterator[Subscriber]:
+        """Subscriber which receives messages of channel while in this context"""
+        if channel not in self._listening:
+            self.backend.listen(channel, self)
+            self._listening.add(channel)
+        subscriber = Subscriber(size=self.queue_size)
+        self._subscribers[channel].add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            self._subscribers[channel].discard(subscriber)
+
+    def deliver(self, channel: str, payload: Optional[str]):
+        """Put message into queues of subscribers of this process, None if messages were missed"""
+        if payload is None:
+            for subscriber in self._subscribers[channel]:
+                subscriber.fail(_MISSED)
+            return
+        message = json.loads(payload)
+        for subscriber in self._subscribers[channel]:
+            subscriber.put(message)
+
+
+_backends = {"local": LocalBroadcastBackend, "postgres": PostgresBroadcastBackend}
+
+broadcaster = Broadcaster(
+    backend=_backends[BROADCAST_BACKEND](), queue_size=SUBSCRIPTION_QUEUE_SIZE
+)
@@ -0,0 +1,140 @@
+"""
+Request context
+
+One context object is created for every GraphQL request (see `app.main`)
+and passed to all resolvers as `info.context`.
+It carries a database session which is only opened once a resolver needs it,
+the `Auth` of the requesting user which is only resolved once,
+its `Permissions` (see `app.api.policy`) which are computed once from it,
+and the batching loaders of this request.
+The app closes the context (and with it the session) after the response was created.
+
+Resolvers run crud functions with `await info.context.run(crud.some_fun, **kwargs)`.
+With `SQLALCHEMY_ASYNC` the crud function is executed on an async session
+(`AsyncSession.run_sync`), so database IO does not block the event loop
+and a worker can have many requests waiting for the database at once.
+Without it the crud function is just called with the blocking session.
+`info.context.stream(crud.iter_fun, **kwargs)` iterates over the chunks of an `iter_*` crud function,
+each chunk is fetched like a `run()` call, so other resolvers can use the session in between.
+
+The server sets `use_replica` for query operations (see `app.api.server`).
+Then the session is opened on a replica chosen by `app.db.replicas` when it is first needed,
+or on the primary if no replica is fresh enough.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, TypeVar
+from sqlalchemy.orm import Session  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncSession  # type: ignore
+from app.config import SQLALCHEMY_ASYNC
+from app.db.base import SessionFact, AsyncSessionFact
+from app.db.replicas import Replica, replicas
+from app.auth import Auth, username_from_auth_header
+from app.api.loaders import Loaders
+from app.api.policy import Permissions
+import app.db.crud as crud
+
+T = TypeVar("T")
+
+
+class Context:
+    """
+    Request-scoped context
+
+    Args:
+        request: starlette request of this operation
+    """
+
+    def __init__(self, request: Any):
+        self.request = request
+        self.loaders = Loaders(self)
+        self._db: Optional[Session] = None
+        self._async_db: Optional[AsyncSession] = None
+        self._auth: Optional[asyncio.Future] = None
+        self.permissions: Optional[Permissions] = None
+        self.use_replica = False
+        self.replica: Optional[Replica] = None
+        # an async session must not be used concurrently
+        self._async_db_lock = asyncio.Lock()
+
+    @property
+    def db(self) -> Session:
+        """Blocking database session of this request, opened on first access"""
+        if self._db is None:
+            self._choose_replica()
+            self._db = self.replica.SessionFact() if self.replica else SessionFact()
+        return self._db
+
+    @property
+    def async_db(self) -> AsyncSession:
+        """Async database session of this request, opened on first access"""
+        if self._async_db is None:
+            self._choose_replica()
+            self._async_db = (
+                self.replica.AsyncSessionFact() if self.replica else AsyncSessionFact()
+            )
+        return self._async_db
+
+    def _choose_replica(self):
+        if self.use_replica and self.replica is None:
+            self.replica = replicas.choose()
+
+    async def run(self, fn: Callable[..., T], **kwargs) -> T:
+        """Run crud function `fn` with this request's session as `db`"""
+        if SQLALCHEMY_ASYNC:
+            async with self._async_db_lock:
+                return await self.async_db.run_sync(lambda db: fn(db=db, **kwargs))
+        return fn(db=self.db, **kwargs)
+
+    async def stream(
+        self, fn: Callable[..., Iterator[List[T]]], **kwargs
+    ) -> AsyncIterator[List[T]]:
+        """Chunks of crud generator function `fn` with this request's session as `db`"""
+        chunks = await self.run(fn, **kwargs)
+        chunk = None
+        try:
+            while True:
+                chunk = await self.run(lambda db: next(chunks, None))
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            if chunk is not None:
+                # stopped early, close the server-side cursor
+                await self.run(lambda db: chunks.close())
+
+    async def get_auth(self) -> Auth:
+        """Auth of this request, resolved on first call"""
+        if self._auth is None:
+            self._auth = asyncio.ensure_future(self._resolve_auth())
+        return await self._auth
+
+    async def get_permissions(self) -> Permissions:
+        """Permissions of this request, computed on first call"""
+        if self.permissions is None:
+            self.permissions = Permissions.from_auth(await self.get_auth())
+        return self.permissions
+
+    async def _resolve_auth(self) -> Auth:
+        username = username_from_auth_header(self.request.headers.get("Authorization"))
+        if username is None:
+            return Auth(user=None)
+        db_user = await self.run(crud.get_user_by_email, email=username)
+        return Auth(user=db_user)
+
+    async def close(self):
+        """Close database session if it was opened"""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._async_db is not None:
+            await self._async_db.close()
+            self._async_db = None
+
+    async def reset(self):
+        """Close database session and drop loaded objects, for long-lived contexts (subscriptions)"""
+        await self.close()
+        self.loaders = Loaders(self)
+
+    def __repr__(self):
+        replica = self.replica.name if self.replica else None
+        return f"<Context async={SQLALCHEMY_ASYNC} replica={replica}>"
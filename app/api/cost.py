@@ -0,0 +1,160 @@
+"""
+Static query cost and depth analysis
+
+The schema has cycles (`Item.owner` -> `User.items` -> `Item.owner` ...),
+so a single query could fan out into millions of rows.
+After validation every operation is analyzed before it is executed:
+
+- depth is the deepest nesting of fields (root fields have depth 1)
+- every field returning an object costs 1, scalar fields are free
+- the cost of a paginated field (`first` argument) and its selection is multiplied
+  by the page size, other list fields by `COST_LIST_SIZE` (lists inside a
+  connection are already accounted for by the connection's page size),
+  unpaginated lists known to be longer by their size in `LIST_SIZES`
+
+Introspection fields are not counted.
+Variables are coerced before the analysis, invalid variables are rejected as validation errors.
+Operations exceeding `MAX_QUERY_DEPTH` or `MAX_QUERY_COST` are rejected.
+"""
+from typing import Any, Dict, Optional, Tuple
+from graphql import (  # type: ignore
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLObjectType,
+    GraphQLSchema,
+    InlineFragmentNode,
+    OperationType,
+    SelectionSetNode,
+    get_named_type,
+    get_nullable_type,
+    get_operation_ast,
+    is_list_type,
+    is_leaf_type,
+)
+from graphql.execution.values import get_argument_values, get_variable_values  # type: ignore
+from app.config import MAX_QUERY_DEPTH, MAX_QUERY_COST, COST_LIST_SIZE, COST_USER_ITEMS
+from app.api.documents import ValidationErrors
+
+# expected sizes of unpaginated lists by "Type.field", others count COST_LIST_SIZE
+LIST_SIZES: Dict[str, int] = {"User.items": COST_USER_ITEMS}
+
+
+class _Analyzer:
+    def __init__(
+        self,
+        schema: GraphQLSchema,
+        fragments: Dict[str, FragmentDefinitionNode],
+        variables: Dict[str, Any],
+    ):
+        self.schema = schema
+        self.fragments = fragments
+        self.variables = variables
+
+    def selection_set(
+        self, selection_set: SelectionSetNode, parent: GraphQLObjectType, depth: int
+    ) -> Tuple[int, int]:
+        """cost and max depth of a selection set"""
+        cost = 0
+        max_depth = depth - 1
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                field_cost, field_depth = self.field(selection, parent, depth)
+            elif isinstance(selection, InlineFragmentNode):
+                type_ = parent
+                if selection.type_condition is not None:
+                    type_ = self.schema.get_type(selection.type_condition.name.value)
+                field_cost, field_depth = self.selection_set(
+                    selection.selection_set, type_, depth
+                )
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                type_ = self.schema.get_type(fragment.type_condition.name.value)
+                field_cost, field_depth = self.selection_set(
+                    fragment.selection_set, type_, depth
+                )
+            cost += field_cost
+            max_depth = max(max_depth, field_depth)
+        return cost, max_depth
+
+    def field(
+        self, node: FieldNode, parent: GraphQLObjectType, depth: int
+    ) -> Tuple[int, int]:
+        """cost and max depth of a field including its selection"""
+        name = node.name.value
+        if name.startswith("__"):
+            return 0, depth
+        field_def = parent.fields[name]
+        type_ = get_named_type(field_def.type)
+        if is_leaf_type(type_) or node.selection_set is None:
+            return 0, depth
+
+        child_cost, child_depth = self.selection_set(node.selection_set, type_, depth + 1)
+        args = get_argument_values(field_def, node, self.variables)
+        first = args.get("first")
+        if isinstance(first, int) and not isinstance(first, bool):
+            multiplier = max(first, 0)
+        elif first is not None:
+            multiplier = COST_LIST_SIZE
+        elif is_list_type(get_nullable_type(field_def.type)):
+            in_connection = parent.name.endswith("Connection")
+            size = LIST_SIZES.get(f"{parent.name}.{name}", COST_LIST_SIZE)
+            multiplier = 1 if in_connection else size
+        else:
+            multiplier = 1
+        return multiplier * (1 + child_cost), child_depth
+
+
+def analyze(
+    schema: GraphQLSchema,
+    document: DocumentNode,
+    operation_name: Optional[str] = None,
+    variables: Optional[Dict[str, Any]] = None,
+) -> Tuple[int, int]:
+    """Get cost and depth of an operation of a valid document, raise if variables are invalid"""
+    operation = get_operation_ast(document, operation_name)
+    if operation is None:
+        return 0, 0
+    coerced = get_variable_values(schema, operation.variable_definitions, variables or {})
+    if isinstance(coerced, list):
+        raise ValidationErrors(coerced)
+    root = {
+        OperationType.QUERY: schema.query_type,
+        OperationType.MUTATION: schema.mutation_type,
+        OperationType.SUBSCRIPTION: schema.subscription_type,
+    }[operation.operation]
+    fragments = {
+        d.name.value: d
+        for d in document.definitions
+        if isinstance(d, FragmentDefinitionNode)
+    }
+    analyzer = _Analyzer(schema=schema, fragments=fragments, variables=coerced)
+    return analyzer.selection_set(operation.selection_set, root, depth=1)
+
+
+def check_cost(cost: int, depth: int):
+    """Raise if operation is too deep or too expensive"""
+    if depth > MAX_QUERY_DEPTH:
+        raise GraphQLError(
+            f"Query depth {depth} exceeds maximum depth of {MAX_QUERY_DEPTH}",
+            extensions={"code": "QUERY_TOO_DEEP"},
+        )
+    if cost > MAX_QUERY_COST:
+        raise GraphQLError(
+            f"Query cost {cost} exceeds maximum cost of {MAX_QUERY_COST}",
+            extensions={"code": "QUERY_TOO_COSTLY"},
+        )
+
+
+def cost_extension(cost: int, depth: int) -> dict:
+    """Cost info for response extensions"""
+    return {
+        "cost": {
+            "requested": cost,
+            "maximum": MAX_QUERY_COST,
+            "depth": depth,
+            "maximumDepth": MAX_QUERY_DEPTH,
+        }
+    }
@@ -0,0 +1,24 @@
+"""
+Debug endpoints
+
+Served under `/debug/` if `DEBUG_ENDPOINTS` is enabled.
+Each request is answered by one worker process,
+so all statistics are per worker (identified by `pid`).
+"""
+import os
+from starlette.requests import Request  # type: ignore
+from starlette.responses import JSONResponse  # type: ignore
+from app.db.base import engine, async_engine
+from app.db.pool import pool_stats
+from app.db.replicas import replicas
+
+
+async def pool_endpoint(request: Request) -> JSONResponse:
+    """Connection pool statistics of this worker, and health of its replicas"""
+    del request
+    pools = {"sync": pool_stats(engine.pool)}
+    if async_engine is not None:
+        pools["async"] = pool_stats(async_engine.sync_engine.pool)
+    return JSONResponse(
+        {"pid": os.getpid(), "pools": pools, "replicas": replicas.stats()}
+    )
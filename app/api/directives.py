@@ -1,30 +1,74 @@
-"""GraphQL schema directives"""
+"""
+GraphQL schema directives
+
+Role directives guard a field with the request's `Permissions` (see `app.api.policy`).
+The check happens before the field's resolver runs.
+Without the role a nullable field resolves to null, a non-null field raises an error.
+"""
+from inspect import isawaitable
 from typing import Dict, Type
 from ariadne.types import GraphQLResolveInfo  # type: ignore
 from ariadne import SchemaDirectiveVisitor  # type: ignore
-from graphql import default_field_resolver
-from app.db.base import get_db
-from app.auth import Auth
+from graphql import default_field_resolver, is_non_null_type  # type: ignore
+from app.api.policy import ADMIN, OWNER, SUPERUSER
+
 
+class RoleDirective(SchemaDirectiveVisitor):
+    """Resolve a field only if the user has `role`"""
 
-class Superuser(SchemaDirectiveVisitor):
-    """Show a field only if user is superuser"""
+    role = ""
 
     def visit_field_definition(self, field, object_type):
         original_resolver = field.resolve or default_field_resolver
+        role = self.role
+        required = is_non_null_type(field.type)
 
-        def resolve_field(obj, info: GraphQLResolveInfo, **kwargs):
+        def denied():
+            if required:
+                raise ValueError(f"Not logged in as {role}")
+            return None
+
+        async def resolve_after_permissions(obj, info: GraphQLResolveInfo, **kwargs):
+            permissions = await info.context.get_permissions()
+            if not permissions.allows(role, obj):
+                return denied()
             result = original_resolver(obj, info, **kwargs)
+            if isawaitable(result):
+                result = await result
+            return result
 
-            with get_db() as db:
-                auth = Auth.from_info(info=info, db=db)
-                if auth.user is None or not auth.user.isSuperuser:
-                    return None
-                return result
+        def resolve_field(obj, info: GraphQLResolveInfo, **kwargs):
+            permissions = info.context.permissions
+            if permissions is None:
+                return resolve_after_permissions(obj, info, **kwargs)
+            if not permissions.allows(role, obj):
+                return denied()
+            return original_resolver(obj, info, **kwargs)
 
         field.resolve = resolve_field
         return field
 
 
-directives: Dict[str, Type[SchemaDirectiveVisitor]] = {"superuser": Superuser}
+class Superuser(RoleDirective):
+    """Resolve a field only if user is superuser"""
+
+    role = SUPERUSER
+
+
+class Admin(RoleDirective):
+    """Resolve a field only if user is admin"""
+
+    role = ADMIN
+
+
+class Owner(RoleDirective):
+    """Resolve a field only if user owns its object (or is admin)"""
+
+    role = OWNER
+
 
+directives: Dict[str, Type[SchemaDirectiveVisitor]] = {
+    "superuser": Superuser,
+    "admin": Admin,
+    "owner": Owner,
+}
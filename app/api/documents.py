@@ -0,0 +1,134 @@
+"""
+Cache of parsed and validated query documents
+
+Parsing and validating a query string against the schema costs more CPU
+than resolving a small query like `me { name }`.
+So documents are only parsed and validated once per worker
+and then kept in an LRU cache keyed by the sha256 hash of the query string.
+
+The same hash is used for Automatic Persisted Queries:
+clients can send only `extensions.persistedQuery.sha256Hash` instead of the query.
+If the document is not cached (yet) they get a `PersistedQueryNotFound` error
+and send the hash together with the query string once.
+Hits, misses and the number of cached documents are exported as metrics (`cache="documents"`).
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+from graphql import DocumentNode, GraphQLError, GraphQLSchema  # type: ignore
+from ariadne.graphql import parse_query, validate_query  # type: ignore
+from app.api.metrics import CACHE_REQUESTS, CACHE_SIZE
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+PERSISTED_QUERY_VERSIONS = (1,)
+
+
+def persisted_query_hash(data: dict) -> Optional[str]:
+    """sha256 hash of `extensions.persistedQuery`, None if there is none, raise if malformed"""
+    extensions = data.get("extensions")
+    if extensions is None:
+        return None
+    if not isinstance(extensions, dict):
+        raise GraphQLError("extensions must be a JSON object")
+    persisted = extensions.get("persistedQuery")
+    if persisted is None:
+        return None
+    if (
+        not isinstance(persisted, dict)
+        or persisted.get("version") not in PERSISTED_QUERY_VERSIONS
+        or not isinstance(persisted.get("sha256Hash"), str)
+    ):
+        raise GraphQLError(
+            "persistedQuery must be an object with version 1 and a sha256Hash string"
+        )
+    return persisted["sha256Hash"]
+
+
+class DocumentCache:
+    """
+    LRU cache of valid documents
+
+    Args:
+        schema: schema to validate documents against
+        size: max number of cached documents
+        validation_rules: additional validation rules
+        introspection: whether introspection queries are valid
+    """
+
+    def __init__(
+        self,
+        schema: GraphQLSchema,
+        size: int,
+        validation_rules: Optional[Sequence] = None,
+        introspection: bool = True,
+    ):
+        self.schema = schema
+        self.size = size
+        self.validation_rules = validation_rules
+        self.introspection = introspection
+        self._documents: "OrderedDict[str, DocumentNode]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_document(self, data: dict) -> DocumentNode:
+        """Get valid document for request data, raises GraphQLError or ValidationErrors"""
+        query = data.get("query")
+        persisted = persisted_query_hash(data)
+
+        if query is None and persisted is None:
+            raise GraphQLError("The query must be a string.")
+        if query is not None and not isinstance(query, str):
+            raise GraphQLError("The query must be a string.")
+
+        if query is None:
+            key = persisted
+            document = self._get(key)
+            if document is None:
+                raise GraphQLError(
+                    PERSISTED_QUERY_NOT_FOUND,
+                    extensions={"code": "PERSISTED_QUERY_NOT_FOUND"},
+                )
+            return document
+
+        key = hashlib.sha256(query.encode()).hexdigest()
+        if persisted is not None and persisted != key:
+            raise GraphQLError("provided sha does not match query")
+        document = self._get(key)
+        if document is None:
+            document = parse_query(query)
+            errors = validate_query(
+                self.schema,
+                document,
+                self.validation_rules,
+                enable_introspection=self.introspection,
+            )
+            if errors:
+                raise ValidationErrors(errors)
+            self._put(key, document)
+        return document
+
+    def _get(self, key: str) -> Optional[DocumentNode]:
+        with self._lock:
+            document = self._documents.get(key)
+            if document is None:
+                CACHE_REQUESTS.labels("documents", "miss").inc()
+                return None
+            self._documents.move_to_end(key)
+            CACHE_REQUESTS.labels("documents", "hit").inc()
+            return document
+
+    def _put(self, key: str, document: DocumentNode):
+        with self._lock:
+            self._documents[key] = document
+            while len(self._documents) > self.size:
+                self._documents.popitem(last=False)
+            CACHE_SIZE.labels("documents").set(len(self._documents))
+
+
+class ValidationErrors(Exception):
+    """Document is not valid"""
+
+    def __init__(self, errors: List[GraphQLError]):
+        super().__init__(errors)
+        self.errors = errors
+
@@ -0,0 +1,375 @@
+"""
+Incremental delivery with @defer and @stream
+
+graphql-core 3.1 does not execute `@defer` and `@stream`, `IncrementalExecutionContext` does:
+
+- fields of a fragment with `@defer` are not part of the initial result,
+  they are executed concurrently and sent as `{"data", "path", "label"}` once done
+- a list field with `@stream` has only its first `initialCount` items in the initial result,
+  the other items are sent as `{"items", "path", "label"}`
+
+A list can be resolved as `Chunks` (an async iterator of lists, e.g. rows of a server-side cursor).
+Its chunks are only fetched when the previous chunk was sent,
+so the memory of a streamed list does not depend on its length.
+Without `@stream` all chunks are fetched and completed as one list.
+
+Payloads are only sent after the payload containing their parent, errors are per payload.
+Without `incremental` (clients which dont accept multipart responses, batches)
+the directives are ignored and everything is part of the initial result.
+"""
+import asyncio
+import copy
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Tuple
+from graphql import (  # type: ignore
+    ExecutionContext,
+    ExecutionResult,
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLObjectType,
+    OperationType,
+    SelectionSetNode,
+    get_directive_values,
+    located_error,
+)
+from graphql.execution.execute import get_operation_root_type  # type: ignore
+from graphql.pyutils import Path  # type: ignore
+
+_DONE = object()
+
+
+class Chunks:
+    """List value which is fetched in chunks"""
+
+    def __init__(self, chunks: AsyncIterable[list]):
+        self.chunks = chunks
+
+    def __aiter__(self) -> AsyncIterator[list]:
+        return self.chunks.__aiter__()
+
+
+class _Payloads:
+    """Subsequent payloads of an operation, shared by all its execution contexts"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending = 0
+        self.tasks: Set[asyncio.Future] = set()
+
+    async def __aiter__(self) -> AsyncIterator[List[dict]]:
+        """Payloads which are ready to be sent together"""
+        try:
+            while self.pending > 0:
+                entries = [await self.queue.get()]
+                while not self.queue.empty():
+                    entries.append(self.queue.get_nowait())
+                self.pending -= sum(1 for d in entries if d is _DONE)
+                ready = [d for d in entries if d is not _DONE]
+                if ready:
+                    yield [d for _, d in ready]
+                    for exe_context, _ in ready:
+                        exe_context.sent.set()
+        finally:
+            await self.cancel()
+
+    async def cancel(self):
+        """Stop executing payloads which were not sent yet"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class IncrementalExecutionContext(ExecutionContext):
+    """
+    Execution context which defers fragments and streams lists
+
+    Each payload is executed in its own copy of the context (`_child()`),
+    which collects the errors of that payload.
+    """
+
+    incremental = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.payloads = _Payloads()
+        self.sent = asyncio.Event()
+        self._deferred_cache: Dict[Tuple, List[Tuple[Optional[str], SelectionSetNode]]] = {}
+        self._deferred: Optional[List[Tuple[Optional[str], SelectionSetNode]]] = None
+
+    def _child(self) -> "IncrementalExecutionContext":
+        child = copy.copy(self)
+        child.errors = []
+        child.sent = asyncio.Event()
+        child._deferred = None
+        return child
+
+    def _start(self, payloads: AsyncIterator[Tuple["IncrementalExecutionContext", dict]]):
+        """Send payloads after the payload of this context, one at a time"""
+        queue = self.payloads.queue
+        parent_sent = self.sent
+
+        async def send():
+            try:
+                async for exe_context, payload in payloads:
+                    await parent_sent.wait()
+                    queue.put_nowait((exe_context, payload))
+                    await exe_context.sent.wait()
+            finally:
+                await payloads.aclose()
+                queue.put_nowait(_DONE)
+
+        self.payloads.pending += 1
+        self.payloads.tasks.add(asyncio.ensure_future(send()))
+
+    def _payload(self, path: Optional[Path], label: Optional[str], **kwargs) -> dict:
+        payload = {**kwargs, "path": path.as_list() if path else []}
+        if label is not None:
+            payload["label"] = label
+        if self.errors:
+            payload["errors"] = self.errors
+        return payload
+
+    def execute_operation(self, operation, root_value):
+        if operation.operation != OperationType.QUERY:
+            # mutation fields are executed serially, they can not be deferred
+            return super().execute_operation(operation, root_value)
+        self._deferred = [] if self.incremental else None
+        result = super().execute_operation(operation, root_value)
+        deferred, self._deferred = self._deferred or [], None
+        root_type = get_operation_root_type(self.schema, operation)
+        for label, selection_set in deferred:
+            self._defer(root_type, root_value, None, label, selection_set)
+        return result
+
+    def collect_fields(self, runtime_type, selection_set, fields, visited_fragment_names):
+        if self._deferred is not None:
+            selections = [
+                d for d in selection_set.selections if not self._collect_deferred(runtime_type, d)
+            ]
+            if len(selections) < len(selection_set.selections):
+                selection_set = SelectionSetNode(selections=selections)
+        return super().collect_fields(
+            runtime_type, selection_set, fields, visited_fragment_names
+        )
+
+    def _collect_deferred(self, runtime_type: GraphQLObjectType, selection) -> bool:
+        """Whether selection is a deferred fragment, add it to `_deferred` if it applies"""
+        if isinstance(selection, FieldNode):
+            return False
+        defer = get_directive_values(
+            self.schema.get_directive("defer"), selection, self.variable_values
+        )
+        if not defer or not defer["if"] or not self.should_include_node(selection):
+            return False
+        fragment = selection
+        if isinstance(selection, FragmentSpreadNode):
+            fragment = self.fragments.get(selection.name.value)
+        if fragment and self.does_fragment_condition_match(fragment, runtime_type):
+            self._deferred.append((defer.get("label"), fragment.selection_set))
+        return True
+
+    def collect_and_execute_subfields(self, return_type, field_nodes, path, result):
+        key = (return_type, *map(id, field_nodes))
+        if key not in self._deferred_cache:
+            outer, self._deferred = self._deferred, [] if self.incremental else None
+            try:
+                fields = self.collect_subfields(return_type, field_nodes)
+                self._deferred_cache[key] = self._deferred or []
+            finally:
+                self._deferred = outer
+        else:
+            fields = self.collect_subfields(return_type, field_nodes)
+        for label, selection_set in self._deferred_cache[key]:
+            self._defer(return_type, result, path, label, selection_set)
+        return self.execute_fields(return_type, result, path, fields)
+
+    def _defer(
+        self,
+        parent_type: GraphQLObjectType,
+        source: Any,
+        path: Optional[Path],
+        label: Optional[str],
+        selection_set: SelectionSetNode,
+    ):
+        """Execute fields of a deferred fragment as a subsequent payload"""
+        child = self._child()
+
+        async def payloads():
+            child._deferred = []
+            fields = child.collect_fields(parent_type, selection_set, {}, set())
+            deferred, child._deferred = child._deferred, None
+            for nested_label, nested_selection_set in deferred:
+                child._defer(parent_type, source, path, nested_label, nested_selection_set)
+            try:
+                data = child.execute_fields(parent_type, source, path, fields)
+                if child.is_awaitable(data):
+                    data = await data
+            except GraphQLError as error:
+                child.errors.append(error)
+                data = None
+            yield child, child._payload(path, label, data=data)
+
+        self._start(payloads())
+
+    def complete_list_value(self, return_type, field_nodes, info, path, result):
+        stream = None
+        if self.incremental:
+            stream = get_directive_values(
+                self.schema.get_directive("stream"), field_nodes[0], self.variable_values
+            )
+        if stream is not None and not stream["if"]:
+            stream = None
+        if stream is not None and stream["initialCount"] < 0:
+            raise ValueError("initialCount must be a positive integer")
+
+        if isinstance(result, Chunks):
+            return self._complete_chunks(return_type, field_nodes, info, path, result, stream)
+        if stream is None:
+            return super().complete_list_value(return_type, field_nodes, info, path, result)
+
+        items = list(result)
+        count = stream["initialCount"]
+        if len(items) > count:
+            self._stream(
+                return_type, field_nodes, info, path, stream, items[count:], chunks=None
+            )
+        return super().complete_list_value(
+            return_type, field_nodes, info, path, items[:count]
+        )
+
+    async def _complete_chunks(
+        self, return_type, field_nodes, info, path, result: Chunks, stream: Optional[dict]
+    ):
+        """Complete list of chunks, stream chunks after `initialCount` items"""
+        chunks = result.__aiter__()
+        count = stream["initialCount"] if stream is not None else None
+        items: list = []
+        exhausted = False
+        while not exhausted and (count is None or len(items) < count):
+            try:
+                items.extend(await chunks.__anext__())
+            except StopAsyncIteration:
+                exhausted = True
+
+        if count is not None and (not exhausted or len(items) > count):
+            self._stream(
+                return_type, field_nodes, info, path, stream, items[count:], chunks=chunks
+            )
+            items = items[:count]
+        completed = super().complete_list_value(return_type, field_nodes, info, path, items)
+        if self.is_awaitable(completed):
+            completed = await completed
+        return completed
+
+    def _stream(
+        self,
+        return_type,
+        field_nodes: List[FieldNode],
+        info,
+        path: Path,
+        stream: dict,
+        items: list,
+        chunks: Optional[AsyncIterator[list]],
+    ):
+        """Complete list items after the initial ones as subsequent payloads, chunk by chunk"""
+        label = stream.get("label")
+        index = stream["initialCount"]
+
+        async def payloads():
+            nonlocal index, items
+            try:
+                while True:
+                    if items:
+                        child = self._child()
+                        completed = await child._complete_items(
+                            return_type.of_type, field_nodes, info, path, items, index
+                        )
+                        item_path = path.add_key(index, None)
+                        yield child, child._payload(item_path, label, items=completed)
+                        if completed is None:
+                            return
+                        index += len(items)
+                    if chunks is None:
+                        return
+                    try:
+                        items = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    except Exception as raw_error:  # pylint: disable=broad-except
+                        child = self._child()
+                        child.errors.append(located_error(raw_error, field_nodes, path.as_list()))
+                        yield child, child._payload(path.add_key(index, None), label, items=None)
+                        return
+            finally:
+                if chunks is not None:
+                    await chunks.aclose()
+
+        self._start(payloads())
+
+    async def _complete_items(
+        self, item_type, field_nodes, info, path: Path, items: list, start: int
+    ) -> Optional[list]:
+        """Completed items at positions from `start`, None if an error made them null"""
+
+        async def complete(index: int, item: Any) -> Any:
+            item_path = path.add_key(index, None)
+            try:
+                completed = self.complete_value(item_type, field_nodes, info, item_path, item)
+                if self.is_awaitable(completed):
+                    completed = await completed
+                return completed
+            except Exception as raw_error:  # pylint: disable=broad-except
+                error = located_error(raw_error, field_nodes, item_path.as_list())
+                self.handle_field_error(error, item_type)
+                return None
+
+        try:
+            return list(
+                await asyncio.gather(*(complete(i, d) for i, d in enumerate(items, start)))
+            )
+        except GraphQLError as error:
+            self.errors.append(error)
+            return None
+
+
+async def execute_incrementally(
+    schema,
+    document,
+    root_value: Any = None,
+    context_value: Any = None,
+    variable_values: Optional[Dict[str, Any]] = None,
+    operation_name: Optional[str] = None,
+    middleware: Any = None,
+    incremental: bool = False,
+) -> Tuple[ExecutionResult, Optional[AsyncIterator[List[dict]]]]:
+    """
+    Execute operation, get its initial result and subsequent payloads if there are any
+
+    Args:
+        incremental: whether to execute @defer and @stream (otherwise they are ignored)
+    """
+    exe_context = IncrementalExecutionContext.build(
+        schema,
+        document,
+        root_value,
+        context_value,
+        variable_values,
+        operation_name,
+        middleware=middleware,
+    )
+    if isinstance(exe_context, list):
+        return ExecutionResult(data=None, errors=exe_context), None
+
+    exe_context.incremental = incremental
+    try:
+        data = exe_context.execute_operation(exe_context.operation, root_value)
+        if exe_context.is_awaitable(data):
+            data = await data
+        result = exe_context.build_response(data)
+    except BaseException:
+        await exe_context.payloads.cancel()
+        raise
+    exe_context.sent.set()
+    if exe_context.payloads.pending == 0:
+        return result, None
+    return result, exe_context.payloads.__aiter__()
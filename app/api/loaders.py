@@ -0,0 +1,100 @@
+"""
+Request-scoped batching loaders
+
+Resolvers like `Item.owner` are called once per parent object.
+Instead of querying the database for each parent they `load()` a key
+from a loader. All keys collected during one tick of the event loop
+are then fetched together with a single `IN (...)` query.
+
+Results are memoized per loader and a new set of loaders is created
+with every request context (see `app.api.context`),
+so nothing is shared between requests.
+"""
+import asyncio
+from collections import defaultdict
+from inspect import isawaitable
+from typing import Any, Callable, Dict, Hashable, List, Sequence
+import app.db.crud as crud
+import app.db.models as models
+
+
+class DataLoader:
+    """
+    Collect keys during one tick of the event loop and load them in one batch
+
+    Args:
+        batch_load_fn: gets a list of unique keys and returns a list of values
+                       in the same order (can also return an awaitable)
+    """
+
+    def __init__(self, batch_load_fn: Callable[[List[Hashable]], Any]):
+        self.batch_load_fn = batch_load_fn
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        """Get future for value of `key`, schedule batch load if necessary"""
+        if key in self._cache:
+            return self._cache[key]
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._cache[key] = future
+        self._queue.append(key)
+        if len(self._queue) == 1:
+            loop.call_soon(self._dispatch)
+        return future
+
+    def load_many(self, keys: Sequence[Hashable]) -> asyncio.Future:
+        """Get future for list of values of `keys`"""
+        return asyncio.gather(*[self.load(d) for d in keys])
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        asyncio.ensure_future(self._load_batch(keys))
+
+    async def _load_batch(self, keys: List[Hashable]):
+        try:
+            values = self.batch_load_fn(keys)
+            if isawaitable(values):
+                values = await values
+            if len(values) != len(keys):
+                raise ValueError(
+                    f"Loader returned {len(values)} values for {len(keys)} keys"
+                )
+        except Exception as err:  # pylint: disable=broad-except
+            for key in keys:
+                # errors are not memoized, a later load will retry
+                self._cache.pop(key).set_exception(err)
+            return
+
+        for key, value in zip(keys, values):
+            self._cache[key].set_result(value)
+
+
+class Loaders:
+    """
+    All loaders of a single request
+
+    Args:
+        context: request context which provides the database session
+    """
+
+    def __init__(self, context: Any):
+        self._context = context
+        self.user_by_id = DataLoader(self._load_users_by_ids)
+        self.items_by_owner_id = DataLoader(self._load_items_by_owner_ids)
+
+    async def _load_users_by_ids(self, ids: List[int]) -> List[models.User]:
+        db_users = await self._context.run(crud.get_users_by_ids, ids=ids)
+        users = {d.id: d for d in db_users}
+        return [users.get(d) for d in ids]
+
+    async def _load_items_by_owner_ids(
+        self, ownerIds: List[int]
+    ) -> List[List[models.Item]]:
+        db_items = await self._context.run(crud.get_items_by_owner_ids, ownerIds=ownerIds)
+        items = defaultdict(list)
+        for db_item in db_items:
+            items[db_item.ownerId].append(db_item)
+        return [items[d] for d in ownerIds]
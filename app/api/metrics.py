@@ -0,0 +1,187 @@
+"""
+Prometheus metrics
+
+`MetricsExtension` is an Ariadne extension which records for every request
+the operation latency, the latency of each resolved field (fields with own resolvers only),
+errors, and the number and duration of database statements.
+Fields with default resolvers are passed through synchronously, they are not measured.
+Caches report hits, misses and their size (`cache_requests_total`, `cache_entries`).
+Operations are labeled by their root field (or a name of `METRICS_OPERATION_NAMES`, see `operation_label()`).
+Statements are counted with SQLAlchemy engine events (see `app.db.events`)
+and attributed to the request through a context variable.
+
+Under gunicorn, metrics of all workers are aggregated with prometheus_client's
+multiprocess mode (`PROMETHEUS_MULTIPROC_DIR`, set in `app/gunicorn_conf.py`).
+`metrics_endpoint` serves them on `/metrics`.
+"""
+import os
+import time
+from contextvars import ContextVar
+from inspect import isawaitable
+from typing import Any, Awaitable, List, Optional
+from graphql import FieldNode, GraphQLError, OperationDefinitionNode  # type: ignore
+from ariadne.types import ContextValue, Extension, GraphQLResolveInfo, Resolver  # type: ignore
+from ariadne.contrib.tracing.utils import should_trace  # type: ignore
+from prometheus_client import (  # type: ignore
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.requests import Request  # type: ignore
+from starlette.responses import Response  # type: ignore
+from app.config import METRICS_OPERATION_NAMES
+from app.db.events import on_statement
+
+OPERATION_DURATION = Histogram(
+    "graphql_operation_duration_seconds",
+    "Duration of GraphQL operations",
+    ["operation_type", "operation_name"],
+)
+FIELD_DURATION = Histogram(
+    "graphql_field_duration_seconds",
+    "Duration of GraphQL field resolvers",
+    ["parent_type", "field_name"],
+)
+ERRORS = Counter(
+    "graphql_errors_total",
+    "Errors of GraphQL operations",
+    ["operation_type", "operation_name"],
+)
+OPERATION_DB_STATEMENTS = Histogram(
+    "graphql_operation_db_statements",
+    "Number of database statements per GraphQL operation",
+    ["operation_type", "operation_name"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, float("inf")),
+)
+OPERATION_DB_DURATION = Histogram(
+    "graphql_operation_db_duration_seconds",
+    "Time spent on database statements per GraphQL operation",
+    ["operation_type", "operation_name"],
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "Duration of database statements"
+)
+LOGIN_ATTEMPTS = Counter(
+    "login_attempts_total",
+    "Login attempts by rate limit decision (allowed, limited_email, limited_ip)",
+    ["result"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit, miss)",
+    ["cache", "result"],
+)
+CACHE_SIZE = Gauge(
+    "cache_entries",
+    "Number of cached entries, summed over live workers",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+COLD_START = Histogram(
+    "worker_cold_start_seconds",
+    "Time from worker start to its first response",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf")),
+)
+
+
+class _DBStats:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_db_stats: ContextVar[Optional[_DBStats]] = ContextVar("db_stats", default=None)
+
+
+def _record_statement(statement: str, seconds: float):
+    del statement
+    DB_STATEMENT_DURATION.observe(seconds)
+    stats = _db_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.seconds += seconds
+
+
+on_statement(_record_statement)
+
+
+def operation_label(operation: OperationDefinitionNode) -> str:
+    """
+    Label of an operation: its name if it is one of `METRICS_OPERATION_NAMES`,
+    otherwise the name of its root field if it has only one, otherwise "other".
+    Clients choose operation names freely, labels must not grow without bound.
+    """
+    name = operation.name.value if operation.name else ""
+    if name in METRICS_OPERATION_NAMES:
+        return name
+    selections = operation.selection_set.selections
+    if len(selections) == 1 and isinstance(selections[0], FieldNode):
+        return selections[0].name.value
+    return "other"
+
+
+async def _observe_awaitable(result: Awaitable, histogram: Any, start: float) -> Any:
+    try:
+        return await result
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+class MetricsExtension(Extension):
+    """Record latencies, errors and database statements of a request"""
+
+    def __init__(self):
+        self.start = 0.0
+        self.db_stats = _DBStats()
+        self.labels = ("unknown", "")
+        self._token: Any = None
+
+    def request_started(self, context: ContextValue):
+        del context
+        self.start = time.perf_counter()
+        self._token = _db_stats.set(self.db_stats)
+
+    def request_finished(self, context: ContextValue):
+        del context
+        _db_stats.reset(self._token)
+        OPERATION_DURATION.labels(*self.labels).observe(time.perf_counter() - self.start)
+        OPERATION_DB_STATEMENTS.labels(*self.labels).observe(self.db_stats.statements)
+        OPERATION_DB_DURATION.labels(*self.labels).observe(self.db_stats.seconds)
+
+    def resolve(self, next_: Resolver, parent: Any, info: GraphQLResolveInfo, **kwargs):
+        if self.labels[0] == "unknown":
+            self.labels = (info.operation.operation.value, operation_label(info.operation))
+        if not should_trace(info):
+            # default resolvers are not measured, dont turn them into coroutines
+            return next_(parent, info, **kwargs)
+
+        histogram = FIELD_DURATION.labels(info.parent_type.name, info.field_name)
+        start = time.perf_counter()
+        try:
+            result = next_(parent, info, **kwargs)
+        except Exception:
+            histogram.observe(time.perf_counter() - start)
+            raise
+        if isawaitable(result):
+            return _observe_awaitable(result, histogram, start)
+        histogram.observe(time.perf_counter() - start)
+        return result
+
+    def has_errors(self, errors: List[GraphQLError], context: ContextValue):
+        del context
+        ERRORS.labels(*self.labels).inc(len(errors))
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """Metrics of all workers in Prometheus text format"""
+    del request
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -1,46 +1,70 @@
 """
 Mutation resolvers
+
+Mutations with a role directive (`@admin`) are only called if the user has that role.
+Login attempts are rate limited per email and client IP (see `app.ratelimit`).
 """
-from contextlib import contextmanager
-from ariadne import MutationType, ObjectType  # type: ignore
+from ariadne import MutationType  # type: ignore
 from ariadne.types import GraphQLResolveInfo  # type: ignore
-from app.db.base import get_db
-from app.auth import Auth
+from app.config import MAX_BULK_SIZE
 import app.db.crud as crud
-import app.db.models as models
-from app.auth import password_matches, create_access_token, hash_password
+from app.api.results import items_cache, ITEMS_TAG
+from app.api.subscriptions import publish_item_changes, CREATED, UPDATED, DELETED
+from app.api.metrics import LOGIN_ATTEMPTS
+from app.ratelimit import take_login_attempt, return_login_attempt
+from app.auth import (
+    password_matches_async,
+    create_access_token,
+    hash_password_async,
+)
 
 mutation = MutationType()
-me_type = ObjectType("Me")
-item_type = ObjectType("Item")
 
 
-@contextmanager
-def admin_auth(info: GraphQLResolveInfo):
-    with get_db() as db:
-        auth = Auth.from_info(info=info, db=db)
-        if auth.user is None or not auth.user.isAdmin:
-            raise ValueError("Not logged in as admin")
-        yield db
+def invalidate_items():
+    """Invalidate cached item results after items were changed"""
+    items_cache.invalidate(tags=[ITEMS_TAG])
+
+
+def client_ip(info: GraphQLResolveInfo) -> str:
+    """
+    IP of the requesting client
+
+    This is the connection's peer unless uvicorn replaced it with X-Forwarded-For,
+    which it does with `proxy_headers` (on by default) only for proxies in `forwarded_allow_ips`
+    (set to `FORWARDED_ALLOW_IPS` in app/gunicorn_conf.py). Behind an untrusted proxy all clients share its IP.
+    """
+    client = info.context.request.client
+    return client.host if client else "unknown"
+
+
+def validate_bulk_size(inputs: list):
+    """Raise if too many items in one bulk mutation"""
+    if len(inputs) > MAX_BULK_SIZE:
+        raise ValueError(f"At most {MAX_BULK_SIZE} items per mutation")
 
 
 @mutation.field("login")
-def resolve_login(*_, **kwargs):
+async def resolve_login(_, info: GraphQLResolveInfo, **kwargs):
     email = kwargs["input"]["email"]
     password = kwargs["input"]["password"]
-    with get_db() as db:
-        db_user = crud.get_user_by_email(db=db, email=email)
+    limited = take_login_attempt(email=email, ip=client_ip(info))
+    LOGIN_ATTEMPTS.labels(f"limited_{limited}" if limited else "allowed").inc()
+    if limited is not None:
+        raise ValueError("Too many login attempts, try again later")
+    db_user = await info.context.run(crud.get_user_by_email, email=email)
 
-    if db_user is None or not password_matches(
+    if db_user is None or not await password_matches_async(
         plain=password, hashed=db_user.hashedPassword
     ):
         raise ValueError("Email or password wrong")
 
+    return_login_attempt(email=email)
     return {"token": create_access_token(username=db_user.email), "me": db_user}
 
 
 @mutation.field("createMe")
-def resolve_create_me(*_, **kwargs):
+async def resolve_create_me(_, info: GraphQLResolveInfo, **kwargs):
     email = kwargs["input"]["email"]
     password = kwargs["input"]["password"]
 
@@ -50,79 +74,113 @@ def resolve_create_me(*_, **kwargs):
     if len(password) < 4:
         raise ValueError("Password must be at least 4 characters long")
 
-    with get_db() as db:
-        db_user = crud.create_user(
-            db=db, hashedPassword=hash_password(password), **kwargs["input"]
-        )
+    hashed = await hash_password_async(password)
+    db_user = await info.context.run(
+        crud.create_user, hashedPassword=hashed, **kwargs["input"]
+    )
     return {"token": create_access_token(username=db_user.email), "me": db_user}
 
 
 @mutation.field("updateMe")
-def resolve_update_me(_, info: GraphQLResolveInfo, **kwargs):
+async def resolve_update_me(_, info: GraphQLResolveInfo, **kwargs):
     inputs = kwargs.get("input", {})
-    with get_db() as db:
-        auth = Auth.from_info(info=info, db=db)
-        if auth.user is None:
-            raise ValueError("Not logged in")
-        return crud.update_user(
-            db=db,
-            user=auth.user,
-            name=inputs.get("name", crud.Undefined),
-            isActive=inputs.get("isActive", crud.Undefined),
-        )
-
-
-@me_type.field("items")
-def resolve_my_items(parent: models.User, unused, **_):
-    del unused
-    with get_db() as db:
-        return crud.get_items_by_owner_id(db=db, ownerId=parent.id)
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    return await info.context.run(
+        crud.update_user,
+        user=auth.user,
+        name=inputs.get("name", crud.Undefined),
+        isActive=inputs.get("isActive", crud.Undefined),
+    )
 
 
 @mutation.field("createItem")
-def resolve_create_item(_, info: GraphQLResolveInfo, **kwargs):
-    with get_db() as db:
-        auth = Auth.from_info(info=info, db=db)
-        if auth.user is None:
-            raise ValueError("Not logged in")
-        return crud.create_item(db=db, ownerId=auth.user.id, **kwargs["input"])
+async def resolve_create_item(_, info: GraphQLResolveInfo, **kwargs):
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    db_item = await info.context.run(
+        crud.create_item, ownerId=auth.user.id, **kwargs["input"]
+    )
+    invalidate_items()
+    await publish_item_changes(CREATED, db_items=[db_item])
+    return db_item
 
 
 @mutation.field("updateItem")
-def resolve_update_item(_, info: GraphQLResolveInfo, **kwargs):
+async def resolve_update_item(_, info: GraphQLResolveInfo, **kwargs):
     inputs = kwargs.get("input", {})
-    with get_db() as db:
-        auth = Auth.from_info(info=info, db=db)
-        if auth.user is None:
-            raise ValueError("Not logged in")
-        return crud.update_item(
-            db=db,
-            ownerId=auth.user.id,
-            itemId=kwargs["id"],
-            title=inputs.get("title", crud.Undefined),
-            description=inputs.get("description", crud.Undefined),
-            postedOn=inputs.get("postedOn", crud.Undefined),
-        )
-
-
-@item_type.field("owner")
-def resolve_item_owner(parent: models.Item, unused, **_):
-    del unused
-    with get_db() as db:
-        return crud.get_user_by_id(db=db, id=parent.ownerId)
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    db_item = await info.context.run(
+        crud.update_item,
+        ownerId=auth.user.id,
+        itemId=int(kwargs["id"]),
+        title=inputs.get("title", crud.Undefined),
+        description=inputs.get("description", crud.Undefined),
+        postedOn=inputs.get("postedOn", crud.Undefined),
+    )
+    invalidate_items()
+    await publish_item_changes(UPDATED, db_items=[db_item])
+    return db_item
 
 
 @mutation.field("deleteUser")
-def delete_user(_, info: GraphQLResolveInfo, **kwargs):
-    with admin_auth(info) as db:
-        return crud.delete_user(db=db, id=int(kwargs["id"]))
+async def delete_user(_, info: GraphQLResolveInfo, **kwargs):
+    item_ids = await info.context.run(crud.delete_user, id=int(kwargs["id"]))
+    invalidate_items()
+    await publish_item_changes(DELETED, ids=item_ids)
+    return True
 
 
 @mutation.field("deleteItem")
-def delete_item(_, info: GraphQLResolveInfo, **kwargs):
-    with admin_auth(info) as db:
-        return crud.delete_item(db=db, id=int(kwargs["id"]))
-
-
-mutations = (mutation, me_type, item_type)
-
+async def delete_item(_, info: GraphQLResolveInfo, **kwargs):
+    deleted = await info.context.run(crud.delete_item, id=int(kwargs["id"]))
+    invalidate_items()
+    await publish_item_changes(DELETED, ids=[int(kwargs["id"])])
+    return deleted
+
+
+@mutation.field("createItems")
+async def resolve_create_items(_, info: GraphQLResolveInfo, **kwargs):
+    validate_bulk_size(kwargs["input"])
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    db_items = await info.context.run(
+        crud.create_items, ownerId=auth.user.id, items=kwargs["input"]
+    )
+    invalidate_items()
+    await publish_item_changes(CREATED, db_items=db_items)
+    return db_items
+
+
+@mutation.field("updateItems")
+async def resolve_update_items(_, info: GraphQLResolveInfo, **kwargs):
+    validate_bulk_size(kwargs["input"])
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    items = [{**d, "id": int(d["id"])} for d in kwargs["input"]]
+    db_items = await info.context.run(
+        crud.update_items, ownerId=auth.user.id, items=items
+    )
+    invalidate_items()
+    await publish_item_changes(UPDATED, db_items=db_items)
+    return db_items
+
+
+@mutation.field("deleteItems")
+async def delete_items(_, info: GraphQLResolveInfo, **kwargs):
+    validate_bulk_size(kwargs["ids"])
+    deleted = await info.context.run(
+        crud.delete_items, ids=[int(d) for d in kwargs["ids"]]
+    )
+    invalidate_items()
+    await publish_item_changes(DELETED, ids=deleted)
+    return deleted
+
+
+mutations = (mutation,)
@@ -0,0 +1,128 @@
+"""
+Relay-style cursor pagination
+
+Connections are ordered by newest items first (`postedOn`, then `id` descending),
+search results by rank (`rank`, then `id` descending).
+A cursor encodes the sort key of an item, so that the next page
+is a keyset query (`WHERE (postedOn, id) < key`) whose cost does not
+depend on how far the client paged already.
+
+Pages whose edges are streamed (`@stream`) can be larger (`MAX_STREAM_PAGE_SIZE`),
+their edges are fetched in chunks (see `app.api.incremental`).
+"""
+import base64
+import datetime as dt
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+from app.config import MAX_PAGE_SIZE, MAX_STREAM_PAGE_SIZE
+from app.api.incremental import Chunks
+import app.db.models as models
+
+
+def _encode(*values) -> str:
+    raw = "|".join(str(d) for d in values)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode(cursor: str) -> List[str]:
+    return base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+
+
+def encode_cursor(item: models.Item) -> str:
+    """Opaque cursor from item's sort key"""
+    return _encode(item.postedOn.isoformat(), item.id)
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[dt.date, int]]:
+    """Sort key from cursor, None if there is no cursor"""
+    if cursor is None:
+        return None
+    try:
+        posted_on, id_ = _decode(cursor)
+        return dt.date.fromisoformat(posted_on), int(id_)
+    except ValueError as err:
+        raise ValueError(f"Invalid cursor: {cursor}") from err
+
+
+def encode_search_cursor(rank: float, item: models.Item) -> str:
+    """Opaque cursor from search result's sort key"""
+    return _encode(repr(rank), item.id)
+
+
+def decode_search_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Search sort key from cursor, None if there is no cursor"""
+    if cursor is None:
+        return None
+    try:
+        rank, id_ = _decode(cursor)
+        return float(rank), int(id_)
+    except ValueError as err:
+        raise ValueError(f"Invalid cursor: {cursor}") from err
+
+
+def validate_first(first: Optional[int], streamed: bool = False) -> int:
+    """Raise if page size is not allowed"""
+    maximum = MAX_STREAM_PAGE_SIZE if streamed else MAX_PAGE_SIZE
+    if first is None or first < 0 or first > maximum:
+        raise ValueError(f"first must be between 0 and {maximum}")
+    return first
+
+
+def connection(
+    items: List[models.Item], first: int, cursors: Optional[List[str]] = None
+) -> dict:
+    """
+    Create connection from items of a page
+
+    Args:
+        items: items of this page fetched with limit `first + 1`
+        first: page size requested by client
+        cursors: cursors of items, default is `encode_cursor(item)`
+    """
+    if cursors is None:
+        cursors = [encode_cursor(d) for d in items[:first]]
+    edges = [{"cursor": c, "node": d} for c, d in zip(cursors, items[:first])]
+    return {
+        "edges": edges,
+        "pageInfo": {
+            "hasNextPage": len(items) > first,
+            "endCursor": edges[-1]["cursor"] if edges else None,
+        },
+    }
+
+
+def stream_connection(
+    chunks: AsyncIterator[List[models.Item]],
+    first: int,
+    page_keys: Callable[..., Awaitable[List[models.Item]]],
+) -> dict:
+    """
+    Create connection whose edges are fetched in chunks
+
+    Args:
+        chunks: items of this page in chunks, fetched with limit `first`
+        first: page size requested by client
+        page_keys: get items of the same query by `limit` and `offset` (only keys are needed)
+    """
+
+    async def edges():
+        try:
+            async for chunk in chunks:
+                yield [{"cursor": encode_cursor(d), "node": d} for d in chunk]
+        finally:
+            await chunks.aclose()
+
+    async def page_info(*_):
+        # the last item is only known after the last chunk was sent,
+        # so the page's last and the following key are queried separately
+        items = await page_keys(limit=2, offset=max(first - 1, 0))
+        if first == 0:
+            return {"hasNextPage": len(items) > 0, "endCursor": None}
+        if len(items) == 0:
+            # page is not full, its last item is the last one
+            items = (await page_keys(limit=first))[-1:]
+        return {
+            "hasNextPage": len(items) > 1,
+            "endCursor": encode_cursor(items[0]) if items else None,
+        }
+
+    return {"edges": Chunks(edges()), "pageInfo": page_info}
@@ -0,0 +1,64 @@
+"""
+Authorization policy
+
+The permissions of the requesting user are computed once per request from its `Auth`
+(`Context.get_permissions()`) and cached on the context as `Permissions`.
+Role directives (see `app.api.directives`) check them before a field's resolver runs,
+so a denied mutation is never executed, and once they are computed
+a guarded field on many objects (e.g. `isSuperuser` of a list) is checked without awaiting anything.
+
+Roles:
+
+- `superuser`: users with `isSuperuser`
+- `admin`: users who may manage all users and items, for now superusers
+- `owner`: the user owning the object of the field (an `Item`'s owner, the `User` itself), or an admin
+"""
+from typing import Any, FrozenSet, Optional
+from app.auth import Auth
+import app.db.models as models
+
+SUPERUSER = "superuser"
+ADMIN = "admin"
+OWNER = "owner"
+
+
+def owner_id(obj: Any) -> Optional[int]:
+    """Id of the user owning `obj`, None if it has no owner"""
+    if isinstance(obj, models.User):
+        return obj.id
+    return getattr(obj, "ownerId", None)
+
+
+class Permissions:
+    """
+    Permissions of a request
+
+    Args:
+        user_id: id of the authenticated user, None if not authenticated
+        roles: roles of this user
+    """
+
+    def __init__(self, user_id: Optional[int], roles: FrozenSet[str]):
+        self.user_id = user_id
+        self.roles = roles
+
+    @classmethod
+    def from_auth(cls, auth: Auth) -> "Permissions":
+        """Permissions of the user of `auth`"""
+        if auth.user is None:
+            return cls(user_id=None, roles=frozenset())
+        roles = set()
+        if auth.user.isSuperuser:
+            roles.update((SUPERUSER, ADMIN))
+        return cls(user_id=auth.user.id, roles=frozenset(roles))
+
+    def allows(self, role: str, obj: Any = None) -> bool:
+        """Whether the user has `role`, for `owner` on object `obj`"""
+        if role == OWNER:
+            if self.user_id is None:
+                return False
+            return ADMIN in self.roles or owner_id(obj) == self.user_id
+        return role in self.roles
+
+    def __repr__(self):
+        return f"<Permissions user_id={self.user_id} roles={sorted(self.roles)}>"
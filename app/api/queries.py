@@ -1,48 +1,146 @@
 """
 Query resolvers
+
+Item connections whose `edges` are streamed (`@stream`) are fetched from a server-side cursor
+in chunks of `STREAM_CHUNK_SIZE`, they are not cached.
 """
+from functools import partial
 from ariadne import QueryType, ObjectType  # type: ignore
 from ariadne.types import GraphQLResolveInfo  # type: ignore
-from app.db.base import get_db
+from sqlalchemy.orm import load_only  # type: ignore
+from app.config import STREAM_CHUNK_SIZE
 import app.db.models as models
 import app.db.crud as crud
-from app.auth import Auth
+from app.api.pagination import (
+    connection,
+    decode_cursor,
+    decode_search_cursor,
+    encode_search_cursor,
+    stream_connection,
+    validate_first,
+)
+from app.api.selection import is_loaded, is_streamed, load_options, selected_columns
+from app.api.results import items_cache, ITEMS_TAG
 
 query = QueryType()
 me_type = ObjectType("Me")
+user_type = ObjectType("User")
 item_type = ObjectType("Item")
 
 
+def _stream_items(info: GraphQLResolveInfo, iter_fn, get_fn, first: int, **kwargs) -> dict:
+    """Connection of items fetched in chunks with `iter_fn`, `get_fn` gets the page info"""
+    chunks = info.context.stream(
+        iter_fn,
+        limit=first,
+        options=load_options(info, models.Item, path=("edges", "node")),
+        chunk_size=STREAM_CHUNK_SIZE,
+        **kwargs,
+    )
+    keys = partial(info.context.run, get_fn, options=[load_only("id", "postedOn")], **kwargs)
+    return stream_connection(chunks=chunks, first=first, page_keys=keys)
+
+
 @query.field("me")
-def resolve_me(unused, info: GraphQLResolveInfo, **_):
+async def resolve_me(unused, info: GraphQLResolveInfo, **_):
     del unused
 
-    with get_db() as db:
-        auth = Auth.from_info(info=info, db=db)
-        if auth.user is None:
-            raise ValueError("Not logged in")
-        return auth.user
+    auth = await info.context.get_auth()
+    if auth.user is None:
+        raise ValueError("Not logged in")
+    return auth.user
 
 
 @me_type.field("items")
-def resolve_my_items(parent: models.User, unused, **_):
-    del unused
-    with get_db() as db:
-        return crud.get_items_by_owner_id(db=db, ownerId=parent.id)
+async def resolve_my_items(
+    parent: models.User, info: GraphQLResolveInfo, first: int, after=None
+):
+    streamed = is_streamed(info, ("edges",))
+    validate_first(first, streamed=streamed)
+    if streamed:
+        return _stream_items(
+            info,
+            crud.iter_items_by_owner_id,
+            crud.get_items_by_owner_id,
+            first=first,
+            ownerId=parent.id,
+            after=decode_cursor(after),
+        )
+    db_items = await info.context.run(
+        crud.get_items_by_owner_id,
+        ownerId=parent.id,
+        limit=first + 1,
+        after=decode_cursor(after),
+        options=load_options(info, models.Item, path=("edges", "node")),
+    )
+    return connection(items=db_items, first=first)
+
+
+@user_type.field("items")
+async def resolve_user_items(parent: models.User, info: GraphQLResolveInfo, **_):
+    if is_loaded(parent, "items"):
+        return parent.items
+    return await info.context.loaders.items_by_owner_id.load(parent.id)
 
 
 @query.field("items")
-def resolve_items(*_, **kwargs):
-    filters = kwargs.get("filter", {})
-    with get_db() as db:
-        return crud.get_items(db=db, **filters)
+async def resolve_items(_, info: GraphQLResolveInfo, first: int, after=None, **kwargs):
+    streamed = is_streamed(info, ("edges",))
+    validate_first(first, streamed=streamed)
+    filters = {k: v for k, v in (kwargs.get("filter") or {}).items() if v is not None}
+    if streamed:
+        return _stream_items(
+            info,
+            crud.iter_items,
+            crud.get_items,
+            first=first,
+            after=decode_cursor(after),
+            **filters,
+        )
+    columns = selected_columns(info, models.Item, path=("edges", "node"))
+    cache_args = {"filter": filters, "first": first, "after": after, "columns": columns}
+
+    # cached rows only have item columns, relationships are resolved by loaders
+    cache_key = items_cache.key("items", cache_args, tags=[ITEMS_TAG])
+    rows = items_cache.get(cache_key)
+    if rows is not None:
+        return connection(items=[models.Item(**d) for d in rows], first=first)
+
+    db_items = await info.context.run(
+        crud.get_items,
+        limit=first + 1,
+        after=decode_cursor(after),
+        options=load_options(info, models.Item, path=("edges", "node")),
+        **filters,
+    )
+    rows = [{k: getattr(d, k) for k in columns} for d in db_items]
+    items_cache.put(cache_key, rows)
+    return connection(items=db_items, first=first)
+
+
+@query.field("searchItems")
+async def resolve_search_items(
+    _, info: GraphQLResolveInfo, first: int, after=None, **kwargs
+):
+    validate_first(first)
+    results = await info.context.run(
+        crud.search_items,
+        query=kwargs["query"],
+        limit=first + 1,
+        after=decode_search_cursor(after),
+    )
+    return connection(
+        items=[d for d, _ in results],
+        first=first,
+        cursors=[encode_search_cursor(rank=r, item=d) for d, r in results[:first]],
+    )
 
 
 @item_type.field("owner")
-def resolve_item_owner(parent: models.Item, unused, **_):
-    del unused
-    with get_db() as db:
-        return crud.get_user_by_id(db=db, id=parent.ownerId)
+async def resolve_item_owner(parent: models.Item, info: GraphQLResolveInfo, **_):
+    if is_loaded(parent, "owner"):
+        return parent.owner
+    return await info.context.loaders.user_by_id.load(parent.ownerId)
 
 
-queries = (query, me_type, item_type)
+queries = (query, me_type, user_type, item_type)
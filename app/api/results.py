@@ -0,0 +1,180 @@
+"""
+Cache of query results with tag-based invalidation
+
+`Query.items` is the most repeated read. Its rows are cached in a `ResultCache`
+keyed on the normalized arguments and the selected columns.
+Results are tagged (e.g. `items`). Mutations which change tagged data call
+`invalidate()`, which increments the version of these tags.
+Since the version of each tag is part of every key, older results are never hit again
+and are eventually evicted.
+The key is computed once before the result is read (`key()`) and the result is stored under that key.
+So a result read while its tags were invalidated is stored with the old versions and never hit.
+Hits, misses and the number of cached results are exported as Prometheus metrics (`cache="items"`).
+
+The storage is pluggable (`CacheBackend`). `LocalBackend` is an in-process LRU with TTL.
+Its tag versions are kept in sync across processes with Postgres NOTIFY (see `app.db.notify`),
+sent by a trigger on the items table (see `app.db.models`).
+A shared backend (e.g. Redis) would set `shared = True`, all processes then see the same versions.
+Workers start listening before they accept requests (`start()`, see `app.startup`),
+until the listener is established a non-shared cache is cold: nothing is hit or stored.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+from app.config import ITEMS_CACHE_SIZE, ITEMS_CACHE_TTL
+from app.db.notify import is_listening, listen
+from app.api.metrics import CACHE_REQUESTS, CACHE_SIZE
+
+ITEMS_TAG = "items"
+
+
+class CacheBackend:
+    """Storage of a result cache, `shared` if all processes use the same storage"""
+
+    shared = False
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get value or None if missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float):
+        """Set value which expires after `ttl` seconds"""
+        raise NotImplementedError
+
+    def version(self, tag: str) -> int:
+        """Current version of tag"""
+        raise NotImplementedError
+
+    def incr(self, tag: str):
+        """Increment version of tag"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Remove everything"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        """Number of stored values"""
+        raise NotImplementedError
+
+
+class LocalBackend(CacheBackend):
+    """
+    In-process LRU storage with TTL
+
+    Args:
+        size: max number of stored values
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._values: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            self._values.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._values[key] = (time.monotonic() + ttl, value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def version(self, tag: str) -> int:
+        with self._lock:
+            return self._versions.get(tag, 0)
+
+    def incr(self, tag: str):
+        with self._lock:
+            self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            for tag in self._versions:
+                self._versions[tag] += 1
+
+    def count(self) -> int:
+        return len(self._values)
+
+
+class ResultCache:
+    """
+    Cache of results tagged for invalidation
+
+    Args:
+        name: name of the cache in metrics
+        backend: storage of results and tag versions
+        ttl: seconds after which a result expires, 0 disables caching
+        channel: notification channel with invalidated tags for non-shared backends
+    """
+
+    def __init__(self, name: str, backend: CacheBackend, ttl: float, channel: str):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.channel = channel
+        self._listening = False
+
+    def start(self):
+        """Start listening for invalidations of other processes (only for non-shared backends)"""
+        if not self.backend.shared and not self._listening:
+            listen(self.channel, self._on_notify, replay=True)
+            self._listening = True
+
+    @property
+    def ready(self) -> bool:
+        """Whether invalidations of other processes are received"""
+        return self.backend.shared or is_listening(self.channel)
+
+    def key(self, namespace: str, args: dict, tags: Sequence[str]) -> str:
+        """Key of the result for `args` with the current versions of `tags`, get it before reading"""
+        self.start()
+        versions = {d: self.backend.version(d) for d in tags}
+        raw = json.dumps([args, versions], sort_keys=True, default=str)
+        return f"{namespace}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get cached result, None if not cached"""
+        if self.ttl <= 0:
+            return None
+        value = self.backend.get(key) if self.ready else None
+        CACHE_REQUESTS.labels(self.name, "miss" if value is None else "hit").inc()
+        return value
+
+    def put(self, key: str, value: Any):
+        """Cache result under `key` (from before the result was read)"""
+        if self.ttl <= 0 or not self.ready:
+            return
+        self.backend.set(key, value, ttl=self.ttl)
+        CACHE_SIZE.labels(self.name).set(self.backend.count())
+
+    def invalidate(self, tags: Sequence[str]):
+        """Invalidate results with any of `tags`"""
+        for tag in tags:
+            self.backend.incr(tag)
+
+    def _on_notify(self, payload: Optional[str]):
+        if payload is None:
+            self.backend.clear()
+            return
+        for tag in payload.split(","):
+            self.backend.incr(tag)
+
+
+items_cache = ResultCache(
+    name="items",
+    backend=LocalBackend(size=ITEMS_CACHE_SIZE),
+    ttl=ITEMS_CACHE_TTL,
+    channel="results_invalidated",
+)
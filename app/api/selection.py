@@ -0,0 +1,132 @@
+"""
+SQL projections and eager loading from GraphQL selection sets
+
+By default full rows are loaded (including `Item.description` and `User.hashedPassword`)
+and relationships are loaded lazily.
+`load_options` looks at the fields selected below the current field
+and translates them into SQLAlchemy loader options:
+only selected columns are loaded (`load_only`),
+`owner` is joined (`joinedload`) and `items` are loaded with one more statement (`selectinload`).
+
+Resolvers of relationships should first check `is_loaded`
+before falling back to their data loaders.
+Relationships in fragments with `@defer` are not loaded eagerly,
+they are resolved by data loaders after the initial result (only their columns are loaded).
+"""
+from typing import Dict, List, Optional, Sequence
+from graphql import (  # type: ignore
+    FieldNode,
+    FragmentSpreadNode,
+    InlineFragmentNode,
+    get_directive_values,
+)
+from ariadne.types import GraphQLResolveInfo  # type: ignore
+from sqlalchemy import inspect  # type: ignore
+from sqlalchemy.orm import joinedload, load_only, selectinload  # type: ignore
+from sqlalchemy.orm.interfaces import MANYTOONE  # type: ignore
+from app.db import models
+
+# columns which are always needed (cursors, foreign keys for data loaders)
+_REQUIRED_COLUMNS = {
+    models.User: ("id",),
+    models.Item: ("id", "postedOn", "ownerId"),
+}
+
+_Fields = Dict[str, List[FieldNode]]
+
+
+def _has_directive(info: GraphQLResolveInfo, node, name: str) -> bool:
+    values = get_directive_values(info.schema.get_directive(name), node, info.variable_values)
+    return values is not None and values["if"]
+
+
+def _collect(
+    info: GraphQLResolveInfo, selections: Sequence, fields: _Fields, deferred: bool = False
+):
+    for selection in selections:
+        if isinstance(selection, FieldNode):
+            if not deferred or selection.selection_set is None:
+                fields.setdefault(selection.name.value, []).append(selection)
+        elif isinstance(selection, InlineFragmentNode):
+            deferred_ = deferred or _has_directive(info, selection, "defer")
+            _collect(info, selection.selection_set.selections, fields, deferred_)
+        elif isinstance(selection, FragmentSpreadNode):
+            deferred_ = deferred or _has_directive(info, selection, "defer")
+            fragment = info.fragments[selection.name.value]
+            _collect(info, fragment.selection_set.selections, fields, deferred_)
+
+
+def _subfields(info: GraphQLResolveInfo, nodes: List[FieldNode]) -> _Fields:
+    fields: _Fields = {}
+    for node in nodes:
+        if node.selection_set is not None:
+            _collect(info, node.selection_set.selections, fields)
+    return fields
+
+
+def _columns(model, fields: _Fields) -> List[str]:
+    required = _REQUIRED_COLUMNS[model]
+    return [
+        d.key
+        for d in inspect(model).column_attrs
+        if d.key in fields or d.key in required
+    ]
+
+
+def _options(info: GraphQLResolveInfo, model, fields: _Fields, parent=None) -> list:
+    options = []
+    for rel in inspect(model).relationships:
+        if rel.key not in fields:
+            continue
+        target = rel.mapper.class_
+        attr = getattr(model, rel.key)
+        strategy = "joinedload" if rel.direction is MANYTOONE else "selectinload"
+        if parent is None:
+            loader = {"joinedload": joinedload, "selectinload": selectinload}[strategy]
+            loader = loader(attr)
+        else:
+            loader = getattr(parent, strategy)(attr)
+        subfields = _subfields(info, fields[rel.key])
+        options.append(loader.load_only(*_columns(target, subfields)))
+        options.extend(_options(info, target, subfields, parent=loader))
+    return options
+
+
+def _fields_at(info: GraphQLResolveInfo, path: Optional[Sequence[str]]) -> _Fields:
+    nodes = list(info.field_nodes)
+    for name in path or ():
+        nodes = _subfields(info, nodes).get(name, [])
+    return _subfields(info, nodes)
+
+
+def load_options(
+    info: GraphQLResolveInfo, model, path: Optional[Sequence[str]] = None
+) -> list:
+    """
+    Loader options for `model` objects resolved by `path` below the current field
+
+    Args:
+        info: resolve info of the current field
+        model: database model of the objects
+        path: field names from current field to the objects, e.g. `("edges", "node")`
+    """
+    fields = _fields_at(info, path)
+    return [load_only(*_columns(model, fields))] + _options(info, model, fields)
+
+
+def selected_columns(
+    info: GraphQLResolveInfo, model, path: Optional[Sequence[str]] = None
+) -> List[str]:
+    """Columns of `model` objects which are loaded by `load_options()`"""
+    return _columns(model, _fields_at(info, path))
+
+
+def is_streamed(info: GraphQLResolveInfo, path: Sequence[str]) -> bool:
+    """Whether the list field at `path` below the current field has `@stream`"""
+    parent = _fields_at(info, path[:-1])
+    return any(_has_directive(info, d, "stream") for d in parent.get(path[-1], []))
+
+
+def is_loaded(db_obj, key: str) -> bool:
+    """Whether attribute `key` of `db_obj` was already loaded"""
+    return key not in inspect(db_obj).unloaded
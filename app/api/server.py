@@ -0,0 +1,368 @@
+"""
+GraphQL ASGI app
+
+Ariadne's ASGI `GraphQL` app with its own execution of HTTP requests:
+documents come from a `DocumentCache` (also serving Automatic Persisted Queries)
+instead of being parsed and validated for every request,
+and the request context is closed after each request.
+Results are encoded with `JSON_ENCODER`, large ones optionally streamed (see `encoding`).
+Before execution operations are rejected if they are too deep or too costly (see `cost`),
+this includes subscriptions over websockets, whose selection is resolved again for every event.
+
+A request can contain a batch of up to `MAX_BATCH_SIZE` operations (JSON array),
+which are executed concurrently with one context, sharing its session, `Auth` and loaders.
+The response is an array of their results (status 200, errors are per result).
+Operations of a batch must not depend on each other's writes.
+
+Clients which accept `multipart/mixed` get incremental results of operations with `@defer` or `@stream`
+(see `incremental`): the initial result and subsequent payloads are sent as parts of the response
+as soon as they are ready (format of `deferSpec=20220824`).
+The request context is closed when the last part was sent or the client disconnected.
+Batches are never incremental.
+
+With read replicas (`SQLALCHEMY_REPLICA_URIS`) requests with only query operations read from a replica.
+Responses to mutations set the `read_primary` cookie for `REPLICA_MAX_LAG` seconds,
+so the client's next queries read its own writes from the primary.
+"""
+import asyncio
+import math
+from inspect import isawaitable
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from graphql import (  # type: ignore
+    DocumentNode,
+    ExecutionResult,
+    GraphQLError,
+    OperationType,
+    get_operation_ast,
+    subscribe,
+)
+from starlette.requests import Request  # type: ignore
+from starlette.websockets import WebSocket  # type: ignore
+from starlette.responses import PlainTextResponse, Response, StreamingResponse  # type: ignore
+from starlette.types import Receive, Scope, Send  # type: ignore
+from ariadne.asgi import GQL_ERROR, GraphQL  # type: ignore
+from ariadne.exceptions import HttpError  # type: ignore
+from ariadne.extensions import ExtensionManager  # type: ignore
+from ariadne.graphql import (  # type: ignore
+    handle_graphql_errors,
+    handle_query_result,
+    validate_operation_name,
+    validate_variables,
+)
+from ariadne.logger import log_error  # type: ignore
+from ariadne.types import GraphQLResult  # type: ignore
+from app.config import SQLALCHEMY_REPLICA_URIS, REPLICA_MAX_LAG, MAX_BATCH_SIZE
+from app.api.documents import DocumentCache, ValidationErrors
+from app.api.cost import analyze, check_cost, cost_extension
+from app.api.incremental import execute_incrementally
+from app.api.encoding import encoder, json_response
+
+READ_PRIMARY_COOKIE = "read_primary"
+MULTIPART = "multipart/mixed"
+_PART_HEADER = b"\r\n---\r\nContent-Type: application/json; charset=utf-8\r\n\r\n"
+_END = b"\r\n-----\r\n"
+
+
+class OperationBatch:
+    """
+    Operations of a request which share one context
+
+    Each operation reports its type after validation (None if invalid)
+    and waits until all operations of the batch were validated.
+    Only then the context's session is opened (by the first resolver),
+    on a replica only if all operations are queries.
+
+    Args:
+        size: number of operations
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.types: List[Optional[OperationType]] = []
+        self._validated = asyncio.Event()
+
+    async def validated(self, operation_type: Optional[OperationType]):
+        """Report type of a validated operation, wait for all others"""
+        self.types.append(operation_type)
+        if len(self.types) == self.size:
+            self._validated.set()
+        await self._validated.wait()
+
+    @property
+    def has_mutation(self) -> bool:
+        return OperationType.MUTATION in self.types
+
+    @property
+    def only_queries(self) -> bool:
+        return all(d == OperationType.QUERY for d in self.types)
+
+
+class MultipartResponse(StreamingResponse):
+    """
+    Response with a JSON part per payload, sent as soon as they are ready
+
+    Unlike starlette's `StreamingResponse` payloads are produced in the request's task,
+    so that context variables set during execution (extensions) stay valid.
+
+    Args:
+        request: request, to stop once the client disconnected
+        payloads: payloads of the response
+    """
+
+    media_type = f'{MULTIPART}; boundary="-"; deferSpec=20220824'
+
+    def __init__(self, request: Request, payloads: AsyncIterator[dict]):
+        super().__init__(payloads)
+        self.request = request
+
+    @staticmethod
+    def part(payload: dict) -> bytes:
+        return _PART_HEADER + encoder.dumps(payload)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        try:
+            async for payload in self.body_iterator:
+                body = self.part(payload)
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+                if await self.request.is_disconnected():
+                    return
+            await send({"type": "http.response.body", "body": _END, "more_body": False})
+        finally:
+            await self.body_iterator.aclose()
+
+
+class GraphQLApp(GraphQL):
+    """
+    GraphQL app with cached documents and request-scoped context
+
+    Args:
+        schema: executable schema
+        query_cache_size: max number of cached documents per worker
+        kwargs: passed to ariadne's `GraphQL`
+    """
+
+    def __init__(self, schema, *, query_cache_size: int, **kwargs):
+        super().__init__(schema, **kwargs)
+        if callable(self.validation_rules):
+            raise ValueError("Dynamic validation rules can not be cached")
+        self.documents = DocumentCache(
+            schema=schema,
+            size=query_cache_size,
+            validation_rules=self.validation_rules,
+            introspection=self.introspection,
+        )
+
+    async def graphql_http_server(self, request: Request) -> Response:
+        try:
+            data = await self.extract_data_from_request(request)
+        except HttpError as error:
+            return PlainTextResponse(error.message or error.status, status_code=400)
+
+        operations = data if isinstance(data, list) else [data]
+        if not 0 < len(operations) <= MAX_BATCH_SIZE:
+            return PlainTextResponse(
+                f"A batch must have 1 to {MAX_BATCH_SIZE} operations", status_code=400
+            )
+
+        context = await self.get_context_for_request(request)
+        batch = OperationBatch(size=len(operations))
+        if isinstance(data, list):
+            try:
+                results = await asyncio.gather(
+                    *(self.execute_operation(request, d, context, batch) for d in operations)
+                )
+            finally:
+                await context.close()
+            response = json_response([d for _, d in results])
+        else:
+            response = await self.operation_response(request, data, context, batch)
+        if SQLALCHEMY_REPLICA_URIS and batch.has_mutation:
+            response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=math.ceil(REPLICA_MAX_LAG))
+        return response
+
+    async def operation_response(
+        self, request: Request, data: Any, context: Any, batch: OperationBatch
+    ) -> Response:
+        """Response of a single operation, multipart if it has subsequent payloads"""
+        incremental = MULTIPART in request.headers.get("accept", "")
+        results = self.execute_operation_incrementally(
+            request, data, context, batch, incremental=incremental
+        )
+        streaming = False
+        try:
+            success, response = await results.__anext__()
+            if not response.get("hasNext", False):
+                return json_response(response, status_code=200 if success else 400)
+
+            async def payloads():
+                try:
+                    yield response
+                    async for _, payload in results:
+                        yield payload
+                finally:
+                    await results.aclose()
+                    await context.close()
+
+            streaming = True
+            return MultipartResponse(request, payloads())
+        finally:
+            if not streaming:
+                await results.aclose()
+                await context.close()
+
+    def checked_document(self, data: Any) -> Tuple[DocumentNode, int, int]:
+        """Valid document of operation `data` with its cost and depth, raises if it is rejected"""
+        if not isinstance(data, dict):
+            raise GraphQLError("Operation data should be a JSON object")
+        validate_variables(data.get("variables"))
+        validate_operation_name(data.get("operationName"))
+        document = self.documents.get_document(data)
+        cost, depth = analyze(
+            self.schema,
+            document,
+            operation_name=data.get("operationName"),
+            variables=data.get("variables"),
+        )
+        check_cost(cost=cost, depth=depth)
+        return document, cost, depth
+
+    async def start_websocket_subscription(
+        self,
+        data: Any,
+        operation_id: str,
+        websocket: WebSocket,
+        subscriptions: Dict[str, AsyncIterator],
+    ):
+        """Like ariadne's, but with cached documents and the depth and cost checks of queries"""
+        context = await self.get_context_for_request(websocket)
+        try:
+            document, _, _ = self.checked_document(data)
+            root_value: Optional[Any] = self.root_value
+            if callable(root_value):
+                root_value = root_value(context, document)
+                if isawaitable(root_value):
+                    root_value = await root_value
+            result = await subscribe(
+                self.schema,
+                document,
+                root_value=root_value,
+                context_value=context,
+                variable_values=data.get("variables"),
+                operation_name=data.get("operationName"),
+            )
+        except ValidationErrors as error:
+            errors = error.errors
+        except GraphQLError as error:
+            errors = [error]
+        else:
+            if not isinstance(result, ExecutionResult):
+                subscriptions[operation_id] = result
+                asyncio.ensure_future(self.observe_async_results(result, operation_id, websocket))
+                return
+            errors = result.errors
+
+        await context.close()
+        for error in errors:
+            log_error(error, self.logger)
+        payload = self.error_formatter(errors[0], self.debug)
+        await websocket.send_json({"type": GQL_ERROR, "id": operation_id, "payload": payload})
+
+    async def execute_operation(
+        self,
+        request: Request,
+        data: Any,
+        context: Any,
+        batch: Optional[OperationBatch] = None,
+    ) -> GraphQLResult:
+        """Execute a single operation of a request (or of its batch)"""
+        results = self.execute_operation_incrementally(request, data, context, batch)
+        try:
+            return await results.__anext__()
+        finally:
+            await results.aclose()
+
+    async def execute_operation_incrementally(
+        self,
+        request: Request,
+        data: Any,
+        context: Any,
+        batch: Optional[OperationBatch] = None,
+        incremental: bool = False,
+    ) -> AsyncIterator[GraphQLResult]:
+        """Execute an operation, yield its result and with `incremental` its subsequent payloads"""
+        batch = batch or OperationBatch(size=1)
+        extensions = await self.get_extensions_for_request(request, context)
+        middleware = await self.get_middleware_for_request(request, context)
+        extension_manager = ExtensionManager(extensions, context)
+        errors_kwargs = dict(
+            logger=self.logger,
+            error_formatter=self.error_formatter,
+            debug=self.debug,
+            extension_manager=extension_manager,
+        )
+
+        with extension_manager.request():
+            validated = False
+            try:
+                document, cost, depth = self.checked_document(data)
+                operation = get_operation_ast(document, data.get("operationName"))
+                validated = True
+                await batch.validated(operation.operation if operation else None)
+                context.use_replica = (
+                    batch.only_queries and READ_PRIMARY_COOKIE not in request.cookies
+                )
+
+                root_value: Optional[Any] = self.root_value
+                if callable(root_value):
+                    root_value = root_value(context, document)
+                    if isawaitable(root_value):
+                        root_value = await root_value
+
+                result, subsequent = await execute_incrementally(
+                    self.schema,
+                    document,
+                    root_value=root_value,
+                    context_value=context,
+                    variable_values=data.get("variables"),
+                    operation_name=data.get("operationName"),
+                    middleware=extension_manager.as_middleware_manager(middleware),
+                    incremental=incremental,
+                )
+            except ValidationErrors as error:
+                yield handle_graphql_errors(error.errors, **errors_kwargs)
+                return
+            except GraphQLError as error:
+                yield handle_graphql_errors([error], **errors_kwargs)
+                return
+            finally:
+                if not validated:
+                    await batch.validated(None)
+
+            success, response = handle_query_result(result, **errors_kwargs)
+            response.setdefault("extensions", {}).update(cost_extension(cost, depth))
+            if subsequent is None:
+                yield success, response
+                return
+
+            try:
+                yield success, {**response, "hasNext": True}
+                async for payloads in subsequent:
+                    errors = [e for d in payloads for e in d.get("errors", ())]
+                    if errors:
+                        extension_manager.has_errors(errors)
+                    for payload in payloads:
+                        if "errors" in payload:
+                            payload["errors"] = [
+                                self.error_formatter(e, self.debug) for e in payload["errors"]
+                            ]
+                    yield True, {"incremental": payloads, "hasNext": True}
+                yield True, {"hasNext": False}
+            finally:
+                await subsequent.aclose()
@@ -0,0 +1,123 @@
+"""
+Subscription resolvers
+
+`itemChanged` sends an `ItemChange` whenever an item was created, updated or deleted.
+Item mutations publish their changes with `publish_item_changes()` (see `app.api.broadcast`).
+Messages carry the item's columns, so subscribers dont query the database for them
+(only items too large for a notification are loaded again by each subscriber).
+
+Filters are matched on the server like `Query.items` filters (`ILIKE '%x%'`),
+created and updated items by their new values.
+Deleted items are sent to all subscribers, their values are not known anymore.
+
+A subscription keeps its request context until it ends.
+After each event its database session is closed and its loaders are reset (`Context.reset()`),
+so that idle subscriptions dont hold connections and dont see stale objects.
+"""
+import datetime as dt
+import json
+import logging
+import re
+from typing import Optional, Sequence
+from ariadne import SubscriptionType  # type: ignore
+from ariadne.types import GraphQLResolveInfo  # type: ignore
+import app.db.models as models
+import app.db.crud as crud
+from app.api.broadcast import broadcaster
+
+ITEMS_CHANNEL = "item_changes"
+CREATED = "CREATED"
+UPDATED = "UPDATED"
+DELETED = "DELETED"
+
+_ITEM_COLUMNS = ("id", "title", "description", "postedOn", "ownerId")
+_MAX_PAYLOAD_BYTES = 7900  # postgres NOTIFY payloads must be shorter than 8000 bytes
+
+_log = logging.getLogger(__name__)
+
+subscription = SubscriptionType()
+
+
+def ilike(value: Optional[str], pattern: str) -> bool:
+    """Whether `value ILIKE '%pattern%'` (as in `crud.get_items`)"""
+    if value is None:
+        return False
+    regex = []
+    chars = iter(pattern)
+    for char in chars:
+        if char == "\\":
+            regex.append(re.escape(next(chars, "\\")))
+        elif char == "%":
+            regex.append(".*")
+        elif char == "_":
+            regex.append(".")
+        else:
+            regex.append(re.escape(char))
+    return re.search("".join(regex), value, re.IGNORECASE | re.DOTALL) is not None
+
+
+def _matches(item: models.Item, filters: dict) -> bool:
+    if "titleLike" in filters and not ilike(item.title, filters["titleLike"]):
+        return False
+    if "descriptionLike" in filters and not ilike(item.description, filters["descriptionLike"]):
+        return False
+    return True
+
+
+def _message(action: str, id: int, db_item: Optional[models.Item] = None) -> dict:
+    message = {"action": action, "id": id, "item": None}
+    if db_item is not None:
+        row = {k: getattr(db_item, k) for k in _ITEM_COLUMNS}
+        row["postedOn"] = row["postedOn"].isoformat()
+        if len(json.dumps({**message, "item": row}).encode()) < _MAX_PAYLOAD_BYTES:
+            message["item"] = row
+    return message
+
+
+async def publish_item_changes(
+    action: str, db_items: Sequence[models.Item] = (), ids: Sequence[int] = ()
+):
+    """Publish created, updated (`db_items`) or deleted (`ids`) items to subscriptions"""
+    messages = [_message(action, id=d.id, db_item=d) for d in db_items]
+    messages.extend(_message(action, id=d) for d in ids)
+    try:
+        await broadcaster.publish(ITEMS_CHANNEL, messages)
+    except Exception:  # pylint: disable=broad-except
+        # the change was already committed, only subscribers miss it
+        _log.exception("Publishing %s item changes failed", len(messages))
+
+
+async def _item(info: GraphQLResolveInfo, message: dict) -> Optional[models.Item]:
+    """Item of a message, loaded if it was too large, None if deleted"""
+    row = message["item"]
+    if row is not None:
+        return models.Item(**{**row, "postedOn": dt.date.fromisoformat(row["postedOn"])})
+    if message["action"] == DELETED:
+        return None
+    return await info.context.run(crud.get_item_by_id, id=message["id"])
+
+
+@subscription.source("itemChanged")
+async def generate_item_changes(_, info: GraphQLResolveInfo, **kwargs):
+    filters = {k: v for k, v in (kwargs.get("filter") or {}).items() if v is not None}
+    try:
+        async with broadcaster.subscribe(ITEMS_CHANNEL) as subscriber:
+            while True:
+                message = await subscriber.get()
+                db_item = await _item(info, message)
+                if message["action"] == DELETED or (
+                    db_item is not None and _matches(db_item, filters)
+                ):
+                    yield {"action": message["action"], "id": message["id"], "item": db_item}
+                await info.context.reset()
+    finally:
+        await info.context.close()
+
+
+@subscription.field("itemChanged")
+def resolve_item_changed(change: dict, info: GraphQLResolveInfo, **_):
+    del info
+    return change
+
+
+subscriptions = (subscription,)
@@ -0,0 +1,168 @@
+"""
+SQL trace and N+1 detection
+
+In debug mode `SQLTraceExtension` captures every SQL statement of an operation
+with its duration and the path of the resolver which executed it
+(for batched loaders the path of the first resolver waiting for the batch).
+Statements are grouped by shape (parameter lists of `IN` collapsed).
+If a shape is executed more than `SQL_TRACE_MAX_REPEATS` times, the operation
+probably resolves something per item (N+1). This is logged as a warning,
+with `SQL_TRACE_FAIL` the resolver which executed the statement fails instead.
+The trace is returned in the response `extensions` as `sqlTrace`.
+
+Debug mode is on for all requests with `SQL_TRACE`, or per request with
+the `X-SQL-Trace` header, which is only honored if `DEBUG_ENDPOINTS` were explicitly enabled
+(off by default, the trace exposes statements to any client).
+The extension is only added to requests in debug mode (`extensions_for_request()`),
+other requests dont pay for it.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from inspect import isawaitable
+from typing import Any, Awaitable, Dict, List, Optional
+from graphql import GraphQLError  # type: ignore
+from ariadne.types import ContextValue, Extension, GraphQLResolveInfo, Resolver  # type: ignore
+from ariadne.contrib.tracing.utils import format_path  # type: ignore
+from app.config import DEBUG_ENDPOINTS, SQL_TRACE, SQL_TRACE_MAX_REPEATS, SQL_TRACE_FAIL
+from app.db.events import on_statement
+
+TRACE_HEADER = "X-SQL-Trace"
+
+_log = logging.getLogger(__name__)
+
+_IN_PARAMS = re.compile(r"\(%\(\w+\)s(?:, %\(\w+\)s)*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement without varying parts, e.g. number of `IN` parameters"""
+    return _IN_PARAMS.sub("(...)", " ".join(statement.split()))
+
+
+class SQLTrace:
+    """Statements of an operation"""
+
+    def __init__(self, max_repeats: int):
+        self.max_repeats = max_repeats
+        self.start = time.perf_counter()
+        self.statements: List[Dict[str, Any]] = []
+        self.shapes: Counter = Counter()
+        self.repeated: List[str] = []
+        self.unreported: List[str] = []
+
+    def add(self, statement: str, seconds: float, path: str):
+        shape = statement_shape(statement)
+        self.statements.append(
+            {
+                "sql": shape,
+                "path": path,
+                "startMs": round((time.perf_counter() - seconds - self.start) * 1000, 3),
+                "durationMs": round(seconds * 1000, 3),
+            }
+        )
+        self.shapes[shape] += 1
+        if self.shapes[shape] == self.max_repeats + 1:
+            self.repeated.append(shape)
+            self.unreported.append(shape)
+
+    def format(self) -> dict:
+        return {
+            "count": len(self.statements),
+            "durationMs": round(sum(d["durationMs"] for d in self.statements), 3),
+            "statements": self.statements,
+            "repeated": [{"sql": d, "count": self.shapes[d]} for d in self.repeated],
+        }
+
+
+_trace: ContextVar[Optional[SQLTrace]] = ContextVar("sql_trace", default=None)
+_path: ContextVar[str] = ContextVar("resolver_path", default="")
+
+
+def _record_statement(statement: str, seconds: float):
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(statement=statement, seconds=seconds, path=_path.get())
+
+
+on_statement(_record_statement)
+
+
+class SQLTraceExtension(Extension):
+    """Trace SQL statements of a request in debug mode"""
+
+    def __init__(self):
+        self.trace: Optional[SQLTrace] = None
+        self._token: Any = None
+
+    def request_started(self, context: ContextValue):
+        if trace_requested(context.request):
+            self.trace = SQLTrace(max_repeats=SQL_TRACE_MAX_REPEATS)
+            self._token = _trace.set(self.trace)
+
+    def request_finished(self, context: ContextValue):
+        del context
+        if self.trace is None:
+            return
+        _trace.reset(self._token)
+        for shape in self.trace.repeated:
+            _log.warning(
+                "Possible N+1: statement executed %s times: %s",
+                self.trace.shapes[shape],
+                shape,
+            )
+
+    def resolve(self, next_: Resolver, parent: Any, info: GraphQLResolveInfo, **kwargs):
+        if self.trace is None:
+            return next_(parent, info, **kwargs)
+
+        path = ".".join(str(d) for d in format_path(info.path))
+        token = _path.set(path)
+        try:
+            result = next_(parent, info, **kwargs)
+        finally:
+            _path.reset(token)
+        if isawaitable(result):
+            return self._resolve_awaitable(result, path)
+        self._check_repeats()
+        return result
+
+    async def _resolve_awaitable(self, result: Awaitable, path: str) -> Any:
+        # the resolver's coroutine only runs now, with the path set again
+        token = _path.set(path)
+        try:
+            result = await result
+        finally:
+            _path.reset(token)
+        self._check_repeats()
+        return result
+
+    def _check_repeats(self):
+        if SQL_TRACE_FAIL and self.trace is not None and self.trace.unreported:
+            shape = self.trace.unreported.pop(0)
+            raise GraphQLError(
+                f"Statement executed more than {SQL_TRACE_MAX_REPEATS} times: {shape}"
+            )
+
+    def format(self, context: ContextValue) -> Optional[dict]:
+        del context
+        if self.trace is None:
+            return None
+        return {"sqlTrace": self.trace.format()}
+
+
+def trace_requested(request: Any) -> bool:
+    """Whether statements of this request are traced (the header only with `DEBUG_ENDPOINTS`)"""
+    return SQL_TRACE or (DEBUG_ENDPOINTS and TRACE_HEADER in request.headers)
+
+
+def extensions_for_request(extensions: List[type]) -> Any:
+    """Extensions getter which adds `SQLTraceExtension` to `extensions` if requested"""
+    traced = [*extensions, SQLTraceExtension]
+
+    def get_extensions(request: Any, context: Any) -> List[type]:
+        del context
+        return traced if trace_requested(request) else extensions
+
+    return get_extensions
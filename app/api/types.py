@@ -7,7 +7,7 @@ date_scalar = ScalarType("Date")
 
 @date_scalar.serializer
 def serialize_datetime(d: dt.date) -> str:
-    return d.strftime("%Y-%m-%d")
+    return d.isoformat()  # YYYY-MM-DD, much faster than strftime
 
 
 @date_scalar.value_parser
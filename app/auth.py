@@ -6,20 +6,34 @@ As auth method I'm validating JWTs which can be provided to the
 user via some login endpoint.
 JWT carries a username and a scope.
 
+Hashing and verifying passwords with bcrypt is deliberately slow (CPU bound).
+In resolvers use the async variants which run in a process pool,
+so that other requests on this worker are not blocked meanwhile.
+The number of waiting hash jobs is bounded, further ones are rejected.
+The pool's processes are started by a forkserver, not forked from the worker,
+which already runs threads (e.g. the LISTEN connection) whose locks a fork could copy while held.
+Starting the forkserver imports the app again, so workers start the pool before accepting requests.
+
 Unfortunately starlette makes it hard to add custom objects
 to the request, that's why I have to construct some
 work-around classes.
 """
+import asyncio
 import logging
-from typing import Union
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Union
 import datetime as dt
 from passlib.context import CryptContext  # type: ignore
 from jose import JWTError, jwt  # type: ignore
-from ariadne.types import GraphQLResolveInfo  # type: ignore
-from sqlalchemy.orm import Session  # type: ignore
-from app.config import AUTH_SECRET_KEY, AUTH_ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from app.db.base import get_db
-import app.db.crud as crud
+from app.config import (
+    AUTH_SECRET_KEY,
+    AUTH_ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    HASH_POOL_WORKERS,
+    HASH_POOL_MAX_PENDING,
+)
 import app.db.models as models
 
 
@@ -37,6 +51,49 @@ def password_matches(plain, hashed) -> bool:
     return _crpt_context.verify(plain, hashed)
 
 
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pending = 0
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool  # pylint: disable=global-statement
+    if _hash_pool is None:
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        _hash_pool = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS, mp_context=context)
+    return _hash_pool
+
+
+async def start_hash_pool():
+    """Start the hash pool's forkserver and a first process, so that the first login doesnt wait"""
+    if HASH_POOL_WORKERS < 1:
+        return
+    await asyncio.get_event_loop().run_in_executor(_get_hash_pool(), os.getpid)
+
+
+async def _run_hash_job(fn: Callable[..., Any], *args) -> Any:
+    global _hash_pending  # pylint: disable=global-statement
+    if HASH_POOL_WORKERS < 1:
+        return fn(*args)
+    if _hash_pending >= HASH_POOL_MAX_PENDING:
+        raise ValueError("Too many login attempts at the moment, try again later")
+    _hash_pending += 1
+    try:
+        return await asyncio.get_event_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _hash_pending -= 1
+
+
+async def hash_password_async(plain: str) -> str:
+    """get password hash without blocking the event loop"""
+    return await _run_hash_job(hash_password, plain)
+
+
+async def password_matches_async(plain, hashed) -> bool:
+    """password_matches without blocking the event loop"""
+    return await _run_hash_job(password_matches, plain, hashed)
+
+
 def create_access_token(username: str) -> str:
     """Create JWT with username as sub"""
     scopes = ["user:authenticated"]
@@ -60,56 +117,40 @@ def validate_access_token(token: str) -> str:
     return username
 
 
+def username_from_auth_header(auth: Union[str, None]) -> Union[str, None]:
+    """Get username from a Bearer Authorization header, None if not valid"""
+    if auth is None:
+        return None
+    try:
+        scheme, credentials = auth.split()
+        if scheme.lower() == "bearer":
+            try:
+                return validate_access_token(token=credentials)
+            except ValueError:
+                return None
+        else:
+            _log.info("Authorization header existed but no Bearer was found")
+            return None
+    except ValueError:
+        _log.info("Authorization header existed but no scheme was found")
+        return None
+
+
 class Auth:
     """
-    Auth object to be passed over by the AuthBackend middleware.
-    
-    I need a separate object for this because if the AuthBackend
-    returns `None` it will be converted to an (incompatible)
-    `UnauthenticatedUser` object. Using this object basically as
-    a container i.e. to also transport a `None`.
+    Auth object of a request, created once per request by `app.api.context.Context`.
+
+    Using this object basically as a container i.e. to also transport a `None`
+    if the request is not authenticated.
 
     Args:
         user: db user obj of an authenticated user
     """
 
-    def _user_from_auth(
-        self, db: Session, auth: Union[str, None]
-    ) -> Union[None, models.User]:
-        if auth is None:
-            return None
-        try:
-            scheme, credentials = auth.split()
-            if scheme.lower() == "bearer":
-                try:
-                    username = validate_access_token(token=credentials)
-                except ValueError:
-                    return None
-            else:
-                _log.info("Authorization header existed but no Bearer was found")
-                return None
-        except ValueError:
-            _log.info("Authorization header existed but no scheme was found")
-            return None
-
-        with get_db() as db:
-            db_user = crud.get_user_by_email(db=db, email=username)
-        return db_user
-
-    def __init__(self, db: Session, auth: str):
-        user = self._user_from_auth(db=db, auth=auth)
+    def __init__(self, user: Union[models.User, None]):
         self.is_authenticated = False if user is None else True
         self.user = user
 
-    @classmethod
-    def from_info(self, info: GraphQLResolveInfo, db: Session) -> "Auth":
-        """Init from a GraphQLResolveInfo"""
-        context = info.context
-        headers = context["request"].headers
-        context["auth"] = self(db=db, auth=headers.get("Authorization"))
-        return info.context["auth"]
-
     def __repr__(self):
         user = "" if self.user is None else self.user.email
         return f"<Auth authenticated={self.is_authenticated} {user}>"
-
@@ -1,6 +1,8 @@
 """Global config: default config -> environment vars"""
 import os
 import logging
+import multiprocessing
+import tempfile
 
 # app
 HOST = os.environ.get("HOST", "0.0.0.0")
@@ -10,11 +12,138 @@ SQLALCHEMY_DATABASE_URI = os.environ.get(
     "SQLALCHEMY_DATABASE_URI", "postgresql://postgres@localhost/main"
 )
 
+# gunicorn workers: WEB_CONCURRENCY or WORKERS_PER_CORE * cores (at least 2, at most MAX_WORKERS)
+WORKERS_PER_CORE = float(os.environ.get("WORKERS_PER_CORE", "1"))
+MAX_WORKERS = int(os.environ["MAX_WORKERS"]) if os.environ.get("MAX_WORKERS") else None
+if os.environ.get("WEB_CONCURRENCY"):
+    WORKERS = int(os.environ["WEB_CONCURRENCY"])
+    assert WORKERS > 0
+else:
+    WORKERS = max(int(WORKERS_PER_CORE * multiprocessing.cpu_count()), 2)
+    if MAX_WORKERS:
+        WORKERS = min(WORKERS, MAX_WORKERS)
+
+# async database access (asyncpg), URI defaults to SQLALCHEMY_DATABASE_URI
+SQLALCHEMY_ASYNC = os.environ.get("SQLALCHEMY_ASYNC", "false").lower() == "true"
+SQLALCHEMY_ASYNC_DATABASE_URI = os.environ.get(
+    "SQLALCHEMY_ASYNC_DATABASE_URI",
+    SQLALCHEMY_DATABASE_URI.replace("postgresql://", "postgresql+asyncpg://", 1),
+)
+
+# connection pool per worker, DB_CONNECTION_BUDGET is divided over all workers
+# (each worker needs 1 more connection for LISTEN), keep it below postgres max_connections
+# with SQLALCHEMY_ASYNC requests use the async pool, the sync pool only sends notifications,
+# it is capped at DB_SYNC_POOL_SIZE connections (without overflow), the async pool gets the rest
+DB_CONNECTION_BUDGET = int(os.environ.get("DB_CONNECTION_BUDGET", "90"))
+DB_SYNC_POOL_SIZE = int(os.environ.get("DB_SYNC_POOL_SIZE", "1"))
+_reserved_connections = 1 + (DB_SYNC_POOL_SIZE if SQLALCHEMY_ASYNC else 0)
+_worker_connections = max(DB_CONNECTION_BUDGET // WORKERS - _reserved_connections, 1)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", str(min(5, _worker_connections))))
+DB_MAX_OVERFLOW = int(
+    os.environ.get("DB_MAX_OVERFLOW", str(max(_worker_connections - DB_POOL_SIZE, 0)))
+)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+
+# connections each worker opens per pool at startup, before it accepts requests (at most DB_POOL_SIZE)
+DB_POOL_WARM = int(os.environ.get("DB_POOL_WARM", str(DB_POOL_SIZE)))
+
+# gunicorn builds the app (schema, engines) once in the master, workers share it copy-on-write
+PRELOAD_APP = os.environ.get("PRELOAD_APP", "true").lower() == "true"
+
+# debug endpoints like /debug/pool and the X-SQL-Trace header, only enable for tests and benchmarks
+DEBUG_ENDPOINTS = os.environ.get("DEBUG_ENDPOINTS", "false").lower() == "true"
+
+# trace SQL statements of all operations, warn (or fail) if a statement repeats too often
+# (with DEBUG_ENDPOINTS also per request with header X-SQL-Trace)
+SQL_TRACE = os.environ.get("SQL_TRACE", "false").lower() == "true"
+SQL_TRACE_MAX_REPEATS = int(os.environ.get("SQL_TRACE_MAX_REPEATS", "10"))
+SQL_TRACE_FAIL = os.environ.get("SQL_TRACE_FAIL", "false").lower() == "true"
+
+# read replicas for query operations (comma separated URIs, each with its own pools)
+# a replica is only used while its replication lag is at most REPLICA_MAX_LAG seconds,
+# clients read from the primary for REPLICA_MAX_LAG seconds after their own mutations
+SQLALCHEMY_REPLICA_URIS = [
+    d.strip() for d in os.environ.get("SQLALCHEMY_REPLICA_URIS", "").split(",") if d.strip()
+]
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", "1"))
+
+# operation names used as metric labels, other operations are labeled by their root field
+METRICS_OPERATION_NAMES = {
+    d.strip() for d in os.environ.get("METRICS_OPERATION_NAMES", "").split(",") if d.strip()
+}
+
+# max number of parsed and validated query documents cached per worker
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "1000"))
+
+# max number of operations in a batch (JSON array of operations in one request)
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10"))
+
+# max page size of connections (first: Int)
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "100"))
+
+# max page size of connections whose edges are streamed (@stream), fetched in chunks of STREAM_CHUNK_SIZE
+MAX_STREAM_PAGE_SIZE = int(os.environ.get("MAX_STREAM_PAGE_SIZE", "1000"))
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "100"))
+
+# JSON encoder of responses: "orjson" or "json" (standard library, slower)
+# with JSON_STREAMING large responses are encoded and sent in pieces, lists JSON_STREAM_CHUNK_SIZE items at a time
+JSON_ENCODER = os.environ.get("JSON_ENCODER", "orjson")
+assert JSON_ENCODER in ("orjson", "json")
+JSON_STREAMING = os.environ.get("JSON_STREAMING", "false").lower() == "true"
+JSON_STREAM_CHUNK_SIZE = int(os.environ.get("JSON_STREAM_CHUNK_SIZE", "1000"))
+
+# per-process cache of Query.items results, TTL in seconds (0 disables)
+ITEMS_CACHE_SIZE = int(os.environ.get("ITEMS_CACHE_SIZE", "1000"))
+ITEMS_CACHE_TTL = int(os.environ.get("ITEMS_CACHE_TTL", "60"))
+
+# max number of items per bulk mutation (createItems, updateItems, deleteItems)
+MAX_BULK_SIZE = int(os.environ.get("MAX_BULK_SIZE", "1000"))
+
+# max depth and static cost of an operation, unpaginated lists count COST_LIST_SIZE times
+MAX_QUERY_DEPTH = int(os.environ.get("MAX_QUERY_DEPTH", "10"))
+MAX_QUERY_COST = int(os.environ.get("MAX_QUERY_COST", "5000"))
+COST_LIST_SIZE = int(os.environ.get("COST_LIST_SIZE", "20"))
+# User.items is not paginated and users can have many items, it counts COST_USER_ITEMS times
+COST_USER_ITEMS = int(os.environ.get("COST_USER_ITEMS", "100"))
+
+# delivery of subscription events between workers: "postgres" (NOTIFY) or "local" (single worker)
+# subscribers with more than SUBSCRIPTION_QUEUE_SIZE undelivered events fail
+BROADCAST_BACKEND = os.environ.get("BROADCAST_BACKEND", "postgres")
+assert BROADCAST_BACKEND in ("postgres", "local")
+SUBSCRIPTION_QUEUE_SIZE = int(os.environ.get("SUBSCRIPTION_QUEUE_SIZE", "100"))
+
+# per-process cache of user rows, TTL in seconds (0 disables)
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "300"))
+
 # auth
 AUTH_SECRET_KEY = "<my-secret-key>"
 AUTH_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 12
 
+# password hashing (bcrypt) in separate processes, 0 workers hashes in event loop
+HASH_POOL_WORKERS = int(os.environ.get("HASH_POOL_WORKERS", "1"))
+HASH_POOL_MAX_PENDING = int(os.environ.get("HASH_POOL_MAX_PENDING", "32"))
+
+# login attempts per email and per client IP (token buckets shared by all workers, see app.ratelimit):
+# at most *_BURST attempts at once, refilled with *_PER_MINUTE attempts per minute,
+# buckets are in file LOGIN_LIMITS_FILE, in shared memory if possible
+LOGIN_RATE_LIMIT = os.environ.get("LOGIN_RATE_LIMIT", "true").lower() == "true"
+LOGIN_EMAIL_BURST = float(os.environ.get("LOGIN_EMAIL_BURST", "10"))
+LOGIN_EMAIL_PER_MINUTE = float(os.environ.get("LOGIN_EMAIL_PER_MINUTE", "5"))
+LOGIN_IP_BURST = float(os.environ.get("LOGIN_IP_BURST", "60"))
+LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE", "60"))
+_shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+LOGIN_LIMITS_FILE = os.environ.get("LOGIN_LIMITS_FILE", os.path.join(_shm_dir, "login_limits"))
+LOGIN_LIMITS_SLOTS = int(os.environ.get("LOGIN_LIMITS_SLOTS", "65536"))
+
+# proxies whose X-Forwarded-For header is trusted for the client IP (comma separated, "*" for all),
+# set on gunicorn's uvicorn workers, without a trusted proxy the client IP is the connection's peer
+FORWARDED_ALLOW_IPS = os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
 
 _prot, _rest = SQLALCHEMY_DATABASE_URI.split("://")
 _creds, _rest = _rest.split("@")
@@ -23,6 +152,62 @@ _log = logging.getLogger(__name__)
 _log.info("HOST: %s", HOST)
 _log.info("PORT: %s", PORT)
 _log.info("SQLALCHEMY_DATABASE_URI: %s://%s", _prot, _rest)
+_log.info("SQLALCHEMY_ASYNC: %s", SQLALCHEMY_ASYNC)
+_log.info(
+    "SQLALCHEMY_REPLICA_URIS: %s", [d.split("@")[-1] for d in SQLALCHEMY_REPLICA_URIS]
+)
+_log.info("REPLICA_MAX_LAG: %s", REPLICA_MAX_LAG)
+_log.info("REPLICA_CHECK_INTERVAL: %s", REPLICA_CHECK_INTERVAL)
+_log.info("WORKERS: %s", WORKERS)
+_log.info("DB_CONNECTION_BUDGET: %s", DB_CONNECTION_BUDGET)
+_log.info("DB_POOL_SIZE: %s", DB_POOL_SIZE)
+_log.info("DB_MAX_OVERFLOW: %s", DB_MAX_OVERFLOW)
+_log.info("DB_SYNC_POOL_SIZE: %s", DB_SYNC_POOL_SIZE)
+_log.info("DB_POOL_TIMEOUT: %s", DB_POOL_TIMEOUT)
+_log.info("DB_POOL_RECYCLE: %s", DB_POOL_RECYCLE)
+_log.info("DB_POOL_PRE_PING: %s", DB_POOL_PRE_PING)
+_log.info("DB_POOL_WARM: %s", DB_POOL_WARM)
+_log.info("PRELOAD_APP: %s", PRELOAD_APP)
+_log.info("DEBUG_ENDPOINTS: %s", DEBUG_ENDPOINTS)
+_log.info("SQL_TRACE: %s", SQL_TRACE)
+_log.info("SQL_TRACE_MAX_REPEATS: %s", SQL_TRACE_MAX_REPEATS)
+_log.info("SQL_TRACE_FAIL: %s", SQL_TRACE_FAIL)
+if WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW + _reserved_connections) > DB_CONNECTION_BUDGET:
+    _log.warning(
+        "%s workers can open more than DB_CONNECTION_BUDGET=%s connections",
+        WORKERS,
+        DB_CONNECTION_BUDGET,
+    )
+_log.info("METRICS_OPERATION_NAMES: %s", sorted(METRICS_OPERATION_NAMES))
+_log.info("QUERY_CACHE_SIZE: %s", QUERY_CACHE_SIZE)
+_log.info("MAX_BATCH_SIZE: %s", MAX_BATCH_SIZE)
+_log.info("MAX_PAGE_SIZE: %s", MAX_PAGE_SIZE)
+_log.info("MAX_STREAM_PAGE_SIZE: %s", MAX_STREAM_PAGE_SIZE)
+_log.info("STREAM_CHUNK_SIZE: %s", STREAM_CHUNK_SIZE)
+_log.info("JSON_ENCODER: %s", JSON_ENCODER)
+_log.info("JSON_STREAMING: %s", JSON_STREAMING)
+_log.info("JSON_STREAM_CHUNK_SIZE: %s", JSON_STREAM_CHUNK_SIZE)
+_log.info("ITEMS_CACHE_SIZE: %s", ITEMS_CACHE_SIZE)
+_log.info("ITEMS_CACHE_TTL: %s", ITEMS_CACHE_TTL)
+_log.info("MAX_BULK_SIZE: %s", MAX_BULK_SIZE)
+_log.info("MAX_QUERY_DEPTH: %s", MAX_QUERY_DEPTH)
+_log.info("MAX_QUERY_COST: %s", MAX_QUERY_COST)
+_log.info("COST_LIST_SIZE: %s", COST_LIST_SIZE)
+_log.info("COST_USER_ITEMS: %s", COST_USER_ITEMS)
+_log.info("BROADCAST_BACKEND: %s", BROADCAST_BACKEND)
+_log.info("SUBSCRIPTION_QUEUE_SIZE: %s", SUBSCRIPTION_QUEUE_SIZE)
+_log.info("USER_CACHE_SIZE: %s", USER_CACHE_SIZE)
+_log.info("USER_CACHE_TTL: %s", USER_CACHE_TTL)
 _log.info("AUTH_SECRET_KEY: %s", AUTH_SECRET_KEY)
 _log.info("AUTH_ALGORITHM: %s", AUTH_ALGORITHM)
 _log.info("ACCESS_TOKEN_EXPIRE_MINUTES: %s", ACCESS_TOKEN_EXPIRE_MINUTES)
+_log.info("HASH_POOL_WORKERS: %s", HASH_POOL_WORKERS)
+_log.info("HASH_POOL_MAX_PENDING: %s", HASH_POOL_MAX_PENDING)
+_log.info("LOGIN_RATE_LIMIT: %s", LOGIN_RATE_LIMIT)
+_log.info("LOGIN_EMAIL_BURST: %s", LOGIN_EMAIL_BURST)
+_log.info("LOGIN_EMAIL_PER_MINUTE: %s", LOGIN_EMAIL_PER_MINUTE)
+_log.info("LOGIN_IP_BURST: %s", LOGIN_IP_BURST)
+_log.info("LOGIN_IP_PER_MINUTE: %s", LOGIN_IP_PER_MINUTE)
+_log.info("LOGIN_LIMITS_FILE: %s", LOGIN_LIMITS_FILE)
+_log.info("LOGIN_LIMITS_SLOTS: %s", LOGIN_LIMITS_SLOTS)
+_log.info("FORWARDED_ALLOW_IPS: %s", FORWARDED_ALLOW_IPS)
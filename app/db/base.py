@@ -3,6 +3,9 @@ Declarative Base for SQLAlchemy
 
 Declaring declarative base for SQLAlchemy and creating a context manager
 for getting a database session.
+With `SQLALCHEMY_ASYNC` there is also an async engine (asyncpg) and
+an async session factory.
+Pools are configured in `app.config` (see `app.db.pool`).
 
 alembic: alembic's env.py needs the declarative base for `target_metadata = Base.metadata`.
 Dont forget to also import the actual model definitions after importing the declarative
@@ -10,12 +13,36 @@ base in env.py.
 """
 from contextlib import contextmanager
 from sqlalchemy import create_engine  # type: ignore
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession  # type: ignore
 from sqlalchemy.ext.declarative import declarative_base  # type: ignore
 from sqlalchemy.orm import sessionmaker  # type: ignore
-from app.config import SQLALCHEMY_DATABASE_URI
+from app.config import (
+    SQLALCHEMY_DATABASE_URI,
+    SQLALCHEMY_ASYNC,
+    SQLALCHEMY_ASYNC_DATABASE_URI,
+)
+from app.db.pool import engine_kwargs
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI)
-SessionFact = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+engine = create_engine(SQLALCHEMY_DATABASE_URI, **engine_kwargs())
+# written objects are returned by crud functions, they must stay readable after commit
+# without a refresh (and without lazy loading IO in async sessions)
+SessionFact = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+async_engine = None
+AsyncSessionFact = None
+if SQLALCHEMY_ASYNC:
+    async_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_DATABASE_URI, **engine_kwargs(async_=True)
+    )
+    AsyncSessionFact = sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+        bind=async_engine,
+        class_=AsyncSession,
+    )
 
 Base = declarative_base()
 
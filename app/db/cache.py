@@ -0,0 +1,144 @@
+"""
+In-process cache of user rows
+
+Every authenticated request looks up its user, but users rarely change.
+So each process keeps detached copies of user rows, keyed by id and by email,
+evicting least recently used ones beyond `USER_CACHE_SIZE` and expiring them
+after `USER_CACHE_TTL` seconds (0 disables the cache).
+A hit is merged into the requesting session without a SELECT.
+Hits, misses and the number of cached users are exported as metrics (cache `users`).
+
+crud functions which write users drop them from the cache of their own process.
+A trigger on the users table sends a Postgres NOTIFY (see `app.db.notify`),
+so that all processes then drop that user from their cache.
+`notify_user_changed()` does the same for writes which bypass the trigger.
+Workers start listening before they accept requests (`start()`, see `app.startup`),
+until the listener is established the cache is cold: nothing is hit or stored.
+
+An invalidation can arrive while a missed user is being read from the database.
+So callers take the cache's `generation()` before they read,
+and `put()` drops a user which was invalidated since that generation.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session, make_transient_to_detached  # type: ignore
+from app.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from app.db import models
+from app.db.notify import is_listening, listen, notify
+from app.api.metrics import CACHE_REQUESTS, CACHE_SIZE
+
+USERS_CHANNEL = "users_changed"
+
+
+class UserCache:
+    """
+    LRU cache with TTL for user rows
+
+    Args:
+        size: max number of cached users
+        ttl: seconds after which a cached user expires, 0 disables caching
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._users: "OrderedDict[int, Tuple[float, models.User]]" = OrderedDict()
+        self._ids_by_email: Dict[str, int] = {}
+        self._generation = 0
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()  # generation by user id
+        self._invalidated_all = 0
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def get(
+        self, db: Session, id: Optional[int] = None, email: Optional[str] = None
+    ) -> Optional[models.User]:
+        """Get user by id or email merged into `db`, None if not cached"""
+        if self.ttl <= 0:
+            return None
+        entry = None
+        if is_listening(USERS_CHANNEL):
+            with self._lock:
+                if id is None:
+                    id = self._ids_by_email.get(email)  # type: ignore
+                entry = self._users.get(id)  # type: ignore
+                if entry is not None and entry[0] < time.monotonic():
+                    entry = None
+                if entry is not None:
+                    self._users.move_to_end(id)
+        CACHE_REQUESTS.labels("users", "miss" if entry is None else "hit").inc()
+        if entry is None:
+            return None
+        return db.merge(entry[1], load=False)
+
+    def start(self):
+        """Start listening for invalidations of other processes"""
+        if self.ttl > 0 and not self._listening:
+            listen(USERS_CHANNEL, self._on_notify, replay=True)
+            self._listening = True
+
+    def generation(self) -> int:
+        """Current generation, take it before reading a user to `put()` it"""
+        return self._generation
+
+    def put(self, db_user: Optional[models.User], generation: int):
+        """Cache a detached copy of `db_user` unless it was invalidated since `generation`"""
+        if self.ttl <= 0 or db_user is None:
+            return
+        self.start()
+        if not is_listening(USERS_CHANNEL):
+            return
+
+        copy = models.User(
+            **{d.key: getattr(db_user, d.key) for d in models.User.__mapper__.column_attrs}
+        )
+        make_transient_to_detached(copy)
+        with self._lock:
+            if generation < self._invalidated_all:
+                return
+            if self._invalidated.get(copy.id, 0) > generation:
+                return
+            self._users[copy.id] = (time.monotonic() + self.ttl, copy)
+            self._users.move_to_end(copy.id)
+            self._ids_by_email[copy.email] = copy.id
+            while len(self._users) > self.size:
+                _, (_, evicted) = self._users.popitem(last=False)
+                self._ids_by_email.pop(evicted.email, None)
+            size = len(self._users)
+        CACHE_SIZE.labels("users").set(size)
+
+    def invalidate(self, id: Optional[int] = None):
+        """Remove user from cache, remove all if `id` is None"""
+        with self._lock:
+            self._generation += 1
+            if id is None:
+                self._invalidated_all = self._generation
+                self._invalidated.clear()
+                self._users.clear()
+                self._ids_by_email.clear()
+            else:
+                # remember generations of the last `size` invalidated users,
+                # older puts than a forgotten one are dropped like after invalidating all
+                self._invalidated[id] = self._generation
+                self._invalidated.move_to_end(id)
+                if len(self._invalidated) > self.size:
+                    _, self._invalidated_all = self._invalidated.popitem(last=False)
+                entry = self._users.pop(id, None)
+                if entry is not None:
+                    self._ids_by_email.pop(entry[1].email, None)
+            size = len(self._users)
+        CACHE_SIZE.labels("users").set(size)
+
+    def _on_notify(self, payload: Optional[str]):
+        self.invalidate(id=int(payload) if payload else None)
+
+
+user_cache = UserCache(size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def notify_user_changed(db: Session, id: Optional[int] = None):
+    """Invalidate user in the caches of all processes on commit, all users if `id` is None"""
+    user_cache.invalidate(id=id)
+    notify(db=db, channel=USERS_CHANNEL, payload="" if id is None else str(id))
@@ -1,8 +1,23 @@
-"""Create, read, update, delete in database"""
-from typing import List, Optional
+"""
+Create, read, update, delete in database
+
+`iter_*` functions are generators which fetch rows in chunks from a server-side cursor,
+each chunk must be fetched with the session which created the generator.
+
+Writes are single statements (INSERT ... ON CONFLICT, UPDATE/DELETE ... RETURNING)
+followed by a commit. Sessions dont expire objects on commit, so returned objects
+are not refreshed. Caches of other processes are invalidated by database triggers
+(see `app.db.models`).
+"""
+from typing import Iterator, List, Optional, Sequence, Tuple
 import datetime as dt
-from sqlalchemy.orm import Session  # type: ignore
+from sqlalchemy import Float, case, cast, delete, func, insert, inspect  # type: ignore
+from sqlalchemy import literal_column, select, tuple_, update  # type: ignore
+from sqlalchemy.dialects.postgresql import insert as pg_insert  # type: ignore
+from sqlalchemy.exc import IntegrityError  # type: ignore
+from sqlalchemy.orm import Query, Session  # type: ignore
 from app.db import models
+from app.db.cache import user_cache
 
 
 class Undefined:
@@ -14,20 +29,112 @@ class Undefined:
     """
 
 
+def _keyset_page(
+    query: Query,
+    limit: Optional[int],
+    after: Optional[Tuple[dt.date, int]],
+    offset: int = 0,
+) -> Query:
+    """Order items newest first and get page after key `(postedOn, id)`"""
+    if after is not None:
+        query = query.filter(tuple_(models.Item.postedOn, models.Item.id) < after)
+    query = query.order_by(models.Item.postedOn.desc(), models.Item.id.desc())
+    if offset > 0:
+        query = query.offset(offset)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _filter_items(
+    query: Query, titleLike: Optional[str] = None, descriptionLike: Optional[str] = None
+) -> Query:
+    if titleLike is not None:
+        query = query.filter(models.Item.title.ilike(f"%{titleLike}%"))
+    if descriptionLike is not None:
+        query = query.filter(models.Item.description.ilike(f"%{descriptionLike}%"))
+    return query
+
+
+def _chunks(db: Session, stmt, chunk_size: int) -> Iterator[list]:
+    """Objects of a select statement in chunks, fetched from a server-side cursor"""
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    try:
+        yield from result.scalars().partitions()
+    finally:
+        result.close()
+
+
+def _returning(db: Session, model, stmt) -> list:
+    """Execute INSERT or UPDATE and get the affected rows as objects of model"""
+    columns = [d.columns[0] for d in inspect(model).column_attrs if not d.deferred]
+    query = select(model).from_statement(stmt.returning(*columns))
+    query = query.execution_options(populate_existing=True)
+    return db.execute(query).scalars().all()
+
+
 def get_user_by_id(db: Session, id: int) -> models.User:
-    return db.query(models.User).filter(models.User.id == id).first()
+    generation = user_cache.generation()
+    db_obj = user_cache.get(db=db, id=id)
+    if db_obj is None:
+        db_obj = db.query(models.User).filter(models.User.id == id).first()
+        user_cache.put(db_obj, generation=generation)
+    return db_obj
 
 
 def get_user_by_email(db: Session, email: str) -> models.User:
-    return db.query(models.User).filter(models.User.email == email).first()
+    generation = user_cache.generation()
+    db_obj = user_cache.get(db=db, email=email)
+    if db_obj is None:
+        db_obj = db.query(models.User).filter(models.User.email == email).first()
+        user_cache.put(db_obj, generation=generation)
+    return db_obj
 
 
 def get_item_by_id(db: Session, id: int) -> models.Item:
     return db.query(models.Item).filter(models.Item.id == id).first()
 
 
-def get_items_by_owner_id(db: Session, ownerId: int) -> List[models.Item]:
-    return db.query(models.Item).filter(models.Item.ownerId == ownerId).all()
+def get_items_by_owner_id(
+    db: Session,
+    ownerId: int,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[dt.date, int]] = None,
+    options: Sequence = (),
+    offset: int = 0,
+) -> List[models.Item]:
+    query = db.query(models.Item).options(*options)
+    query = query.filter(models.Item.ownerId == ownerId)
+    return _keyset_page(query=query, limit=limit, after=after, offset=offset).all()
+
+
+def iter_items_by_owner_id(
+    db: Session,
+    ownerId: int,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[dt.date, int]] = None,
+    options: Sequence = (),
+    chunk_size: int = 100,
+) -> Iterator[List[models.Item]]:
+    """Like `get_items_by_owner_id`, but yields items in chunks of `chunk_size`"""
+    stmt = select(models.Item).options(*options).filter(models.Item.ownerId == ownerId)
+    stmt = _keyset_page(query=stmt, limit=limit, after=after)
+    return _chunks(db=db, stmt=stmt, chunk_size=chunk_size)
+
+
+def get_users_by_ids(db: Session, ids: Sequence[int]) -> List[models.User]:
+    generation = user_cache.generation()
+    db_objs = [user_cache.get(db=db, id=d) for d in ids]
+    missing = [d for d, db_obj in zip(ids, db_objs) if db_obj is None]
+    if len(missing) > 0:
+        for db_obj in db.query(models.User).filter(models.User.id.in_(missing)):
+            user_cache.put(db_obj, generation=generation)
+            db_objs.append(db_obj)
+    return [d for d in db_objs if d is not None]
+
+
+def get_items_by_owner_ids(db: Session, ownerIds: Sequence[int]) -> List[models.Item]:
+    return db.query(models.Item).filter(models.Item.ownerId.in_(ownerIds)).all()
 
 
 def get_users(db: Session, nameLike: Optional[str] = None) -> List[models.User]:
@@ -38,14 +145,52 @@ def get_users(db: Session, nameLike: Optional[str] = None) -> List[models.User]:
 
 
 def get_items(
-    db: Session, titleLike: Optional[str] = None, descriptionLike: Optional[str] = None,
+    db: Session,
+    titleLike: Optional[str] = None,
+    descriptionLike: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[dt.date, int]] = None,
+    options: Sequence = (),
+    offset: int = 0,
 ) -> List[models.Item]:
-    query = db.query(models.Item)
-    if titleLike is not None:
-        query = query.filter(models.Item.title.ilike(f"%{titleLike}%"))
-    if descriptionLike is not None:
-        query = query.filter(models.Item.description.ilike(f"%{descriptionLike}%"))
-    return query.all()
+    """Get items, `options` are loader options like `load_only` or `joinedload`"""
+    query = db.query(models.Item).options(*options)
+    query = _filter_items(query, titleLike=titleLike, descriptionLike=descriptionLike)
+    return _keyset_page(query=query, limit=limit, after=after, offset=offset).all()
+
+
+def iter_items(
+    db: Session,
+    titleLike: Optional[str] = None,
+    descriptionLike: Optional[str] = None,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[dt.date, int]] = None,
+    options: Sequence = (),
+    chunk_size: int = 100,
+) -> Iterator[List[models.Item]]:
+    """Like `get_items`, but yields items in chunks of `chunk_size`"""
+    stmt = select(models.Item).options(*options)
+    stmt = _filter_items(stmt, titleLike=titleLike, descriptionLike=descriptionLike)
+    stmt = _keyset_page(query=stmt, limit=limit, after=after)
+    return _chunks(db=db, stmt=stmt, chunk_size=chunk_size)
+
+
+def search_items(
+    db: Session,
+    query: str,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[float, int]] = None,
+) -> List[Tuple[models.Item, float]]:
+    """Full-text search items, best ranked first, returns (item, rank) pairs"""
+    tsquery = func.websearch_to_tsquery(literal_column("'english'"), query)
+    rank = cast(func.ts_rank(models.Item.searchVector, tsquery), Float)
+    dbq = db.query(models.Item, rank).filter(models.Item.searchVector.op("@@")(tsquery))
+    if after is not None:
+        dbq = dbq.filter(tuple_(rank, models.Item.id) < after)
+    dbq = dbq.order_by(rank.desc(), models.Item.id.desc())
+    if limit is not None:
+        dbq = dbq.limit(limit)
+    return [(d[0], d[1]) for d in dbq]
 
 
 def create_user(
@@ -57,20 +202,20 @@ def create_user(
     isSuperuser: bool = False,
     **_,
 ) -> models.User:
-    db_obj = db.query(models.User).filter(models.User.email == email).first()
-    if db_obj is not None:
-        raise ValueError(f"User with email {email} already exists")
-    db_obj = models.User(
+    stmt = pg_insert(models.User).values(
         name=name,
         email=email,
         hashedPassword=hashedPassword,
         isActive=isActive,
         isSuperuser=isSuperuser,
     )
-    db.add(db_obj)
+    stmt = stmt.on_conflict_do_nothing(index_elements=[models.User.email])
+    db_objs = _returning(db=db, model=models.User, stmt=stmt)
+    if len(db_objs) == 0:
+        db.rollback()
+        raise ValueError(f"User with email {email} already exists")
     db.commit()
-    db.refresh(db_obj)
-    return db_obj
+    return db_objs[0]
 
 
 def create_item(
@@ -80,16 +225,35 @@ def create_item(
     title: Optional[str] = None,
     description: Optional[str] = None,
 ) -> models.Item:
-    db_owner = db.query(models.User).filter(models.User.id == ownerId).first()
-    if db_owner is None:
-        raise ValueError(f"Owner with id {ownerId} not found")
-    db_obj = models.Item(
+    stmt = insert(models.Item).values(
         title=title, description=description, ownerId=ownerId, postedOn=postedOn
     )
-    db.add(db_obj)
+    try:
+        db_objs = _returning(db=db, model=models.Item, stmt=stmt)
+    except IntegrityError as err:
+        db.rollback()
+        raise ValueError(f"Owner with id {ownerId} not found") from err
     db.commit()
-    db.refresh(db_obj)
-    return db_obj
+    return db_objs[0]
+
+
+def create_items(db: Session, ownerId: int, items: Sequence[dict]) -> List[models.Item]:
+    """Create items with a single multi-row INSERT, items are dicts of item fields"""
+    if len(items) == 0:
+        return []
+    rows = [
+        {
+            "ownerId": ownerId,
+            "postedOn": d["postedOn"],
+            "title": d.get("title"),
+            "description": d.get("description"),
+        }
+        for d in items
+    ]
+    stmt = insert(models.Item).values(rows)
+    db_objs = _returning(db=db, model=models.Item, stmt=stmt)
+    db.commit()
+    return db_objs
 
 
 def update_user(
@@ -99,17 +263,22 @@ def update_user(
     isActive: Optional[bool] = None,
     **_,
 ) -> models.User:
-    db_obj = user
-
+    values = {}
     if name is not Undefined:
-        db_obj.name = name
+        values["name"] = name
     if isActive is not Undefined:
-        db_obj.isActive = isActive
+        values["isActive"] = isActive
+    if len(values) == 0:
+        return user
 
-    db.add(db_obj)
+    stmt = update(models.User).where(models.User.id == user.id).values(values)
+    user_cache.invalidate(id=user.id)
+    db_objs = _returning(db=db, model=models.User, stmt=stmt)
+    if len(db_objs) == 0:
+        db.rollback()
+        raise ValueError(f"User with id {user.id} doesnt exist")
     db.commit()
-    db.refresh(db_obj)
-    return db_obj
+    return db_objs[0]
 
 
 def update_item(
@@ -121,38 +290,115 @@ def update_item(
     postedOn: Optional[dt.date] = None,
     **_,
 ) -> models.Item:
-    db_obj = get_item_by_id(db=db, id=itemId)
-    if db_obj is None:
-        raise ValueError(f"Item with id {itemId} doesnt exist")
-    if db_obj.ownerId != ownerId:
-        raise ValueError(f"Item with id {itemId} does not belong to you")
-
+    values = {}
     if title is not Undefined:
-        db_obj.title = title
+        values["title"] = title
     if description is not Undefined:
-        db_obj.description = description
+        values["description"] = description
     if postedOn is not Undefined:
-        db_obj.postedOn = postedOn
+        values["postedOn"] = postedOn
+
+    where = (models.Item.id == itemId, models.Item.ownerId == ownerId)
+    if len(values) == 0:
+        # nothing to update, only check ownership without writing (and notifying)
+        db_objs = db.query(models.Item).filter(*where).all()
+    else:
+        stmt = update(models.Item).where(*where).values(values)
+        db_objs = _returning(db=db, model=models.Item, stmt=stmt)
+    if len(db_objs) == 0:
+        db.rollback()
+        if get_item_by_id(db=db, id=itemId) is None:
+            raise ValueError(f"Item with id {itemId} doesnt exist")
+        raise ValueError(f"Item with id {itemId} does not belong to you")
+    db.commit()
+    return db_objs[0]
+
 
-    db.add(db_obj)
+def update_items(db: Session, ownerId: int, items: Sequence[dict]) -> List[models.Item]:
+    """
+    Update items of owner with a single UPDATE, items are dicts with `id` and item fields.
+    Missing fields are not updated. Nothing is updated if any item doesnt exist
+    or does not belong to owner.
+    """
+    ids = [d["id"] for d in items]
+    if len(set(ids)) < len(ids):
+        raise ValueError("Each item can only be updated once")
+    if len(ids) == 0:
+        return []
+
+    values = {}
+    for key in ("title", "description", "postedOn"):
+        whens = {d["id"]: d[key] for d in items if key in d}
+        if len(whens) > 0:
+            column = getattr(models.Item, key)
+            values[key] = case(whens, value=models.Item.id, else_=column)
+    where = (models.Item.id.in_(ids), models.Item.ownerId == ownerId)
+    if len(values) == 0:
+        # nothing to update, only check ownership without writing (and notifying)
+        db_objs = db.query(models.Item).filter(*where).all()
+    else:
+        stmt = update(models.Item).where(*where).values(values)
+        db_objs = _returning(db=db, model=models.Item, stmt=stmt)
+
+    missing = set(ids) - {d.id for d in db_objs}
+    if len(missing) > 0:
+        db.rollback()
+        raise ValueError(
+            f"Items with ids {sorted(missing)} dont exist or do not belong to you"
+        )
     db.commit()
-    db.refresh(db_obj)
-    return db_obj
+    by_id = {d.id: d for d in db_objs}
+    return [by_id[d] for d in ids]
 
 
-def delete_user(db: Session, id: int) -> bool:
-    db_obj = get_user_by_id(db=db, id=id)
-    if db_obj is None:
+def delete_user(db: Session, id: int) -> List[int]:
+    """Delete user and all items of user, returns ids of the deleted items"""
+    items = (
+        delete(models.Item)
+        .where(models.Item.ownerId == id)
+        .returning(models.Item.id)
+        .cte("items")
+    )
+    item_ids = select(func.array_agg(items.c.id)).scalar_subquery()
+    stmt = (
+        delete(models.User)
+        .where(models.User.id == id)
+        .add_cte(items)
+        .returning(models.User.id, item_ids)
+        .execution_options(synchronize_session=False)
+    )
+    user_cache.invalidate(id=id)
+    row = db.execute(stmt).first()
+    if row is None:
+        db.rollback()
         raise ValueError(f"User with id {id} doesnt exist")
-    db.delete(db_obj)
     db.commit()
-    return True
+    return row[1] or []
 
 
 def delete_item(db: Session, id: int) -> bool:
-    db_obj = get_item_by_id(db=db, id=id)
-    if db_obj is None:
+    stmt = (
+        delete(models.Item)
+        .where(models.Item.id == id)
+        .returning(models.Item.id)
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(stmt).first() is None:
+        db.rollback()
         raise ValueError(f"Item with id {id} doesnt exist")
-    db.delete(db_obj)
     db.commit()
     return True
+
+
+def delete_items(db: Session, ids: Sequence[int]) -> List[int]:
+    """Delete items with a single DELETE, nothing is deleted if any item doesnt exist"""
+    stmt = delete(models.Item).where(models.Item.id.in_(ids)).returning(models.Item.id)
+    stmt = stmt.execution_options(synchronize_session=False)
+    deleted = db.execute(stmt).scalars().all()
+
+    missing = set(ids) - set(deleted)
+    if len(missing) > 0:
+        db.rollback()
+        raise ValueError(f"Items with ids {sorted(missing)} dont exist")
+    db.commit()
+    return deleted
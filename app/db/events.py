@@ -0,0 +1,51 @@
+"""
+Callbacks for executed SQL statements
+
+Instrumentation (metrics, SQL traces) registers callbacks with `on_statement()`.
+They are called after each statement on the sync and async engines (including replicas)
+with the statement string and its duration in seconds,
+in the context (`contextvars`) of the code which executed the statement.
+"""
+import time
+from typing import Callable, List
+from sqlalchemy import event  # type: ignore
+from app.db.base import engine, async_engine
+from app.db.replicas import replicas
+
+StatementCallback = Callable[[str, float], None]
+
+_callbacks: List[StatementCallback] = []
+
+
+def on_statement(callback: StatementCallback):
+    """Call `callback(statement, seconds)` after each executed statement"""
+    _callbacks.append(callback)
+
+
+def _before_cursor_execute(conn, *_):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, *_):
+    del cursor
+    seconds = time.perf_counter() - conn.info["query_start"].pop()
+    for callback in _callbacks:
+        callback(statement, seconds)
+
+
+def _handle_error(exception_context):
+    # a failed statement has no after_cursor_execute, drop its start time
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+_engines = [engine, async_engine.sync_engine if async_engine else None]
+for _replica in replicas.replicas:
+    _engines.append(_replica.engine)
+    _engines.append(_replica.async_engine.sync_engine if _replica.async_engine else None)
+for _engine in _engines:
+    if _engine is not None:
+        event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(_engine, "handle_error", _handle_error)
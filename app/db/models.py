@@ -5,8 +5,10 @@ alembic: alembic's env.py needs the declarative base for `target_metadata = Base
 Dont forget to also import this model definition after importing the declarative
 base in env.py.
 """
-from sqlalchemy import Column, ForeignKey, Integer, String, Text, Boolean, Date  # type: ignore
-from sqlalchemy.orm import relationship  # type: ignore
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Text, Boolean, Date  # type: ignore
+from sqlalchemy import DDL, event  # type: ignore
+from sqlalchemy.dialects.postgresql import TSVECTOR  # type: ignore
+from sqlalchemy.orm import deferred, relationship  # type: ignore
 from app.db.base import Base
 
 
@@ -32,3 +34,77 @@ class Item(Base):
     postedOn = Column(Date, nullable=False)
 
     ownerId = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    # full-text search document, set by a trigger (see below), never loaded by default
+    searchVector = deferred(Column(TSVECTOR))
+
+    __table_args__ = (
+        # keyset pagination orders by (postedOn, id), also per owner
+        Index("ix_items_postedOn_id", "postedOn", "id"),
+        Index("ix_items_ownerId_postedOn_id", "ownerId", "postedOn", "id"),
+        # titleLike, descriptionLike use ILIKE '%x%' which needs trigram indexes
+        Index(
+            "ix_items_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_items_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+        Index("ix_items_searchVector", "searchVector", postgresql_using="gin"),
+    )
+
+
+# trigram indexes need the extension (for create_all, alembic migrations do it themselves)
+event.listen(
+    Item.__table__, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
+# Caches of all processes are invalidated by notifications (see app.db.notify)
+# which are sent by triggers, so that writes dont need an extra statement.
+# Changed users are dropped from user caches (channel users_changed, payload user id),
+# any change of items invalidates cached item results (channel results_invalidated).
+USERS_CHANGED_TRIGGER = """
+CREATE OR REPLACE FUNCTION notify_users_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('users_changed', OLD.id::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER users_changed AFTER UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_users_changed();
+"""
+
+ITEMS_CHANGED_TRIGGER = """
+CREATE OR REPLACE FUNCTION notify_items_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('results_invalidated', 'items');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER items_changed AFTER INSERT OR UPDATE OR DELETE ON items
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_items_changed();
+"""
+
+# The search vector of title and description is set by a trigger, not a generated column,
+# so that the migration adding it could backfill existing items without rewriting the table.
+ITEMS_SEARCH_VECTOR_TRIGGER = """
+CREATE OR REPLACE FUNCTION items_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW."searchVector" := to_tsvector(
+        'english', coalesce(NEW.title, '') || ' ' || coalesce(NEW.description, '')
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER items_search_vector BEFORE INSERT OR UPDATE OF title, description ON items
+    FOR EACH ROW EXECUTE FUNCTION items_search_vector();
+"""
+
+event.listen(User.__table__, "after_create", DDL(USERS_CHANGED_TRIGGER))
+event.listen(Item.__table__, "after_create", DDL(ITEMS_CHANGED_TRIGGER))
+event.listen(Item.__table__, "after_create", DDL(ITEMS_SEARCH_VECTOR_TRIGGER))
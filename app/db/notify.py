@@ -0,0 +1,152 @@
+"""
+Notifications between processes with Postgres NOTIFY/LISTEN
+
+Writers call `notify()` with their session before committing.
+Postgres only delivers the notification once the transaction was committed,
+and not at all if it was rolled back.
+
+Every process (gunicorn worker) runs one listener thread with its own
+database connection, started by the first `listen()` call.
+Later `listen()` calls on new channels wake it up to LISTEN immediately.
+It calls the registered callbacks with the payload of each notification.
+Notifications sent before the listener executed LISTEN on a channel are never received,
+`is_listening()` tells whether it did (and is still connected).
+Callbacks are called from the listener thread, not the event loop.
+If the connection was lost, all callbacks are called with `None` after reconnecting,
+meaning that notifications might have been missed.
+
+With read replicas (`SQLALCHEMY_REPLICA_URIS`) notifications are dispatched again
+after `REPLICA_MAX_LAG` seconds to callbacks registered with `replay=True`:
+a cache might have been filled from a replica which had not yet replayed the change.
+"""
+import heapq
+import itertools
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import text  # type: ignore
+from sqlalchemy.orm import Session  # type: ignore
+from app.config import SQLALCHEMY_REPLICA_URIS, REPLICA_MAX_LAG
+from app.db.base import engine
+
+_log = logging.getLogger(__name__)
+
+Callback = Callable[[Optional[str]], None]
+# heap of notifications to dispatch again: (due time, sequence number, channel, payload)
+Replays = List[Tuple[float, int, str, Optional[str]]]
+
+_callbacks: Dict[str, List[Tuple[Callback, bool]]] = defaultdict(list)
+_lock = threading.Lock()
+_listener_pid: Optional[int] = None
+_listening: Set[str] = set()  # channels with LISTEN on the current connection
+_wakeup: Optional[Tuple[int, int]] = None  # pipe to wake the listener for new channels
+_sequence = itertools.count()
+
+
+def notify(db: Session, channel: str, payload: str = ""):
+    """Send notification on channel when the transaction of `db` commits"""
+    db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": payload},
+    )
+
+
+def listen(channel: str, callback: Callback, replay: bool = False):
+    """Call `callback(payload)` for every notification on channel, again later with `replay`"""
+    global _listener_pid, _wakeup  # pylint: disable=global-statement
+    with _lock:
+        is_new = channel not in _callbacks
+        _callbacks[channel].append((callback, replay))
+        # threads do not survive a fork, every process needs its own listener
+        if _listener_pid != os.getpid():
+            _listener_pid = os.getpid()
+            _listening.clear()  # inherited from the parent process
+            _wakeup = os.pipe()
+            thread = threading.Thread(target=_listen_forever, daemon=True)
+            thread.start()
+        elif is_new and _wakeup is not None:
+            os.write(_wakeup[1], b"x")
+
+
+def is_listening(channel: str) -> bool:
+    """Whether notifications on channel are received by this process"""
+    return _listener_pid == os.getpid() and channel in _listening
+
+
+def _dispatch(channel: str, payload: Optional[str], replayed: bool = False):
+    with _lock:
+        callbacks = [d for d, replay in _callbacks[channel] if replay or not replayed]
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception:  # pylint: disable=broad-except
+            _log.exception("Callback for channel %s failed", channel)
+
+
+def _dispatch_and_replay(channel: str, payload: Optional[str], replays: Replays):
+    _dispatch(channel, payload)
+    if SQLALCHEMY_REPLICA_URIS:
+        due = time.monotonic() + REPLICA_MAX_LAG
+        heapq.heappush(replays, (due, next(_sequence), channel, payload))
+
+
+def _listen_forever():
+    reconnect = False
+    replays: Replays = []
+    while True:
+        try:
+            conn = engine.raw_connection()
+            conn.detach()  # dont return this connection to the pool
+            dbapi_conn = conn.connection
+            dbapi_conn.autocommit = True
+            with _lock:
+                channels = list(_callbacks)
+            with dbapi_conn.cursor() as cursor:
+                for channel in channels:
+                    cursor.execute(f'LISTEN "{channel}"')
+            if reconnect:
+                for channel in channels:
+                    _dispatch_and_replay(channel, None, replays)
+            with _lock:
+                _listening.update(channels)
+            _poll(dbapi_conn, channels, replays)
+        except Exception:  # pylint: disable=broad-except
+            with _lock:
+                _listening.clear()
+            _log.exception("Listener connection lost, reconnecting in 1s")
+            reconnect = True
+            time.sleep(1)
+
+
+def _poll(dbapi_conn, channels: List[str], replays: Replays):
+    while True:
+        with _lock:
+            new_channels = [d for d in _callbacks if d not in channels]
+        if new_channels:
+            with dbapi_conn.cursor() as cursor:
+                for channel in new_channels:
+                    cursor.execute(f'LISTEN "{channel}"')
+            channels.extend(new_channels)
+            with _lock:
+                _listening.update(new_channels)
+
+        wakeup = _wakeup[0]  # type: ignore
+        timeout = 1.0
+        if replays:
+            timeout = min(max(replays[0][0] - time.monotonic(), 0.0), timeout)
+        readable, _, _ = select.select([dbapi_conn, wakeup], [], [], timeout)
+        while replays and replays[0][0] <= time.monotonic():
+            _, _, channel, payload = heapq.heappop(replays)
+            _dispatch(channel, payload, replayed=True)
+        if wakeup in readable:
+            os.read(wakeup, 1024)
+        if dbapi_conn not in readable:
+            continue
+        dbapi_conn.poll()
+        while dbapi_conn.notifies:
+            note = dbapi_conn.notifies.pop(0)
+            _dispatch_and_replay(note.channel, note.payload, replays)
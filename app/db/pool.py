@@ -0,0 +1,126 @@
+"""
+Connection pools with statistics
+
+Pools are sized in `app.config` so that all workers together stay within
+`DB_CONNECTION_BUDGET`, counting the LISTEN connection and with `SQLALCHEMY_ASYNC`
+the small sync pool next to the async one. The pool classes here additionally record how long
+checkouts had to wait for a connection (including connecting),
+and how often they timed out, so that a too small pool can be spotted
+with `pool_stats()` (served on `/debug/pool`).
+Workers open connections before they accept requests with `warm_up()` and `warm_up_async()`.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Dict
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError  # type: ignore
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool  # type: ignore
+from app.config import (
+    SQLALCHEMY_ASYNC,
+    DB_POOL_SIZE,
+    DB_SYNC_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+)
+
+
+class _WaitStats:
+    """Number, total and max wait time of checkouts and number of timeouts"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timeout: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timeout)
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avgWaitSeconds": self.total_wait / self.checkouts
+                if self.checkouts > 0
+                else 0.0,
+                "maxWaitSeconds": self.max_wait,
+            }
+
+
+class _TimedPoolMixin:
+    """Records wait times of `_do_get`, which blocks until a connection is available"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)  # type: ignore
+        self.waits = _WaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()  # type: ignore
+        except PoolTimeoutError:
+            self.waits.record(time.perf_counter() - start, timeout=True)
+            raise
+        self.waits.record(time.perf_counter() - start, timeout=False)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """QueuePool with wait time statistics"""
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool with wait time statistics"""
+
+
+def engine_kwargs(async_: bool = False) -> Dict[str, Any]:
+    """
+    Pool arguments for `create_engine()` and `create_async_engine()`
+
+    With `SQLALCHEMY_ASYNC` the sync engine only sends notifications,
+    its pool is capped at `DB_SYNC_POOL_SIZE` connections.
+    """
+    capped = SQLALCHEMY_ASYNC and not async_
+    return {
+        "poolclass": TimedAsyncQueuePool if async_ else TimedQueuePool,
+        "pool_size": DB_SYNC_POOL_SIZE if capped else DB_POOL_SIZE,
+        "max_overflow": 0 if capped else DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def pool_stats(pool) -> dict:
+    """Current state of a pool of this process"""
+    waits = getattr(pool, "waits", None) or _WaitStats()
+    return {
+        "size": pool.size(),
+        "maxOverflow": getattr(pool, "_max_overflow", DB_MAX_OVERFLOW),
+        "checkedIn": pool.checkedin(),
+        "checkedOut": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        **waits.stats(),
+    }
+
+
+def warm_up(engine, n: int):
+    """Open n connections (at most `DB_POOL_SIZE`) and return them to the pool"""
+    conns = [engine.connect() for _ in range(min(n, DB_POOL_SIZE))]
+    for conn in conns:
+        conn.close()
+
+
+async def warm_up_async(async_engine, n: int):
+    """Concurrently open n connections (at most `DB_POOL_SIZE`) and return them to the pool"""
+    conns = [async_engine.connect() for _ in range(min(n, DB_POOL_SIZE))]
+    await asyncio.gather(*(d.start() for d in conns))
+    await asyncio.gather(*(d.close() for d in conns))
@@ -0,0 +1,161 @@
+"""
+Read replicas
+
+With `SQLALCHEMY_REPLICA_URIS` the sessions of query operations are opened on a replica
+(see `app.api.server` and `app.api.context`), all other sessions on the primary (`app.db.base`).
+Each replica has its own engines with pools configured like the primary's.
+
+Every process checks its replicas every `REPLICA_CHECK_INTERVAL` seconds in a background thread,
+measuring the replication lag (0 if the replica has replayed all WAL it received).
+Since the lag grows at most as fast as time passes, a replica is fresh as long as
+its last measured lag plus the time since that check is at most `REPLICA_MAX_LAG`.
+A replica which could not be checked (unreachable, not yet checked) is not fresh.
+`choose()` returns fresh replicas round-robin, or None if there is none,
+in which case reads fall back to the primary.
+"""
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from typing import List, Optional
+from sqlalchemy import create_engine, text  # type: ignore
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession  # type: ignore
+from sqlalchemy.orm import sessionmaker  # type: ignore
+from app.config import (
+    SQLALCHEMY_ASYNC,
+    SQLALCHEMY_REPLICA_URIS,
+    REPLICA_MAX_LAG,
+    REPLICA_CHECK_INTERVAL,
+)
+from app.db.pool import engine_kwargs, pool_stats
+
+_log = logging.getLogger(__name__)
+
+_LAG_SQL = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(
+            EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8,
+            'Infinity'::float8
+        )
+    END
+    """
+)
+
+
+class Replica:
+    """
+    Engines, session factories and health of a replica
+
+    Args:
+        uri: database URI of the replica
+    """
+
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.engine = create_engine(uri, **engine_kwargs())
+        self.SessionFact = sessionmaker(
+            autocommit=False, autoflush=False, expire_on_commit=False, bind=self.engine
+        )
+        self.async_engine = None
+        self.AsyncSessionFact = None
+        if SQLALCHEMY_ASYNC:
+            self.async_engine = create_async_engine(
+                uri.replace("postgresql://", "postgresql+asyncpg://", 1),
+                **engine_kwargs(async_=True),
+            )
+            self.AsyncSessionFact = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                expire_on_commit=False,
+                bind=self.async_engine,
+                class_=AsyncSession,
+            )
+        self.lag = math.inf
+        self.checked_at = -math.inf
+        self.reads = 0
+
+    def check(self):
+        """Measure replication lag, infinite if the replica is unreachable"""
+        try:
+            with self.engine.connect() as conn:
+                lag = float(conn.execute(_LAG_SQL).scalar())
+        except Exception:  # pylint: disable=broad-except
+            _log.warning("Replica %s is unreachable", self.name, exc_info=True)
+            lag = math.inf
+        self.lag, self.checked_at = lag, time.monotonic()
+
+    def is_fresh(self) -> bool:
+        """Whether replication lag is at most `REPLICA_MAX_LAG` (by the last check)"""
+        return self.lag + time.monotonic() - self.checked_at <= REPLICA_MAX_LAG
+
+    @property
+    def name(self) -> str:
+        """URI without credentials"""
+        return self.uri.split("@")[-1]
+
+    def stats(self) -> dict:
+        """Health, number of sessions and pool state"""
+        pools = {"sync": pool_stats(self.engine.pool)}
+        if self.async_engine is not None:
+            pools["async"] = pool_stats(self.async_engine.sync_engine.pool)
+        return {
+            "name": self.name,
+            "fresh": self.is_fresh(),
+            "lagSeconds": self.lag if math.isfinite(self.lag) else None,
+            "reads": self.reads,
+            "pools": pools,
+        }
+
+
+class ReplicaSet:
+    """
+    Replicas which are checked in a background thread of each process
+
+    Args:
+        uris: database URIs of the replicas
+    """
+
+    def __init__(self, uris: List[str]):
+        self.replicas = [Replica(d) for d in uris]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._checker_pid: Optional[int] = None
+
+    def choose(self) -> Optional[Replica]:
+        """Next fresh replica round-robin, None if there is none"""
+        if not self.replicas:
+            return None
+        self._start_checker()
+        n = len(self.replicas)
+        start = next(self._next)
+        for i in range(n):
+            replica = self.replicas[(start + i) % n]
+            if replica.is_fresh():
+                replica.reads += 1
+                return replica
+        return None
+
+    def stats(self) -> List[dict]:
+        return [d.stats() for d in self.replicas]
+
+    def _start_checker(self):
+        # threads do not survive a fork, every process needs its own checker
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+        threading.Thread(target=self._check_forever, daemon=True).start()
+
+    def _check_forever(self):
+        while True:
+            for replica in self.replicas:
+                replica.check()
+            time.sleep(REPLICA_CHECK_INTERVAL)
+
+
+replicas = ReplicaSet(SQLALCHEMY_REPLICA_URIS)
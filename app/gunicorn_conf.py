@@ -2,17 +2,21 @@
 Adapted from tiangolo and Carsten's `logconfig_dict`
 https://github.com/tiangolo/uvicorn-gunicorn-docker/blob/master/docker-images/gunicorn_conf.py
 """
+import gc
 import json
-import multiprocessing
 import os
-from app.config import HOST, PORT, LOG_LEVEL
-
-workers_per_core_str = os.getenv("WORKERS_PER_CORE", "1")
-max_workers_str = os.getenv("MAX_WORKERS")
-use_max_workers = None
-if max_workers_str:
-    use_max_workers = int(max_workers_str)
-web_concurrency_str = os.getenv("WEB_CONCURRENCY", None)
+import shutil
+from app.config import (
+    HOST,
+    PORT,
+    LOG_LEVEL,
+    WORKERS,
+    WORKERS_PER_CORE,
+    MAX_WORKERS,
+    PRELOAD_APP,
+    LOGIN_LIMITS_FILE,
+    FORWARDED_ALLOW_IPS,
+)
 
 bind_env = os.getenv("BIND", None)
 if bind_env:
@@ -20,17 +24,6 @@ if bind_env:
 else:
     use_bind = HOST + ":" + PORT
 
-cores = multiprocessing.cpu_count()
-workers_per_core = float(workers_per_core_str)
-default_web_concurrency = workers_per_core * cores
-if web_concurrency_str:
-    web_concurrency = int(web_concurrency_str)
-    assert web_concurrency > 0
-else:
-    web_concurrency = max(int(default_web_concurrency), 2)
-    if use_max_workers:
-        web_concurrency = min(web_concurrency, use_max_workers)
-
 accesslog_var = os.getenv("ACCESS_LOG", "-")
 use_accesslog = accesslog_var or None
 errorlog_var = os.getenv("ERROR_LOG", "-")
@@ -41,7 +34,8 @@ timeout_str = os.getenv("TIMEOUT", "120")
 keepalive_str = os.getenv("KEEP_ALIVE", "5")
 
 # Gunicorn config variables
-workers = web_concurrency
+# worker count is computed in app.config, connection pools are sized by it
+workers = WORKERS
 bind = use_bind
 errorlog = use_errorlog
 worker_tmp_dir = "/dev/shm"
@@ -49,6 +43,46 @@ accesslog = use_accesslog
 graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
+# client IPs (e.g. for login rate limits) are taken from X-Forwarded-For only behind these proxies
+forwarded_allow_ips = FORWARDED_ALLOW_IPS
+# build app once in master, workers share it copy-on-write (see app.startup)
+preload_app = PRELOAD_APP
+
+# workers write metrics to files which are aggregated on /metrics
+# (prometheus_client multiprocess mode), start with an empty directory
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(worker_tmp_dir, "prometheus")
+)
+shutil.rmtree(prometheus_dir, ignore_errors=True)
+os.makedirs(prometheus_dir)
+
+# workers share login rate limits in a file (see app.ratelimit), start with full buckets
+if os.path.exists(LOGIN_LIMITS_FILE):
+    os.remove(LOGIN_LIMITS_FILE)
+
+
+def when_ready(server):
+    """Keep preloaded objects out of garbage collection, so workers dont copy their pages"""
+    del server
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Drop database connections inherited from master"""
+    from app.startup import after_fork  # pylint: disable=import-outside-toplevel
+
+    del server, worker
+    after_fork()
+
+
+def child_exit(server, worker):
+    """Remove metrics files of dead worker"""
+    from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+    del server
+    multiprocess.mark_process_dead(worker.pid)
+
 
 # man, you have to mimic the expectations of gunicorn here!
 # https://github.com/benoitc/gunicorn/blob/19.9.0/gunicorn/glogging.py#L53
@@ -105,11 +139,13 @@ log_data = {
     "graceful_timeout": graceful_timeout,
     "timeout": timeout,
     "keepalive": keepalive,
+    "preload_app": preload_app,
+    "forwarded_allow_ips": forwarded_allow_ips,
     "errorlog": errorlog,
     "accesslog": accesslog,
     # Additional, non-gunicorn variables
-    "workers_per_core": workers_per_core,
-    "use_max_workers": use_max_workers,
+    "workers_per_core": WORKERS_PER_CORE,
+    "use_max_workers": MAX_WORKERS,
     "host": HOST,
     "port": PORT,
 }
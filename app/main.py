@@ -1,22 +1,48 @@
-"""ASGI app. Serves a GraphQL playground on '/'"""
+"""
+ASGI app. Serves a GraphQL playground on '/' (subscriptions over websockets),
+metrics on '/metrics', debug endpoints on '/debug/'
+"""
 from pathlib import Path
+from starlette.applications import Starlette  # type: ignore
 from starlette.middleware.cors import CORSMiddleware  # type: ignore
+from starlette.routing import Mount, Route  # type: ignore
 from ariadne import load_schema_from_path, make_executable_schema  # type: ignore
-from ariadne.asgi import GraphQL  # type: ignore
+from app.config import QUERY_CACHE_SIZE, DEBUG_ENDPOINTS
 from app.api.queries import queries
 from app.api.mutations import mutations
+from app.api.subscriptions import subscriptions
 from app.api.types import types
 from app.api.directives import directives
+from app.api.context import Context
+from app.api.server import GraphQLApp
+from app.api.debug import pool_endpoint
+from app.api.metrics import MetricsExtension, metrics_endpoint
+from app.api.trace import extensions_for_request
+from app.startup import FirstResponseTimer, warm_up
 
 
-_schema_str = load_schema_from_path(str(Path("app") / "api"))
+_schema_str = load_schema_from_path(str(Path(__file__).parent / "api"))
 _schema = make_executable_schema(
-    _schema_str, *queries, *mutations, *types, directives=directives
+    _schema_str, *queries, *mutations, *subscriptions, *types, directives=directives
 )
 
-app = CORSMiddleware(
-    GraphQL(_schema),  # type: ignore
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+_graphql = GraphQLApp(
+    _schema,
+    context_value=Context,
+    query_cache_size=QUERY_CACHE_SIZE,
+    extensions=extensions_for_request([MetricsExtension]),
+)
+
+_routes = [Route("/metrics", metrics_endpoint)]
+if DEBUG_ENDPOINTS:
+    _routes.append(Route("/debug/pool", pool_endpoint))
+_routes.append(Mount("/", app=_graphql))
+
+app = FirstResponseTimer(
+    CORSMiddleware(
+        Starlette(routes=_routes, on_startup=[warm_up]),  # type: ignore
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 )
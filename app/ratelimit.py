@@ -0,0 +1,140 @@
+"""
+Rate limiting with token buckets in shared memory
+
+Login attempts are limited per email and per client IP before the user is looked up
+and the password is hashed,
+so that a client guessing passwords cannot keep all workers busy with bcrypt.
+Each bucket holds up to a burst of tokens and is refilled continuously at a rate per minute.
+An attempt takes one token from both the email's and the IP's bucket, without tokens it is rejected.
+A successful login gives the email's token back, so users logging in often dont lock themselves out.
+
+The buckets are a table in a memory-mapped file (`LOGIN_LIMITS_FILE`, under gunicorn in `/dev/shm`),
+so all workers on the machine share them. Every process maps the file on first use.
+Updates are serialized with a lock on the file (`fcntl.lockf`), they only take microseconds.
+The table has a fixed number of slots (`LOGIN_LIMITS_SLOTS`), keys are hashed into them.
+If all slots a key can use are taken, the least recently updated bucket is replaced,
+which only loses a limit if that bucket was not refilled completely yet.
+Disable the limits with `LOGIN_RATE_LIMIT=false` (e.g. for benchmarks which log in a lot).
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+from typing import Dict, NamedTuple, Optional
+from app.config import (
+    LOGIN_RATE_LIMIT,
+    LOGIN_EMAIL_BURST,
+    LOGIN_EMAIL_PER_MINUTE,
+    LOGIN_IP_BURST,
+    LOGIN_IP_PER_MINUTE,
+    LOGIN_LIMITS_FILE,
+    LOGIN_LIMITS_SLOTS,
+)
+
+_SLOT = struct.Struct("<Qdd")  # key hash, tokens, time of last update
+_PROBES = 8
+
+
+class Limit(NamedTuple):
+    """Bucket of `burst` tokens, refilled with `per_minute` tokens per minute"""
+
+    burst: float
+    per_minute: float
+
+
+class TokenBuckets:
+    """
+    Table of token buckets in a file, shared by all processes which map it
+
+    Args:
+        path: file of the table, created if it does not exist
+        slots: max number of buckets
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> mmap.mmap:
+        if self._map is None:
+            size = self.slots * _SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+            self._fd = fd
+        return self._map
+
+    def _slot(self, table: mmap.mmap, key: str) -> int:
+        """Offset of the bucket of `key`, a free or least recently updated one if it has none"""
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        start = key_hash % self.slots
+        oldest, oldest_updated = 0, float("inf")
+        for i in range(_PROBES):
+            offset = ((start + i) % self.slots) * _SLOT.size
+            slot_hash, _, updated = _SLOT.unpack_from(table, offset)
+            if slot_hash == key_hash:
+                return offset
+            if slot_hash == 0:
+                oldest = offset
+                break
+            if updated < oldest_updated:
+                oldest, oldest_updated = offset, updated
+        _SLOT.pack_into(table, oldest, key_hash, float("inf"), 0.0)
+        return oldest
+
+    def _update(self, buckets: Dict[str, Limit], tokens: float) -> Optional[str]:
+        table = self._open()
+        now = time.time()
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            slots = []
+            for key, limit in buckets.items():
+                offset = self._slot(table, key)
+                key_hash, available, updated = _SLOT.unpack_from(table, offset)
+                refill = max(now - updated, 0.0) * limit.per_minute / 60
+                available = min(available + refill, limit.burst)
+                if available + tokens < 0:
+                    return key
+                slots.append((offset, key_hash, min(available + tokens, limit.burst)))
+            for offset, key_hash, available in slots:
+                _SLOT.pack_into(table, offset, key_hash, available, now)
+            return None
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def take(self, buckets: Dict[str, Limit]) -> Optional[str]:
+        """Take a token from each bucket if all have one, otherwise return the first key without"""
+        return self._update(buckets, tokens=-1.0)
+
+    def give(self, buckets: Dict[str, Limit]):
+        """Give a token back to each bucket"""
+        self._update(buckets, tokens=1.0)
+
+
+EMAIL_LIMIT = Limit(burst=LOGIN_EMAIL_BURST, per_minute=LOGIN_EMAIL_PER_MINUTE)
+IP_LIMIT = Limit(burst=LOGIN_IP_BURST, per_minute=LOGIN_IP_PER_MINUTE)
+
+login_buckets = TokenBuckets(path=LOGIN_LIMITS_FILE, slots=LOGIN_LIMITS_SLOTS)
+
+
+def take_login_attempt(email: str, ip: str) -> Optional[str]:
+    """Count a login attempt, return "email" or "ip" if it exceeds that limit"""
+    if not LOGIN_RATE_LIMIT:
+        return None
+    limited = login_buckets.take(
+        {f"email:{email.strip().lower()}": EMAIL_LIMIT, f"ip:{ip}": IP_LIMIT}
+    )
+    return limited.split(":", 1)[0] if limited else None
+
+
+def return_login_attempt(email: str):
+    """Dont count a successful login attempt against the email's limit"""
+    if not LOGIN_RATE_LIMIT:
+        return
+    login_buckets.give({f"email:{email.strip().lower()}": EMAIL_LIMIT})
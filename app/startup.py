@@ -0,0 +1,109 @@
+"""
+Worker startup
+
+With `PRELOAD_APP` gunicorn imports the app (schema, engines, caches) once in the master process.
+Workers are forked from it and share that memory copy-on-write.
+Connections must not be shared between processes, so each worker drops the pools it inherited
+right after the fork (`after_fork()`, gunicorn's `post_fork` hook), without closing them for the master.
+Listener threads are started per process on first use anyway.
+
+Before a worker accepts requests it opens `DB_POOL_WARM` connections per pool it serves requests with
+(`warm_up()`, app startup event), so that its first requests dont wait for connecting.
+It also starts its password hash pool (see `app.auth`), whose processes are not forked from the worker,
+and the cache listeners, waiting up to `CACHE_LISTEN_TIMEOUT` seconds until they receive invalidations
+(caches stay cold until then, see `app.db.cache`).
+The time from worker start to its first response is logged and observed in `worker_cold_start_seconds`.
+"""
+import asyncio
+import logging
+import time
+from app.config import SQLALCHEMY_ASYNC, DB_POOL_WARM
+from app.auth import start_hash_pool
+from app.api.results import items_cache
+from app.db.cache import USERS_CHANNEL, user_cache
+from app.db.notify import is_listening
+from app.db.base import engine, async_engine
+from app.db.pool import warm_up as warm_up_sync, warm_up_async
+from app.db.replicas import replicas
+from app.api.metrics import COLD_START
+
+_log = logging.getLogger(__name__)
+
+_started = time.perf_counter()
+
+
+def after_fork():
+    """Drop pools inherited from the parent process, start cold start timer"""
+    global _started  # pylint: disable=global-statement
+    _started = time.perf_counter()
+    engines = [engine, async_engine.sync_engine if async_engine else None]
+    for replica in replicas.replicas:
+        engines.append(replica.engine)
+        engines.append(replica.async_engine.sync_engine if replica.async_engine else None)
+    for db_engine in engines:
+        if db_engine is not None:
+            db_engine.dispose(close=False)
+
+
+CACHE_LISTEN_TIMEOUT = 5.0
+
+
+async def start_cache_listeners():
+    """Listen for cache invalidations, wait until the listener is established"""
+    items_cache.start()
+    user_cache.start()
+    deadline = time.monotonic() + CACHE_LISTEN_TIMEOUT
+    while not (items_cache.ready and (user_cache.ttl <= 0 or is_listening(USERS_CHANNEL))):
+        if time.monotonic() > deadline:
+            _log.warning("Cache listener not established, caches stay cold until it is")
+            return
+        await asyncio.sleep(0.01)
+
+
+async def warm_up():
+    """Open connections of the pools which serve requests, a failing database is only logged"""
+    start = time.perf_counter()
+    await start_hash_pool()
+    _log.info("Started hash pool in %.3fs", time.perf_counter() - start)
+    start = time.perf_counter()
+    await start_cache_listeners()
+    _log.info("Started cache listeners in %.3fs", time.perf_counter() - start)
+    start = time.perf_counter()
+    pools = [(engine, async_engine)]
+    pools.extend((d.engine, d.async_engine) for d in replicas.replicas)
+    for db_engine, async_db_engine in pools:
+        try:
+            if SQLALCHEMY_ASYNC:
+                await warm_up_async(async_db_engine, DB_POOL_WARM)
+            else:
+                warm_up_sync(db_engine, DB_POOL_WARM)
+        except Exception:  # pylint: disable=broad-except
+            _log.warning("Could not warm up pool of %r", db_engine.url, exc_info=True)
+    _log.info("Warmed up pools in %.3fs", time.perf_counter() - start)
+
+
+class FirstResponseTimer:
+    """ASGI middleware which measures the time from worker start to the first response"""
+
+    def __init__(self, app):
+        self.app = app
+        self.done = False
+
+    async def __call__(self, scope, receive, send):
+        if self.done or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_measure(message):
+            await send(message)
+            if (
+                not self.done
+                and message["type"] == "http.response.body"
+                and not message.get("more_body", False)
+            ):
+                self.done = True
+                seconds = time.perf_counter() - _started
+                COLD_START.observe(seconds)
+                _log.info("First response %.3fs after worker start", seconds)
+
+        await self.app(scope, receive, send_and_measure)
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of JSON response encoders
+
+Builds an `items` result with many items (like `items {edges {cursor node {... owner {name}}}}`)
+and measures how long it takes to serialize their dates (`Date` scalar) and to encode the result
+with starlette's `JSONResponse` (the previous response path), the standard library
+and orjson encoders of `app.api.encoding`, each also streamed (`iterencode()`).
+Times are the best of `--repeat` runs, peak memory is measured in a separate run (tracemalloc).
+"""
+import argparse
+import base64
+import datetime as dt
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+from starlette.responses import JSONResponse  # type: ignore
+from app.api.encoding import OrjsonEncoder, StdlibJSONEncoder
+from benchmarks.seed import ADJECTIVES, WORDS
+
+
+def _text(rng: random.Random, n: int) -> str:
+    return " ".join(f"{rng.choice(ADJECTIVES)} {rng.choice(WORDS)}" for _ in range(n))
+
+
+def dates(n: int, random_seed: int = 42) -> List[dt.date]:
+    rng = random.Random(random_seed)
+    return [dt.date(2000, 1, 1) + dt.timedelta(days=rng.randint(0, 7300)) for _ in range(n)]
+
+
+def result(posted_on: List[str], random_seed: int = 42) -> dict:
+    """Result of an items query with one item per date"""
+    rng = random.Random(random_seed)
+    edges = []
+    for i, date in enumerate(posted_on):
+        cursor = base64.urlsafe_b64encode(f"{date}|{i}".encode()).decode()
+        node = {
+            "id": str(i),
+            "title": _text(rng, 1),
+            "description": _text(rng, rng.randint(1, 8)),
+            "postedOn": date,
+            "owner": {"name": f"Bench User {i % 1000}"},
+        }
+        edges.append({"cursor": cursor, "node": node})
+    return {"data": {"items": {"edges": edges, "pageInfo": {"hasNextPage": False}}}}
+
+
+def best_of(fun: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """Best time in ms and number of bytes of `fun()`"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = fun()
+        times.append(time.perf_counter() - start)
+    return {"ms": min(times) * 1000, "bytes": size}
+
+
+def peak_memory(fun: Callable[[], int]) -> float:
+    """Peak memory in MB allocated while running `fun()`"""
+    tracemalloc.start()
+    try:
+        fun()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def main(items: int, repeat: int, chunk_size: int):
+    posted_on = dates(items)
+    content = result([d.isoformat() for d in posted_on])
+    json_encoder, orjson_encoder = StdlibJSONEncoder(), OrjsonEncoder()
+
+    def streamed(encoder) -> Callable[[], int]:
+        return lambda: sum(len(d) for d in encoder.iterencode(content, chunk_size))
+
+    date_benchmarks = {
+        "Date strftime": lambda: len([d.strftime("%Y-%m-%d") for d in posted_on]),
+        "Date isoformat": lambda: len([d.isoformat() for d in posted_on]),
+    }
+    encoder_benchmarks = {
+        "starlette JSONResponse": lambda: len(JSONResponse(content).body),
+        "json": lambda: len(json_encoder.dumps(content)),
+        "json streamed": streamed(json_encoder),
+        "orjson": lambda: len(orjson_encoder.dumps(content)),
+        "orjson streamed": streamed(orjson_encoder),
+    }
+
+    print(f"{items} items, best of {repeat}")
+    print(f"{'':<24}{'ms':>10}")
+    for name, fun in date_benchmarks.items():
+        print(f"{name:<24}{best_of(fun, repeat)['ms']:>10.1f}")
+    print(f"\n{'':<24}{'ms':>10}{'MB':>10}{'MB/s':>10}{'peak MB':>10}")
+    for name, fun in encoder_benchmarks.items():
+        res = best_of(fun, repeat)
+        size = res["bytes"] / 1e6
+        rate = size / res["ms"] * 1000
+        print(f"{name:<24}{res['ms']:>10.1f}{size:>10.1f}{rate:>10.0f}{peak_memory(fun):>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+    main(items=args.items, repeat=args.repeat, chunk_size=args.chunk_size)
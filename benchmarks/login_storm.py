@@ -0,0 +1,83 @@
+"""
+Latency of `me` and `items` queries during a login storm
+
+First, `me` and `items` are queried sequentially for some seconds.
+Then the same is done while other threads constantly log in.
+Percentiles of both phases are printed.
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+import requests
+
+host = os.environ.get("HOST", "http://localhost:8000")
+
+LOGIN = """mutation {
+  login(input: { email: "active.harry@gmail.com", password: "asdf1" }) { token }
+}"""
+ME = """query { me { name items { edges { node { title } } } } }"""
+ITEMS = """query { items { edges { node { title owner { name } } } } }"""
+
+
+def query(querystr: str, jwt: str = None) -> dict:
+    headers = {} if jwt is None else {"Authorization": f"Bearer {jwt}"}
+    res = requests.post(host + "/", json={"query": querystr}, headers=headers)
+    return res.json()
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) < 2:
+        worst = max(latencies, default=0.0) * 1000
+        return {"p50": worst, "p95": worst, "n": len(latencies)}
+    qs = statistics.quantiles(latencies, n=100)
+    return {"p50": qs[49] * 1000, "p95": qs[94] * 1000, "n": len(latencies)}
+
+
+def measure(seconds: float, jwt: str) -> Dict[str, Dict[str, float]]:
+    """query me and items sequentially for some seconds"""
+    latencies: Dict[str, List[float]] = {"me": [], "items": []}
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        for name, querystr in (("me", ME), ("items", ITEMS)):
+            start = time.monotonic()
+            query(querystr, jwt=jwt)
+            latencies[name].append(time.monotonic() - start)
+    return {k: percentiles(d) for k, d in latencies.items()}
+
+
+def login_storm(stop: threading.Event) -> int:
+    n = 0
+    while not stop.is_set():
+        query(LOGIN)
+        n += 1
+    return n
+
+
+def main(seconds: float, logins: int):
+    jwt = query(LOGIN)["data"]["login"]["token"]
+
+    print(f"measuring for {seconds}s without logins")
+    print(" ", measure(seconds=seconds, jwt=jwt))
+
+    print(f"measuring for {seconds}s with {logins} concurrent clients logging in")
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=logins) as pool:
+        futures = [pool.submit(login_storm, stop) for _ in range(logins)]
+        try:
+            print(" ", measure(seconds=seconds, jwt=jwt))
+        finally:
+            stop.set()
+        n = sum(d.result() for d in futures)
+    print(f"  {n} logins ({n / seconds:.1f}/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--logins", type=int, default=8)
+    args = parser.parse_args()
+    main(seconds=args.seconds, logins=args.logins)
@@ -0,0 +1,103 @@
+"""
+Seed the database with a large, reproducible dataset
+
+Drops and recreates all tables (like `tests.conftest.reset_testdata()`),
+then inserts users and items in bulk through `app.db.models`.
+Users are `bench<i>@example.com` with password `bench`.
+Titles, descriptions and dates are drawn from a seeded random generator,
+so the same arguments always create the same dataset.
+"""
+import argparse
+import datetime as dt
+import random
+import time
+from typing import List
+from sqlalchemy.orm.session import close_all_sessions  # type: ignore
+from app.auth import hash_password
+from app.db.base import SessionFact, engine
+from app.db.cache import notify_user_changed
+import app.db.models as models
+
+PASSWORD = "bench"
+
+WORDS = """shampoo hairbrush pen apple towel comb lamp chair table guitar bicycle camera
+kettle blanket mirror clock wallet backpack umbrella notebook scarf helmet pillow vase""".split()
+ADJECTIVES = """old new red blue wooden shiny broken vintage small large cheap fancy
+green soft heavy light""".split()
+
+
+def email(i: int) -> str:
+    return f"bench{i}@example.com"
+
+
+def _text(rng: random.Random, n: int) -> str:
+    return " ".join(
+        f"{rng.choice(ADJECTIVES)} {rng.choice(WORDS)}" for _ in range(n)
+    ).capitalize()
+
+
+def seed(users: int, items_per_user: int, random_seed: int = 42, batch: int = 5000):
+    """Recreate tables with `users` users owning `items_per_user` items each"""
+    rng = random.Random(random_seed)
+    hashed = hash_password(PASSWORD)
+
+    close_all_sessions()
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionFact()
+    try:
+        db.bulk_insert_mappings(
+            models.User,
+            [
+                {
+                    "name": f"Bench User {i}",
+                    "email": email(i),
+                    "hashedPassword": hashed,
+                    "isActive": True,
+                    "isSuperuser": i == 0,
+                }
+                for i in range(users)
+            ],
+        )
+        db.flush()
+        user_ids = [d for d, in db.query(models.User.id).order_by(models.User.id)]
+
+        first_day = dt.date(2000, 1, 1)
+        rows: List[dict] = []
+        for user_id in user_ids:
+            for _ in range(items_per_user):
+                rows.append(
+                    {
+                        "ownerId": user_id,
+                        "title": _text(rng, 1),
+                        "description": _text(rng, rng.randint(1, 8)),
+                        "postedOn": first_day + dt.timedelta(days=rng.randint(0, 7300)),
+                    }
+                )
+                if len(rows) >= batch:
+                    db.bulk_insert_mappings(models.Item, rows)
+                    rows = []
+        db.bulk_insert_mappings(models.Item, rows)
+
+        notify_user_changed(db=db)  # invalidate user caches of running app
+        db.commit()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--items-per-user", type=int, default=20)
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    seed(
+        users=args.users,
+        items_per_user=args.items_per_user,
+        random_seed=args.random_seed,
+    )
+    n_items = args.users * args.items_per_user
+    print(f"seeded {args.users} users, {n_items} items in {time.monotonic() - start:.1f}s")
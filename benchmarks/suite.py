@@ -0,0 +1,331 @@
+"""
+Benchmark suite of GraphQL operations
+
+Runs scenarios (`me`, `items` with filters, `items` with nested `owner`,
+`login`, `createItem`) with concurrent clients for some seconds each,
+either in-process against the ASGI app (`--target asgi`) or over HTTP
+against a running app (`--target http`, `HOST`).
+Expects a dataset seeded by `benchmarks.seed`.
+
+For each scenario latency percentiles (p50, p95, p99), requests per second,
+errors and SQL statements per operation are reported.
+Statements are counted once per scenario with the SQL trace (`X-SQL-Trace` header),
+so the app needs `DEBUG_ENDPOINTS` enabled.
+
+Results are compared with a stored baseline (`--baseline`).
+A scenario regressed if its p95 latency rose or its RPS dropped by more than
+`--threshold`, or if it needs more statements.
+The exit code is 1 if any scenario regressed.
+Save a baseline on the reference machine with `--save-baseline`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import requests
+from benchmarks.seed import ADJECTIVES, PASSWORD, WORDS, email
+
+host = os.environ.get("HOST", "http://localhost:8000")
+
+DEFAULT_BASELINE = Path(__file__).parent / "baseline.json"
+
+LOGIN = """mutation Login($email: String!, $password: String!) {
+  login(input: { email: $email, password: $password }) { token }
+}"""
+ME = """query Me { me { name items { edges { node { title } } } } }"""
+ITEMS_FILTERED = """query ItemsFiltered($filter: ItemsFilterInput) {
+  items(filter: $filter) { edges { node { id title postedOn } } }
+}"""
+ITEMS_NESTED = """query ItemsNested($after: String) {
+  items(first: 50, after: $after) { edges { node { title owner { name } } } }
+}"""
+CREATE_ITEM = """mutation CreateItem($input: CreateItemInput!) {
+  createItem(input: $input) { id }
+}"""
+
+Payload = Dict[str, Any]
+
+
+class Client:
+    """Posts GraphQL payloads, returns status and JSON response"""
+
+    async def post(self, payload: Payload, headers: Dict[str, str]) -> Tuple[int, dict]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ASGIClient(Client):
+    """Calls the ASGI app in this process"""
+
+    def __init__(self):
+        from app.main import app  # pylint: disable=import-outside-toplevel
+
+        self.app = app
+
+    async def post(self, payload: Payload, headers: Dict[str, str]) -> Tuple[int, dict]:
+        body = json.dumps(payload).encode()
+        raw_headers = [(b"content-type", b"application/json")]
+        raw_headers.extend((k.lower().encode(), v.encode()) for k, v in headers.items())
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/",
+            "raw_path": b"/",
+            "root_path": "",
+            "query_string": b"",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 10000),
+            "server": ("benchmark", 80),
+        }
+        received = False
+        status = 0
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await asyncio.Event().wait()  # never disconnects
+            return {}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return status, json.loads(b"".join(chunks))
+
+
+class HTTPClient(Client):
+    """Posts to a running app, blocking requests run in threads"""
+
+    def __init__(self, concurrency: int):
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.local = threading.local()
+
+    def _post(self, payload: Payload, headers: Dict[str, str]) -> Tuple[int, dict]:
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        res = self.local.session.post(host + "/", json=payload, headers=headers)
+        return res.status_code, res.json()
+
+    async def post(self, payload: Payload, headers: Dict[str, str]) -> Tuple[int, dict]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.pool, self._post, payload, headers)
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class Scenario:
+    """
+    Operation with randomized variables
+
+    Args:
+        name: name in reports
+        query: operation
+        variables: creates variables from a random generator
+        authenticated: send token of a benchmark user
+    """
+
+    def __init__(
+        self,
+        name: str,
+        query: str,
+        variables: Callable[[random.Random], dict] = lambda _: {},
+        authenticated: bool = False,
+    ):
+        self.name = name
+        self.query = query
+        self.variables = variables
+        self.authenticated = authenticated
+
+
+SCENARIOS = [
+    Scenario("me", ME, authenticated=True),
+    Scenario(
+        "items_filtered",
+        ITEMS_FILTERED,
+        variables=lambda rng: {
+            "filter": {"titleLike": f"{rng.choice(ADJECTIVES)} {rng.choice(WORDS)}"}
+        },
+    ),
+    Scenario("items_nested_owner", ITEMS_NESTED),
+    Scenario(
+        "login",
+        LOGIN,
+        variables=lambda rng: {"email": email(rng.randrange(10)), "password": PASSWORD},
+    ),
+    Scenario(
+        "create_item",
+        CREATE_ITEM,
+        variables=lambda rng: {
+            "input": {"title": f"Bench {rng.choice(WORDS)}", "postedOn": "2020-01-01"}
+        },
+        authenticated=True,
+    ),
+]
+
+
+def percentile(latencies: List[float], p: int) -> float:
+    """p-th percentile in milliseconds"""
+    if len(latencies) < 2:
+        return max(latencies, default=0.0) * 1000
+    return statistics.quantiles(latencies, n=100)[p - 1] * 1000
+
+
+async def count_statements(client: Client, scenario: Scenario, headers: dict) -> int:
+    """SQL statements of one operation of scenario"""
+    payload = {"query": scenario.query, "variables": scenario.variables(random.Random(0))}
+    _, res = await client.post(payload, {**headers, "X-SQL-Trace": "1"})
+    trace = res.get("extensions", {}).get("sqlTrace")
+    if trace is None:
+        raise RuntimeError("No SQL trace in response, enable DEBUG_ENDPOINTS on the app")
+    return trace["count"]
+
+
+async def run_scenario(
+    client: Client, scenario: Scenario, token: str, concurrency: int, seconds: float
+) -> dict:
+    """Run scenario with concurrent clients, report latencies, RPS and statements"""
+    headers = {"Authorization": f"Bearer {token}"} if scenario.authenticated else {}
+    statements = await count_statements(client, scenario, headers)
+
+    latencies: List[float] = []
+    errors = 0
+    end = time.monotonic() + seconds
+
+    async def worker(i: int):
+        nonlocal errors
+        rng = random.Random(i)
+        while time.monotonic() < end:
+            payload = {"query": scenario.query, "variables": scenario.variables(rng)}
+            start = time.perf_counter()
+            status, res = await client.post(payload, headers)
+            latencies.append(time.perf_counter() - start)
+            if status != 200 or "errors" in res:
+                errors += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(worker(d) for d in range(concurrency)))
+    elapsed = time.monotonic() - start
+    return {
+        "n": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "statements": statements,
+    }
+
+
+def regressions(result: dict, baseline: dict, threshold: float) -> List[str]:
+    """Descriptions of metrics of result which regressed compared to baseline"""
+    found = []
+    if result["p95"] > baseline["p95"] * (1 + threshold):
+        found.append(f"p95 {baseline['p95']:.1f}ms -> {result['p95']:.1f}ms")
+    if result["rps"] < baseline["rps"] * (1 - threshold):
+        found.append(f"rps {baseline['rps']:.1f} -> {result['rps']:.1f}")
+    if result["statements"] > baseline["statements"]:
+        found.append(f"statements {baseline['statements']} -> {result['statements']}")
+    return found
+
+
+async def run(
+    target: str, scenarios: List[Scenario], concurrency: int, seconds: float
+) -> Dict[str, dict]:
+    client: Client = ASGIClient() if target == "asgi" else HTTPClient(concurrency)
+    try:
+        variables = {"email": email(1), "password": PASSWORD}
+        _, res = await client.post({"query": LOGIN, "variables": variables}, {})
+        if "errors" in res:
+            raise RuntimeError(f"Login failed, seed the database first: {res['errors']}")
+        token = res["data"]["login"]["token"]
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = await run_scenario(
+                client, scenario, token=token, concurrency=concurrency, seconds=seconds
+            )
+        return results
+    finally:
+        client.close()
+
+
+def main(
+    target: str,
+    names: Optional[List[str]],
+    concurrency: int,
+    seconds: float,
+    baseline_path: Path,
+    save_baseline: bool,
+    threshold: float,
+) -> int:
+    scenarios = [d for d in SCENARIOS if names is None or d.name in names]
+    results = asyncio.get_event_loop().run_until_complete(
+        run(target=target, scenarios=scenarios, concurrency=concurrency, seconds=seconds)
+    )
+
+    baselines: Dict[str, dict] = {}
+    if baseline_path.exists():
+        baselines = json.loads(baseline_path.read_text()).get(target, {})
+
+    failed = False
+    print(f"{'scenario':<20}{'n':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>5}")
+    for name, res in results.items():
+        print(
+            f"{name:<20}{res['n']:>7}{res['errors']:>6}{res['rps']:>9.1f}"
+            f"{res['p50']:>9.1f}{res['p95']:>9.1f}{res['p99']:>9.1f}{res['statements']:>5}"
+        )
+        if name in baselines:
+            for regression in regressions(res, baselines[name], threshold=threshold):
+                print(f"  REGRESSION {regression}")
+                failed = True
+
+    if save_baseline:
+        stored = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        stored[target] = {**stored.get(target, {}), **results}
+        baseline_path.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"saved baseline to {baseline_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target", choices=("asgi", "http"), default="asgi")
+    parser.add_argument("--scenario", action="append", dest="names")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    sys.exit(
+        main(
+            target=args.target,
+            names=args.names,
+            concurrency=args.concurrency,
+            seconds=args.seconds,
+            baseline_path=args.baseline,
+            save_baseline=args.save_baseline,
+            threshold=args.threshold,
+        )
+    )
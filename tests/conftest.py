@@ -8,7 +8,9 @@ Overwrite with environment var `HOST`.
 """
 import os
 import datetime as dt
+import pytest  # type: ignore
 import requests
+from sqlalchemy import text  # type: ignore
 from sqlalchemy.orm.session import close_all_sessions  # type: ignore
 from app.db.base import SessionFact, engine
 import app.db.models as models
@@ -17,17 +19,35 @@ host = os.environ.get("HOST", "http://localhost:8000")
 db = SessionFact()
 
 
-def query(querystr: str, jwt: str = None) -> requests.Response:
-    """Query GraphQL API, paste query string from GraphiQL"""
+def query(querystr: str, jwt: str = None, trace: bool = False) -> requests.Response:
+    """Query GraphQL API, paste query string from GraphiQL, trace adds SQL trace"""
+    headers = {}
     if jwt is not None:
-        headers = {"Authorization": f"Bearer {jwt}"}
-    else:
-        headers = {}
+        headers["Authorization"] = f"Bearer {jwt}"
+    if trace:
+        headers["X-SQL-Trace"] = "1"
     return requests.post(
         host + "/", json={"query": querystr}, headers=headers, timeout=1
     )
 
 
+@pytest.fixture
+def assert_max_queries():
+    """Query and assert that the operation executed at most `max_queries` SQL statements"""
+
+    def check(querystr: str, max_queries: int, jwt: str = None) -> dict:
+        res = query(querystr, jwt=jwt, trace=True).json()
+        trace = res["extensions"]["sqlTrace"]
+        statements = "\n".join(f"{d['path']}: {d['sql']}" for d in trace["statements"])
+        assert trace["count"] <= max_queries, (
+            f"{trace['count']} statements (max {max_queries}):\n{statements}"
+        )
+        assert not trace["repeated"], f"repeated statements:\n{statements}"
+        return res
+
+    return check
+
+
 def reset_testdata():
     print("resetting testdata")
     close_all_sessions()
@@ -89,6 +109,8 @@ def reset_testdata():
         ]
     )
 
+    # invalidate user caches of running app (like app.db.cache.notify_user_changed)
+    db.execute(text("SELECT pg_notify('users_changed', '')"))
     db.commit()
     db.close()
 
@@ -0,0 +1,104 @@
+import time
+import uuid
+import datetime as dt
+from tests.conftest import query, db
+from tests.test_items import user_login
+import app.db.crud as crud
+from app.api.results import LocalBackend, ResultCache
+from app.db.cache import USERS_CHANNEL, UserCache
+from app.db.notify import is_listening
+
+
+def query_my_name(token: str) -> str:
+    res = query("""query {me {name}}""", jwt=token)
+    return res.json()["data"]["me"]["name"]
+
+
+def test_cached_user_is_invalidated_when_changed_by_another_process():
+    token = user_login()
+    assert query_my_name(token) == "Active Harry"
+    assert query_my_name(token) == "Active Harry"
+
+    user = crud.get_user_by_email(db=db, email="active.harry@gmail.com")
+    try:
+        crud.update_user(db=db, user=user, name="Renamed Harry", isActive=crud.Undefined)
+        time.sleep(0.1)
+        assert query_my_name(token) == "Renamed Harry"
+    finally:
+        crud.update_user(db=db, user=user, name="Active Harry", isActive=crud.Undefined)
+        db.close()
+
+
+def test_cached_items_are_invalidated_by_another_process():
+    querystr = """query {items(first: 1) {edges {node {title}}}}"""
+
+    def first_title() -> str:
+        return query(querystr).json()["data"]["items"]["edges"][0]["node"]["title"]
+
+    assert first_title() == "Susi's apple"
+    assert first_title() == "Susi's apple"
+
+    db_item = crud.create_item(
+        db=db, ownerId=3, postedOn=dt.date(2002, 1, 1), title="Susi's pear"
+    )
+    try:
+        time.sleep(0.1)
+        assert first_title() == "Susi's pear"
+    finally:
+        crud.delete_item(db=db, id=db_item.id)
+        db.close()
+
+
+class SharedBackend(LocalBackend):
+    shared = True  # no notifications needed
+
+
+def test_results_read_before_an_invalidation_are_not_hit():
+    cache = ResultCache(name="test", backend=SharedBackend(size=10), ttl=60, channel="test")
+    key = cache.key("items", {"first": 1}, tags=["items"])
+    assert cache.get(key) is None
+    cache.invalidate(tags=["items"])  # e.g. notification while rows are read
+    cache.put(key, ["old rows"])
+    assert cache.get(cache.key("items", {"first": 1}, tags=["items"])) is None
+
+    key = cache.key("items", {"first": 1}, tags=["items"])
+    cache.put(key, ["new rows"])
+    assert cache.get(cache.key("items", {"first": 1}, tags=["items"])) == ["new rows"]
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_users_read_before_an_invalidation_are_not_cached():
+    cache = UserCache(size=10, ttl=60)
+    cache.start()
+    wait_until(lambda: is_listening(USERS_CHANNEL))
+    user = crud.get_user_by_email(db=db, email="active.harry@gmail.com")
+    try:
+        generation = cache.generation()
+        assert cache.get(db=db, id=user.id) is None
+        cache.invalidate(id=user.id)  # e.g. notification while the user is read
+        cache.put(user, generation=generation)
+        assert cache.get(db=db, id=user.id) is None
+
+        cache.put(user, generation=cache.generation())
+        assert cache.get(db=db, id=user.id) is user
+    finally:
+        db.close()
+
+
+def test_result_caches_are_cold_until_they_receive_invalidations():
+    cache = ResultCache(
+        name="test", backend=LocalBackend(size=10), ttl=60, channel=f"test_{uuid.uuid4().hex}"
+    )
+    key = cache.key("items", {"first": 1}, tags=["items"])  # starts listening
+    if not cache.ready:
+        cache.put(key, ["rows"])
+        assert cache.get(key) is None
+    wait_until(lambda: cache.ready)
+    cache.put(key, ["rows"])
+    assert cache.get(key) == ["rows"]
@@ -0,0 +1,90 @@
+import uuid
+import datetime as dt
+from contextlib import contextmanager
+from sqlalchemy import event  # type: ignore
+from tests.conftest import db
+from app.db.base import engine
+import app.db.crud as crud
+
+
+@contextmanager
+def count_statements():
+    statements: list = []
+
+    def before_cursor_execute(*args, **_):
+        statements.append(args[2])
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_writes_need_a_single_statement():
+    email = f"{uuid.uuid4().hex}@example.com"
+    try:
+        with count_statements() as statements:
+            user = crud.create_user(db=db, email=email, name="Tom", hashedPassword="x")
+        assert len(statements) == 1
+        assert user.email == email
+
+        with count_statements() as statements:
+            user = crud.update_user(db=db, user=user, name="Tim", isActive=crud.Undefined)
+        assert len(statements) == 1
+        assert user.name == "Tim"
+
+        with count_statements() as statements:
+            item = crud.create_item(
+                db=db, ownerId=user.id, postedOn=dt.date(2001, 1, 1), title="Tim's hat"
+            )
+        assert len(statements) == 1
+        assert item.ownerId == user.id
+
+        with count_statements() as statements:
+            item = crud.update_item(
+                db=db,
+                ownerId=user.id,
+                itemId=item.id,
+                title="Tim's cap",
+                description=crud.Undefined,
+                postedOn=crud.Undefined,
+            )
+        assert len(statements) == 1
+        assert item.title == "Tim's cap"
+
+        with count_statements() as statements:
+            item = crud.update_item(
+                db=db,
+                ownerId=user.id,
+                itemId=item.id,
+                title=crud.Undefined,
+                description=crud.Undefined,
+                postedOn=crud.Undefined,
+            )
+        assert [d.split()[0] for d in statements] == ["SELECT"]  # no write, no notification
+        assert item.title == "Tim's cap"
+
+        with count_statements() as statements:
+            assert crud.delete_item(db=db, id=item.id) is True
+        assert len(statements) == 1
+
+        other = crud.create_item(db=db, ownerId=user.id, postedOn=dt.date(2001, 1, 1))
+        with count_statements() as statements:
+            assert crud.delete_user(db=db, id=user.id) == [other.id]
+        assert len(statements) == 1
+    finally:
+        db.close()
+
+
+def test_existing_email_is_rejected_without_select():
+    with count_statements() as statements:
+        try:
+            crud.create_user(
+                db=db, email="active.harry@gmail.com", name="Harry", hashedPassword="x"
+            )
+            assert False, "existing email was not rejected"
+        except ValueError as err:
+            assert "already exists" in str(err)
+    assert len(statements) == 1
+    db.close()
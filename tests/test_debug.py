@@ -0,0 +1,14 @@
+import requests
+from tests.conftest import host, query
+
+
+def test_pool_statistics_are_shown_per_worker():
+    query("""query {items(first: 1) {edges {node {title}}}}""")
+    res = requests.get(host + "/debug/pool", timeout=1).json()
+    assert isinstance(res["pid"], int)
+    for stats in res["pools"].values():
+        assert stats["checkedOut"] >= 0
+        assert stats["overflow"] >= 0
+        assert stats["checkouts"] >= stats["timeouts"]
+        assert stats["avgWaitSeconds"] <= stats["maxWaitSeconds"]
+    assert sum(d["checkouts"] for d in res["pools"].values()) > 0
@@ -0,0 +1,29 @@
+import json
+import datetime as dt
+from app.api.encoding import OrjsonEncoder, StdlibJSONEncoder
+
+RESULT = {
+    "data": {
+        "items": {
+            "edges": [
+                {"node": {"title": f"Item ü{i}", "postedOn": "2021-01-01"}} for i in range(50)
+            ],
+            "pageInfo": {"hasNextPage": False, "endCursor": None},
+        }
+    }
+}
+
+
+def test_streamed_encoding_equals_encoding_at_once():
+    for encoder in (StdlibJSONEncoder(), OrjsonEncoder()):
+        encoded = encoder.dumps(RESULT)
+        assert json.loads(encoded) == RESULT
+        for chunk_size in (1, 7, 50, 100):
+            assert b"".join(encoder.iterencode(RESULT, chunk_size)) == encoded
+
+
+def test_dates_are_encoded_as_iso_strings():
+    obj = {"day": dt.date(2021, 3, 4), "time": dt.datetime(2021, 3, 4, 5, 6, 7)}
+    for encoder in (StdlibJSONEncoder(), OrjsonEncoder()):
+        decoded = json.loads(encoder.dumps(obj))
+        assert decoded == {"day": "2021-03-04", "time": "2021-03-04T05:06:07"}
@@ -0,0 +1,65 @@
+import json
+from typing import List
+import requests
+from tests.conftest import host, query
+
+ITEMS = """{
+  items(first: 4) {
+    edges %s {node {title ... on Item %s {owner {name}}}}
+    pageInfo {hasNextPage endCursor}
+  }
+}"""
+
+
+def multipart_query(querystr: str) -> requests.Response:
+    headers = {"Accept": "multipart/mixed"}
+    return requests.post(host + "/", json={"query": querystr}, headers=headers, timeout=1)
+
+
+def parts(res: requests.Response) -> List[dict]:
+    assert res.headers["content-type"].startswith("multipart/mixed")
+    body = res.content.decode()
+    assert body.endswith("\r\n-----\r\n")
+    body = body[: -len("\r\n-----\r\n")]
+    return [json.loads(d.split("\r\n\r\n", 1)[1]) for d in body.split("\r\n---\r\n")[1:]]
+
+
+def merge(data: dict, path: list, value):
+    for key in path[:-1]:
+        data = data[key]
+    if isinstance(value, dict):
+        data[path[-1]].update(value)
+    else:
+        data[path[-1]:] = value
+
+
+def test_deferred_fragments_and_streamed_edges_are_sent_later():
+    complete = query(ITEMS % ("", "")).json()["data"]
+    res = multipart_query(ITEMS % ("@stream(initialCount: 1)", '@defer(label: "owner")'))
+    initial, *subsequent, final = parts(res)
+
+    assert initial["hasNext"] is True
+    assert len(initial["data"]["items"]["edges"]) == 1
+    assert "owner" not in initial["data"]["items"]["edges"][0]["node"]
+    assert initial["data"]["items"]["pageInfo"] == complete["items"]["pageInfo"]
+    assert final == {"hasNext": False}
+
+    data = initial["data"]
+    for payload in (d for part in subsequent for d in part["incremental"]):
+        if "items" in payload:
+            merge(data, payload["path"], payload["items"])
+        else:
+            assert payload["label"] == "owner"
+            merge(data, payload["path"], payload["data"])
+    assert data == complete
+
+
+def test_incremental_delivery_needs_multipart_accept_header():
+    complete = query(ITEMS % ("", "")).json()
+    res = query(ITEMS % ("@stream(initialCount: 1)", "@defer"))
+    assert res.headers["content-type"] == "application/json"
+    assert res.json()["data"] == complete["data"]
+
+    res = multipart_query(ITEMS % ("", ""))
+    assert res.headers["content-type"] == "application/json"
+    assert res.json()["data"] == complete["data"]
@@ -0,0 +1,167 @@
+from tests.conftest import query
+
+
+def user_login(email: str = "active.harry@gmail.com", password: str = "asdf1"):
+    querystr = f"""mutation {{
+    login(input: {{ email: "{email}", password: "{password}" }}) {{
+        token
+    }}}}"""
+    res = query(querystr)
+    data = res.json()["data"]
+    return data["login"]["token"]
+
+
+def test_items_are_shown_with_their_owners():
+    res = query("""query {items {edges {node {title, owner {name}}}}}""")
+    edges = res.json()["data"]["items"]["edges"]
+    owners = {d["node"]["title"]: d["node"]["owner"]["name"] for d in edges}
+    assert owners == {
+        "Harry's shampoo": "Active Harry",
+        "Harry's hairbrush": "Active Harry",
+        "Joe's pen": "Inactive Joe",
+        "Susi's apple": "Super Susi",
+    }
+
+
+def test_my_items_and_their_owners_are_resolved_together():
+    token = user_login()
+    res = query(
+        """query {me {name, items {edges {node {title, owner {name, items {title}}}}}}}""",
+        jwt=token,
+    )
+    me = res.json()["data"]["me"]
+    items = [d["node"] for d in me["items"]["edges"]]
+    assert {d["title"] for d in items} == {"Harry's shampoo", "Harry's hairbrush"}
+    for item in items:
+        assert item["owner"]["name"] == me["name"]
+        assert {d["title"] for d in item["owner"]["items"]} == {
+            "Harry's shampoo",
+            "Harry's hairbrush",
+        }
+
+
+def test_items_are_paginated_newest_first():
+    querystr = """query {items(first: 3%s) {
+        edges {node {title}}
+        pageInfo {hasNextPage, endCursor}
+    }}"""
+    res = query(querystr % "")
+    page = res.json()["data"]["items"]
+    assert [d["node"]["title"] for d in page["edges"]] == [
+        "Susi's apple",
+        "Joe's pen",
+        "Harry's hairbrush",
+    ]
+    assert page["pageInfo"]["hasNextPage"] is True
+
+    res = query(querystr % f', after: "{page["pageInfo"]["endCursor"]}"')
+    page = res.json()["data"]["items"]
+    assert [d["node"]["title"] for d in page["edges"]] == ["Harry's shampoo"]
+    assert page["pageInfo"]["hasNextPage"] is False
+
+
+def test_too_large_pages_are_rejected():
+    res = query("""query {items(first: 1000) {edges {node {title}}}}""")
+    assert res.json()["errors"][0]["message"] == "first must be between 0 and 100"
+
+
+def test_search_items_ranks_matches_and_paginates():
+    querystr = """query {searchItems(query: "hairy OR shampoo", first: 1%s) {
+        edges {node {title}}
+        pageInfo {hasNextPage, endCursor}
+    }}"""
+    res = query(querystr % "")
+    page = res.json()["data"]["searchItems"]
+    assert len(page["edges"]) == 1
+    assert page["pageInfo"]["hasNextPage"] is True
+    titles = [page["edges"][0]["node"]["title"]]
+
+    res = query(querystr % f', after: "{page["pageInfo"]["endCursor"]}"')
+    page = res.json()["data"]["searchItems"]
+    assert page["pageInfo"]["hasNextPage"] is False
+    titles.append(page["edges"][0]["node"]["title"])
+    assert set(titles) == {"Harry's shampoo", "Harry's hairbrush"}
+
+
+def test_items_fields_can_be_selected_with_fragments():
+    res = query(
+        """query {items(first: 2) {edges {node {...itemFields}}}}
+        fragment itemFields on Item {
+            title
+            ... on Item {owner {name, items {description}}}
+        }"""
+    )
+    nodes = [d["node"] for d in res.json()["data"]["items"]["edges"]]
+    assert nodes[0]["title"] == "Susi's apple"
+    assert nodes[0]["owner"]["name"] == "Super Susi"
+    assert len(nodes[0]["owner"]["items"]) == 1
+    assert "description" in nodes[0]["owner"]["items"][0]
+
+
+def test_cached_items_are_invalidated_by_mutations():
+    querystr = """query {items(first: 1) {edges {node {id, title}}}}"""
+    assert query(querystr).json()["data"]["items"]["edges"][0]["node"]["title"] == (
+        "Susi's apple"
+    )
+
+    token = user_login(email="super.susi@gmail.com", password="asdf3")
+    res = query(
+        """mutation {createItem(input: {title: "Susi's pear", postedOn: "2002-01-01"}) {id}}""",
+        jwt=token,
+    )
+    item_id = res.json()["data"]["createItem"]["id"]
+    try:
+        node = query(querystr).json()["data"]["items"]["edges"][0]["node"]
+        assert node["title"] == "Susi's pear"
+    finally:
+        query(f"""mutation {{deleteItem(id: {item_id})}}""", jwt=token)
+    node = query(querystr).json()["data"]["items"]["edges"][0]["node"]
+    assert node["title"] == "Susi's apple"
+
+
+def test_items_can_be_created_updated_and_deleted_in_bulk():
+    token = user_login()
+    res = query(
+        """mutation {createItems(input: [
+            {title: "Harry's comb", postedOn: "2003-01-01"},
+            {title: "Harry's towel", description: "Fluffy", postedOn: "2003-01-02"}
+        ]) {id, title, description, owner {name}}}""",
+        jwt=token,
+    )
+    created = res.json()["data"]["createItems"]
+    assert [d["title"] for d in created] == ["Harry's comb", "Harry's towel"]
+    assert [d["owner"]["name"] for d in created] == ["Active Harry"] * 2
+    ids = [d["id"] for d in created]
+
+    admin_token = user_login(email="super.susi@gmail.com", password="asdf3")
+    try:
+        res = query(
+            """mutation {updateItems(input: [
+                {id: %s, description: "Wooden"},
+                {id: %s, title: "Harry's big towel"}
+            ]) {title, description}}"""
+            % tuple(ids),
+            jwt=token,
+        )
+        assert res.json()["data"]["updateItems"] == [
+            {"title": "Harry's comb", "description": "Wooden"},
+            {"title": "Harry's big towel", "description": "Fluffy"},
+        ]
+
+        # not all items belong to Harry, so nothing is updated
+        res = query(
+            """mutation {updateItems(input: [
+                {id: %s, title: "Stolen"}, {id: 4, title: "Stolen"}
+            ]) {title}}"""
+            % ids[0],
+            jwt=token,
+        )
+        assert "do not belong to you" in res.json()["errors"][0]["message"]
+        res = query("""query {items(first: 2) {edges {node {title}}}}""")
+        titles = [d["node"]["title"] for d in res.json()["data"]["items"]["edges"]]
+        assert titles == ["Harry's big towel", "Harry's comb"]
+    finally:
+        res = query(
+            """mutation {deleteItems(ids: [%s, %s])}""" % tuple(ids), jwt=admin_token
+        )
+    assert sorted(res.json()["data"]["deleteItems"]) == sorted(ids)
@@ -0,0 +1,86 @@
+import re
+import uuid
+import requests
+from tests.conftest import host, query
+from tests.test_items import user_login
+
+
+def metric_value(text: str, name: str, **labels) -> float:
+    for line in text.splitlines():
+        if line.startswith(name + "{") or line.startswith(name + " "):
+            if all(f'{k}="{v}"' in line for k, v in labels.items()):
+                return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_operations_fields_and_statements_are_measured():
+    before = requests.get(host + "/metrics", timeout=1).text
+    # unique filter, so that results are not cached
+    res = query(
+        """query ItemsMetrics {items(filter: {titleLike: "%s"}) {edges {node {title}}}}"""
+        % uuid.uuid4().hex
+    )
+    assert res.status_code == 200
+    after = requests.get(host + "/metrics", timeout=1).text
+
+    labels = {"operation_type": "query", "operation_name": "items"}
+    name = "graphql_operation_duration_seconds_count"
+    assert metric_value(after, name, **labels) == metric_value(before, name, **labels) + 1
+
+    name = "graphql_field_duration_seconds_count"
+    labels = {"parent_type": "Query", "field_name": "items"}
+    assert metric_value(after, name, **labels) > metric_value(before, name, **labels)
+
+    name = "graphql_operation_db_statements_sum"
+    labels = {"operation_type": "query", "operation_name": "items"}
+    assert metric_value(after, name, **labels) > metric_value(before, name, **labels)
+    assert re.search(r"^db_statement_duration_seconds_count", after, re.M)
+
+
+def test_errors_are_counted():
+    before = requests.get(host + "/metrics", timeout=1).text
+    query("""query ErrorMetrics {me {name}}""")
+    after = requests.get(host + "/metrics", timeout=1).text
+    name = "graphql_errors_total"
+    labels = {"operation_type": "query", "operation_name": "me"}
+    assert metric_value(after, name, **labels) == metric_value(before, name, **labels) + 1
+
+
+def test_operation_names_chosen_by_clients_are_not_labels():
+    name = uuid.uuid4().hex
+    query("""query Op%s {me {name}}""" % name)
+    query("""query Op%s {a: me {name} b: me {name}}""" % name)
+    text = requests.get(host + "/metrics", timeout=1).text
+    assert name not in text
+    labels = {"operation_type": "query", "operation_name": "other"}
+    assert metric_value(text, "graphql_operation_duration_seconds_count", **labels) > 0
+
+
+def test_cache_hits_misses_and_sizes_are_measured():
+    querystr = """query {items(filter: {titleLike: "%s"}) {edges {node {title}}}}"""
+    querystr = querystr % uuid.uuid4().hex
+    before = requests.get(host + "/metrics", timeout=1).text
+    query(querystr)
+    query(querystr)
+    after = requests.get(host + "/metrics", timeout=1).text
+
+    name = "cache_requests_total"
+    for cache in ("items", "documents"):
+        for result in ("hit", "miss"):
+            labels = {"cache": cache, "result": result}
+            assert metric_value(after, name, **labels) > metric_value(before, name, **labels)
+        assert metric_value(after, "cache_entries", cache=cache) > 0
+
+
+def test_user_cache_hits_misses_and_size_are_measured():
+    token = user_login()
+    before = requests.get(host + "/metrics", timeout=1).text
+    query("""query {me {name}}""", jwt=token)
+    query("""query {me {name}}""", jwt=token)
+    after = requests.get(host + "/metrics", timeout=1).text
+
+    labels = {"cache": "users", "result": "hit"}
+    name = "cache_requests_total"
+    assert metric_value(after, name, **labels) > metric_value(before, name, **labels)
+    assert metric_value(after, name, cache="users", result="miss") > 0
+    assert metric_value(after, "cache_entries", cache="users") > 0
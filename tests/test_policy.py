@@ -0,0 +1,45 @@
+import datetime as dt
+from tests.conftest import query
+from tests.test_items import user_login
+from app.api.policy import ADMIN, OWNER, SUPERUSER, Permissions
+from app.auth import Auth
+import app.db.models as models
+
+
+def test_permissions_are_computed_from_auth():
+    harry = models.User(id=1, isSuperuser=False)
+    susi = models.User(id=3, isSuperuser=True)
+    item = models.Item(id=1, ownerId=1, postedOn=dt.date(2000, 1, 1))
+
+    anonymous = Permissions.from_auth(Auth(user=None))
+    assert not any(anonymous.allows(d, item) for d in (SUPERUSER, ADMIN, OWNER))
+
+    user = Permissions.from_auth(Auth(user=harry))
+    assert not user.allows(SUPERUSER) and not user.allows(ADMIN)
+    assert user.allows(OWNER, item) and user.allows(OWNER, harry)
+    assert not user.allows(OWNER, susi)
+
+    superuser = Permissions.from_auth(Auth(user=susi))
+    assert superuser.allows(SUPERUSER) and superuser.allows(ADMIN)
+    assert superuser.allows(OWNER, item)
+
+
+def test_superuser_field_is_null_without_role():
+    res = query("""query {me {isSuperuser}}""", jwt=user_login())
+    assert res.json()["data"]["me"] == {"isSuperuser": None}
+
+    token = user_login(email="super.susi@gmail.com", password="asdf3")
+    res = query("""query {me {isSuperuser}}""", jwt=token)
+    assert res.json()["data"]["me"] == {"isSuperuser": True}
+
+
+def test_admin_mutations_are_rejected_before_they_run():
+    for token in (None, user_login()):
+        res = query("""mutation {deleteItem(id: 1)}""", jwt=token)
+        assert res.json()["errors"][0]["message"] == "Not logged in as admin"
+        res = query("""mutation {deleteItems(ids: [1, 2])}""", jwt=token)
+        assert res.json()["errors"][0]["message"] == "Not logged in as admin"
+
+    res = query("""query {items(first: 100) {edges {node {id}}}}""")
+    ids = {d["node"]["id"] for d in res.json()["data"]["items"]["edges"]}
+    assert {"1", "2"} <= ids
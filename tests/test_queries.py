@@ -0,0 +1,131 @@
+import hashlib
+import uuid
+import requests
+from tests.conftest import host, query
+from app.config import COST_USER_ITEMS
+
+
+def post(data: dict) -> dict:
+    return requests.post(host + "/", json=data, timeout=1).json()
+
+
+def test_invalid_queries_are_rejected_every_time():
+    for _ in range(2):
+        res = query("""query {items {edges {node {titel}}}}""")
+        assert res.status_code == 400
+        assert "titel" in res.json()["errors"][0]["message"]
+
+
+def test_persisted_query_is_registered_with_hash_and_query_once():
+    # unique query string, the app might have seen this test before
+    querystr = "query Q%s {items(first: 1) {edges {node {title}}}}" % uuid.uuid4().hex
+    sha = hashlib.sha256(querystr.encode()).hexdigest()
+    apq = {"persistedQuery": {"version": 1, "sha256Hash": sha}}
+
+    res = post({"extensions": apq})
+    assert res["errors"][0]["message"] == "PersistedQueryNotFound"
+    assert res["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+
+    res = post({"query": querystr, "extensions": apq})
+    assert len(res["data"]["items"]["edges"]) == 1
+
+    res = post({"extensions": apq})
+    assert len(res["data"]["items"]["edges"]) == 1
+
+
+def test_persisted_query_hash_must_match_query():
+    apq = {"persistedQuery": {"version": 1, "sha256Hash": "abc"}}
+    res = post({"query": "query {me {name}}", "extensions": apq})
+    assert res["errors"][0]["message"] == "provided sha does not match query"
+
+
+def test_query_cost_is_returned_in_extensions():
+    res = query("""query {items(first: 5) {edges {node {title, owner {name}}}}}""")
+    cost = res.json()["extensions"]["cost"]
+    assert cost["requested"] == 5 * (1 + 1 + 1 + 1)
+    assert cost["depth"] == 5
+
+
+def test_unpaginated_user_items_count_their_expected_size():
+    res = query("""query {items(first: 1) {edges {node {owner {items {title}}}}}}""")
+    cost = res.json()["extensions"]["cost"]
+    assert cost["requested"] == 1 + 1 + 1 + 1 + COST_USER_ITEMS
+
+
+def test_too_costly_queries_are_rejected():
+    res = query(
+        """query {items(first: 100) {edges {node {owner {items {owner {items {title}}}}}}}}"""
+    )
+    data = res.json()
+    assert "data" not in data
+    assert data["errors"][0]["extensions"]["code"] == "QUERY_TOO_COSTLY"
+
+
+def test_too_deep_queries_are_rejected():
+    nested = "title"
+    for _ in range(6):
+        nested = f"owner {{items {{{nested}}}}}"
+    res = query("query {items(first: 1) {edges {node {%s}}}}" % nested)
+    data = res.json()
+    assert "data" not in data
+    assert data["errors"][0]["extensions"]["code"] == "QUERY_TOO_DEEP"
+
+
+def test_batched_operations_share_one_request():
+    token = requests.post(
+        host + "/",
+        json={
+            "query": """mutation {
+            login(input: {email: "active.harry@gmail.com", password: "asdf1"}) {token}}"""
+        },
+        timeout=1,
+    ).json()["data"]["login"]["token"]
+    batch = [
+        {"query": "query {me {name}}"},
+        {"query": "query {items(first: 1) {edges {node {title}}}}"},
+        {"query": "query {me {titel}}"},
+        {"query": "query A {me {name}} query B {me {email}}", "operationName": "B"},
+    ]
+    res = requests.post(
+        host + "/", json=batch, headers={"Authorization": f"Bearer {token}"}, timeout=1
+    )
+    assert res.status_code == 200
+    me, items, invalid, email = res.json()
+    assert me["data"] == {"me": {"name": "Active Harry"}}
+    assert len(items["data"]["items"]["edges"]) == 1
+    assert "titel" in invalid["errors"][0]["message"]
+    assert email["data"] == {"me": {"email": "active.harry@gmail.com"}}
+
+
+def test_too_large_or_empty_batches_are_rejected():
+    for batch in ([], [{"query": "query {me {name}}"}] * 1000):
+        res = requests.post(host + "/", json=batch, timeout=1)
+        assert res.status_code == 400
+        assert "batch" in res.text
+
+
+def test_wrongly_typed_variables_are_rejected_before_cost_analysis():
+    querystr = """query ($n: Int) {items(first: $n) {edges {node {owner {name}}}}}"""
+    for n in ("abc", "x" * 100_000, [1], {"a": 1}):
+        res = requests.post(
+            host + "/", json={"query": querystr, "variables": {"n": n}}, timeout=1
+        )
+        assert res.status_code == 400
+        data = res.json()
+        assert "data" not in data
+        assert "$n" in data["errors"][0]["message"]
+
+
+def test_malformed_persisted_queries_are_rejected():
+    sha = hashlib.sha256(b"query {me {name}}").hexdigest()
+    for extensions in (
+        "x",
+        {"persistedQuery": "x"},
+        {"persistedQuery": {"version": 1, "sha256Hash": 1}},
+        {"persistedQuery": {"version": 2, "sha256Hash": sha}},
+        {"persistedQuery": {"sha256Hash": sha}},
+    ):
+        res = requests.post(host + "/", json={"extensions": extensions}, timeout=1)
+        assert res.status_code == 400
+        assert "data" not in res.json()
+        assert res.json()["errors"][0]["message"]
@@ -0,0 +1,68 @@
+import time
+import uuid
+import requests
+from tests.conftest import host
+from app.config import LOGIN_EMAIL_BURST, LOGIN_IP_BURST
+import app.ratelimit as ratelimit
+from app.ratelimit import Limit, TokenBuckets
+
+LOGIN = """mutation {login(input: {email: "%s", password: "wrong"}) {token}}"""
+
+
+def login(email: str, ip: str) -> dict:
+    headers = {"X-Forwarded-For": ip, "X-SQL-Trace": "1"}
+    res = requests.post(host + "/", json={"query": LOGIN % email}, headers=headers, timeout=1)
+    return res.json()
+
+
+def random_ip() -> str:
+    return "10.%s.%s.%s" % tuple(uuid.uuid4().bytes[:3])
+
+
+def test_buckets_are_shared_through_file_and_refilled(tmp_path):
+    path = str(tmp_path / "buckets")
+    limit = Limit(burst=2, per_minute=0)
+    worker_a, worker_b = TokenBuckets(path, slots=16), TokenBuckets(path, slots=16)
+    assert worker_a.take({"a": limit, "b": limit}) is None
+    assert worker_b.take({"a": limit}) is None
+    assert worker_a.take({"b": limit, "a": limit}) == "a"
+    assert worker_b.take({"b": limit}) is None  # b was not taken from when a was empty
+    assert worker_b.take({"b": limit}) == "b"
+
+    worker_a.give({"a": limit})
+    assert worker_b.take({"a": limit}) is None
+    fast = Limit(burst=1, per_minute=6000)
+    assert worker_a.take({"c": fast}) is None
+    time.sleep(0.02)
+    assert worker_b.take({"c": fast}) is None
+
+
+def test_buckets_replace_least_recently_updated_when_full(tmp_path):
+    buckets = TokenBuckets(str(tmp_path / "buckets"), slots=4)
+    limit = Limit(burst=1, per_minute=0)
+    for i in range(20):
+        assert buckets.take({str(i): limit}) is None
+    assert buckets.take({"19": limit}) == "19"
+
+
+def test_login_attempts_per_email_are_limited_before_db_lookup():
+    email = f"{uuid.uuid4()}@example.com"
+    for _ in range(int(LOGIN_EMAIL_BURST)):
+        res = login(email, ip=random_ip())
+        assert res["errors"][0]["message"] == "Email or password wrong"
+    res = login(email.upper(), ip=random_ip())
+    assert res["errors"][0]["message"] == "Too many login attempts, try again later"
+    assert res["extensions"]["sqlTrace"]["count"] == 0
+
+
+def test_login_attempts_per_ip_are_limited(tmp_path, monkeypatch):
+    # own buckets, so that neither earlier tests nor this one change the app's limits
+    monkeypatch.setattr(ratelimit, "login_buckets", TokenBuckets(str(tmp_path / "limits"), 256))
+    ip = random_ip()
+    limited = [
+        ratelimit.take_login_attempt(f"{uuid.uuid4()}@example.com", ip=ip)
+        for _ in range(int(LOGIN_IP_BURST) + 5)
+    ]
+    assert limited[: int(LOGIN_IP_BURST)] == [None] * int(LOGIN_IP_BURST)
+    assert "ip" in limited
+    assert ratelimit.take_login_attempt("someone@example.com", ip=random_ip()) is None
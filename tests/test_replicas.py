@@ -0,0 +1,39 @@
+import time
+import uuid
+import pytest  # type: ignore
+import requests
+from tests.conftest import host
+
+# unique filter, so that results are not cached
+ITEMS = """{items(filter: {titleLike: "%s"}) {edges {node {title}}}}"""
+LOGIN = """mutation {login(input: {email: "active.harry@gmail.com", password: "asdf1"}) {token}}"""
+
+
+def replica_reads() -> int:
+    replicas = requests.get(host + "/debug/pool", timeout=1).json()["replicas"]
+    if not replicas:
+        pytest.skip("app has no SQLALCHEMY_REPLICA_URIS")
+    return sum(d["reads"] for d in replicas)
+
+
+def wait_for_fresh_replica():
+    for _ in range(50):
+        replicas = requests.get(host + "/debug/pool", timeout=1).json()["replicas"]
+        if any(d["fresh"] for d in replicas):
+            return
+        time.sleep(0.1)
+    pytest.fail("no replica became fresh")
+
+
+def test_queries_read_from_replicas_until_client_mutated():
+    before = replica_reads()
+    wait_for_fresh_replica()
+    session = requests.Session()
+    session.post(host + "/", json={"query": ITEMS % uuid.uuid4().hex}, timeout=1)
+    assert replica_reads() == before + 1
+
+    res = session.post(host + "/", json={"query": LOGIN}, timeout=1)
+    assert res.json()["data"]["login"]["token"]
+    assert "read_primary" in session.cookies
+    session.post(host + "/", json={"query": ITEMS % uuid.uuid4().hex}, timeout=1)
+    assert replica_reads() == before + 1
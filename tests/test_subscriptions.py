@@ -0,0 +1,110 @@
+import asyncio
+import json
+import uuid
+import pytest  # type: ignore
+import websockets  # type: ignore
+from app.api.broadcast import Broadcaster, LocalBroadcastBackend
+from app.api.subscriptions import ilike
+from tests.conftest import host, query
+from tests.test_items import user_login
+
+SUBSCRIPTION = """subscription {
+  itemChanged(filter: {titleLike: "%s"}) {action id item {title owner {name}}}
+}"""
+
+
+async def subscribe(ws, id: str, querystr: str):
+    await ws.send(json.dumps({"type": "start", "id": id, "payload": {"query": querystr}}))
+
+
+async def receive(ws) -> dict:
+    while True:
+        message = json.loads(await asyncio.wait_for(ws.recv(), timeout=5))
+        if message["type"] != "ka":
+            return message
+
+
+async def item_changes():
+    token = user_login()
+    admin_token = user_login(email="super.susi@gmail.com", password="asdf3")
+    marker = uuid.uuid4().hex
+    url = host.replace("http", "ws", 1) + "/"
+    async with websockets.connect(url, subprotocols=["graphql-ws"]) as ws:
+        await ws.send(json.dumps({"type": "connection_init"}))
+        assert (await receive(ws))["type"] == "connection_ack"
+        await subscribe(ws, "1", SUBSCRIPTION % marker)
+        await asyncio.sleep(0.5)
+
+        query(
+            """mutation {createItem(input: {title: "not matching", postedOn: "2020-01-01"}) {id}}""",
+            jwt=token,
+        )
+        res = query(
+            """mutation {createItem(input: {title: "new %s", postedOn: "2020-01-01"}) {id}}"""
+            % marker,
+            jwt=token,
+        )
+        id = res.json()["data"]["createItem"]["id"]
+        created = await receive(ws)
+        query(
+            """mutation {updateItem(id: %s, input: {title: "updated %s"}) {id}}""" % (id, marker),
+            jwt=token,
+        )
+        updated = await receive(ws)
+        query("""mutation {deleteItem(id: %s)}""" % id, jwt=admin_token)
+        deleted = await receive(ws)
+        return id, created, updated, deleted
+
+
+def test_item_changes_are_pushed_to_matching_subscriptions():
+    id, created, updated, deleted = asyncio.get_event_loop().run_until_complete(
+        item_changes()
+    )
+    assert created["type"] == "data"
+    change = created["payload"]["data"]["itemChanged"]
+    assert change["action"] == "CREATED" and change["id"] == id
+    assert change["item"]["title"].startswith("new ")
+    assert change["item"]["owner"] == {"name": "Active Harry"}
+    change = updated["payload"]["data"]["itemChanged"]
+    assert change["action"] == "UPDATED"
+    assert change["item"]["title"].startswith("updated ")
+    change = deleted["payload"]["data"]["itemChanged"]
+    assert change == {"action": "DELETED", "id": id, "item": None}
+
+
+def test_too_deep_subscriptions_are_rejected():
+    async def deep_subscription() -> dict:
+        selection = "title"
+        for _ in range(6):
+            selection = "owner {items {%s}}" % selection
+        url = host.replace("http", "ws", 1) + "/"
+        async with websockets.connect(url, subprotocols=["graphql-ws"]) as ws:
+            await ws.send(json.dumps({"type": "connection_init"}))
+            assert (await receive(ws))["type"] == "connection_ack"
+            await subscribe(ws, "1", "subscription {itemChanged {item {%s}}}" % selection)
+            return await receive(ws)
+
+    message = asyncio.get_event_loop().run_until_complete(deep_subscription())
+    assert message["type"] == "error"
+    assert message["payload"]["extensions"]["code"] == "QUERY_TOO_DEEP"
+
+
+def test_slow_subscribers_fail_instead_of_buffering():
+    async def overflow():
+        broadcaster = Broadcaster(backend=LocalBroadcastBackend(), queue_size=2)
+        async with broadcaster.subscribe("test") as subscriber:
+            await broadcaster.publish("test", [{"n": 1}, {"n": 2}])
+            assert await subscriber.get() == {"n": 1}
+            await broadcaster.publish("test", [{"n": 3}, {"n": 4}])
+            with pytest.raises(ValueError, match="fell behind"):
+                await subscriber.get()
+
+    asyncio.get_event_loop().run_until_complete(overflow())
+
+
+def test_filters_are_matched_like_ilike():
+    assert ilike("Harry's Shampoo", "sham")
+    assert ilike("Harry's shampoo", "h_rry%poo")
+    assert not ilike("Harry's shampoo", "50\\%")
+    assert ilike("50% off", "50\\%")
+    assert not ilike(None, "")
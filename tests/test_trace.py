@@ -0,0 +1,65 @@
+import pytest  # type: ignore
+from sqlalchemy import text  # type: ignore
+from sqlalchemy.exc import ProgrammingError  # type: ignore
+from tests.conftest import query
+from app.db.base import engine
+import app.db.events  # pylint: disable=unused-import
+from tests.test_items import user_login
+import app.api.trace as trace
+from app.api.trace import SQLTrace
+
+
+def test_my_items_with_owners_need_constant_number_of_statements(assert_max_queries):
+    token = user_login()
+    assert_max_queries(
+        """query {me {items {edges {node {title, owner {name, items {title}}}}}}}""",
+        max_queries=4,
+        jwt=token,
+    )
+
+
+def test_trace_shows_statements_with_resolver_paths():
+    token = user_login()
+    res = query("""query {me {items {edges {node {title}}}}}""", jwt=token, trace=True)
+    trace = res.json()["extensions"]["sqlTrace"]
+    paths = [d["path"] for d in trace["statements"]]
+    assert "me.items" in paths
+    assert trace["count"] == len(trace["statements"])
+
+
+def test_trace_is_only_added_on_request():
+    res = query("""query {items(first: 1) {edges {node {title}}}}""")
+    assert "sqlTrace" not in res.json()["extensions"]
+
+
+def test_repeated_statement_shapes_are_detected():
+    trace = SQLTrace(max_repeats=2)
+    for i in range(3):
+        trace.add("SELECT * FROM users WHERE id = %(id_1)s", seconds=0.001, path=f"a.{i}")
+    trace.add("SELECT * FROM items WHERE id IN (%(id_1_1)s)", seconds=0.001, path="b")
+    trace.add(
+        "SELECT * FROM items WHERE id IN (%(id_1_1)s, %(id_1_2)s)", seconds=0.001, path="b"
+    )
+    assert trace.format()["repeated"] == [
+        {"sql": "SELECT * FROM users WHERE id = %(id_1)s", "count": 3}
+    ]
+    assert trace.shapes["SELECT * FROM items WHERE id IN (...)"] == 2
+
+
+def test_failed_statements_dont_leave_start_times():
+    with engine.connect() as conn:
+        with pytest.raises(ProgrammingError):
+            conn.execute(text("SELECT * FROM no_such_table"))
+        assert conn.info["query_start"] == []
+
+
+class _Request:
+    headers = {trace.TRACE_HEADER: "1"}
+
+
+def test_trace_header_is_ignored_without_debug_endpoints(monkeypatch):
+    monkeypatch.setattr(trace, "SQL_TRACE", False)
+    monkeypatch.setattr(trace, "DEBUG_ENDPOINTS", False)
+    assert not trace.trace_requested(_Request())
+    monkeypatch.setattr(trace, "DEBUG_ENDPOINTS", True)
+    assert trace.trace_requested(_Request())